@@ -10,7 +10,7 @@ __copyright__ = '2011-2024 - GlobaLeaks'
 __version__ = '5.0.17'
 __license__ = 'AGPL-3.0'
 
-DATABASE_VERSION = 68
+DATABASE_VERSION = 70
 FIRST_DATABASE_VERSION_SUPPORTED = 52
 
 # Add new languages as they are supported here! To do this retrieve the name of
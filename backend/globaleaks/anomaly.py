@@ -206,6 +206,7 @@ class Alarm(object):
 
             # Must invalidate the cache here becuase accept_subs served in /public has changed
             Cache.invalidate()
+            State.broadcast('accept_submissions', value=accept_submissions)
 
 
 @inlineCallbacks
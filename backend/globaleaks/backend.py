@@ -8,22 +8,18 @@ from twisted.application import service
 from twisted.internet import reactor, defer
 from twisted.python.log import ILogObserver
 from twisted.python.log import addObserver
-from twisted.web import resource, server
 
 from globaleaks.jobs import job, jobs_list
 from globaleaks.services import tor
 
 from globaleaks.db import create_db, initialize_db, update_db, \
     sync_refresh_tenant_cache, sync_initialize_snimap
-from globaleaks.rest.api import APIResourceWrapper
+from globaleaks.rest.site import get_api_factory
 from globaleaks.settings import Settings
 from globaleaks.state import State
-from globaleaks.utils.log import log, openLogFile, logFormatter, LogObserver
+from globaleaks.utils.log import log, openLogFile, LogObserver
 from globaleaks.utils.sock import listen_tcp_on_sock, listen_tls_on_sock
-
-
-# Set Gzip Encoder compression level to 1 prioritizing speed over compression
-server.GzipEncoderFactory.compressLevel = 1
+from globaleaks.workers import WorkerPool
 
 
 def fail_startup(excep):
@@ -34,25 +30,12 @@ def fail_startup(excep):
         reactor.stop()
 
 
-class Request(server.Request):
-    log_ip_and_ua = False
-
-
-class Site(server.Site):
-    requestFactory = Request
-
-    def _openLogFile(self, path):
-        return openLogFile(path, Settings.log_file_size, Settings.num_log_files)
-
-
 class Service(service.Service):
     _shutdown = False
 
     def __init__(self):
         self.state = State
-        self.arw = resource.EncodingResourceWrapper(APIResourceWrapper(), [server.GzipEncoderFactory()])
-        self.api_factory = Site(self.arw, logPath=Settings.accesslogfile, logFormatter=logFormatter)
-        self.api_factory.displayTracebacks = False
+        self.api_factory = get_api_factory()
 
     def start_jobs(self):
         for j in jobs_list:
@@ -100,6 +83,15 @@ class Service(service.Service):
             sync_refresh_tenant_cache()
             sync_initialize_snimap()
             self.state.orm_tp.start()
+            self.state.kdf_tp.start()
+            self.state.file_tp.start()
+            self.state.delivery_tp.start()
+
+            # The main process is the only one running the scheduled jobs
+            if self.state.workers_socks:
+                self.state.workers = WorkerPool(self.state.workers_socks)
+                self.state.workers.start()
+
             self.start_jobs()
             self.state.print_listening_interfaces()
 
@@ -111,7 +103,13 @@ class Service(service.Service):
 
     @defer.inlineCallbacks
     def stopService(self):
+        if self.state.workers is not None:
+            yield self.state.workers.stop()
+
         yield self.state.orm_tp.stop()
+        yield self.state.kdf_tp.stop()
+        yield self.state.file_tp.stop()
+        yield self.state.delivery_tp.stop()
         yield self.stop_jobs()
 
 
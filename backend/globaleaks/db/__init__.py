@@ -157,6 +157,21 @@ def sync_initialize_snimap(session):
         State.snimap.load(cfg['tid'], cfg)
 
 
+@transact_sync
+def sync_refresh_snimap(session, tid=1):
+    """
+    Transaction for reloading the TLS configuration of a tenant or of all
+    the tenants if the root tenant is specified
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    """
+    for cfg in db_load_tls_configs(session):
+        if tid == 1 or cfg['tid'] == tid:
+            State.snimap.unload(cfg['tid'])
+            State.snimap.load(cfg['tid'], cfg)
+
+
 def db_refresh_tenant_cache(session, to_refresh=None):
     active_tids = set([tid[0] for tid in session.query(models.Tenant.id).filter(models.Tenant.active.is_(True))])
 
@@ -0,0 +1,53 @@
+# -*- coding: UTF-8
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import Model
+from globaleaks.models.enums import EnumVisibility
+from globaleaks.models.properties import *
+from globaleaks.utils.utility import datetime_now, datetime_null
+
+
+class InternalFile_v_68(Model):
+    __tablename__ = 'internalfile'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    internaltip_id = Column(UnicodeText(36), nullable=False, index=True)
+    name = Column(UnicodeText, nullable=False)
+    content_type = Column(JSON, default='', nullable=False)
+    size = Column(JSON, default='', nullable=False)
+    new = Column(Boolean, default=True, nullable=False)
+    reference_id = Column(UnicodeText(36), default='', nullable=False)
+
+
+class ReceiverFile_v_68(Model):
+    __tablename__ = 'receiverfile'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    internaltip_id = Column(UnicodeText(36), nullable=False, index=True)
+    author_id = Column(UnicodeText(36))
+    name = Column(UnicodeText, nullable=False)
+    size = Column(Integer, nullable=False)
+    content_type = Column(UnicodeText, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    access_date = Column(DateTime, default=datetime_null, nullable=False)
+    description = Column(UnicodeText, default="", nullable=False)
+    visibility = Column(Enum(EnumVisibility), default='public', nullable=False)
+    new = Column(Boolean, default=True, nullable=False)
+
+
+class MigrationScript(MigrationBase):
+    def migrate_file(self, model_name):
+        # Files still to be delivered are retried by the delivery job
+        for old_obj in self.session_old.query(self.model_from[model_name]):
+            new_obj = self.model_to[model_name]()
+            for key in new_obj.__mapper__.column_attrs.keys():
+                if key in old_obj.__mapper__.column_attrs.keys():
+                    setattr(new_obj, key, getattr(old_obj, key))
+
+            new_obj.delivery_state = 'pending' if old_obj.new else 'delivered'
+
+            self.session_new.add(new_obj)
+
+    def migrate_InternalFile(self):
+        self.migrate_file('InternalFile')
+
+    def migrate_ReceiverFile(self):
+        self.migrate_file('ReceiverFile')
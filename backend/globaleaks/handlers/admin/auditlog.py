@@ -113,15 +113,7 @@ class JobsTiming(BaseHandler):
     check_roles = 'admin'
 
     def get(self):
-        response = []
-
-        for job in State.jobs:
-            response.append({
-                'name': job.name,
-                'timings': job.last_executions
-            })
-
-        return response
+        return State.get_jobs_status()
 
 
 class AuditLog(BaseHandler):
@@ -222,6 +222,7 @@ def order_elements(session, tid, ids, *args, **kwargs):
 class ContextsCollection(OperationHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Context'}
 
     def get(self):
         """
@@ -250,6 +251,7 @@ class ContextsCollection(OperationHandler):
 class ContextInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Context'}
 
     def put(self, context_id):
         """
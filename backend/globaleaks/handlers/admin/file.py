@@ -94,6 +94,7 @@ def delete_file(session, tid, id_or_name):
 class FileInstance(BaseHandler):
     check_roles = 'user'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'File'}
     upload_handler = True
 
     allowed_mimetypes = [
@@ -11,7 +11,7 @@ from globaleaks.models.config import ConfigFactory
 from globaleaks.orm import transact, tw
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
-from globaleaks.state import State
+from globaleaks.state import State, TLS_CONFIG_DEPENDENCY
 from globaleaks.utils import letsencrypt, tls
 
 
@@ -50,6 +50,16 @@ def db_load_tls_configs(session):
     return [db_load_tls_config(session, tid[0]) for tid in session.query(models.Tenant.id).filter(models.Tenant.active.is_(True))]
 
 
+def invalidate_tls_config(tid):
+    """
+    Reload the TLS configuration of a tenant in all the processes serving
+    the site
+
+    :param tid: A tenant ID
+    """
+    State.invalidate_cache(tid, {'Config', TLS_CONFIG_DEPENDENCY})
+
+
 def db_generate_acme_key(session, tid):
     priv_fact = ConfigFactory(session, tid)
 
@@ -304,8 +314,11 @@ class FileHandler(BaseHandler):
 
         return self.mapped_resources[name]
 
+    @inlineCallbacks
     def delete(self, name):
-        return self.get_res_or_raise(name).delete_file(self.request.tid)
+        yield self.get_res_or_raise(name).delete_file(self.request.tid)
+
+        invalidate_tls_config(self.request.tid)
 
     @inlineCallbacks
     def post(self, name):
@@ -324,12 +337,16 @@ class FileHandler(BaseHandler):
         if not ok:
             raise errors.InputValidationError
 
+        invalidate_tls_config(self.request.tid)
+
     @inlineCallbacks
     def put(self, name):
         file_res_cls = self.get_res_or_raise(name)
 
         yield file_res_cls.perform_action(self.request.tid)
 
+        invalidate_tls_config(self.request.tid)
+
     def get(self, name):
         return self.get_res_or_raise(name).get_file(self.request.tid)
 
@@ -341,14 +358,23 @@ class ConfigHandler(BaseHandler):
     def get(self):
         return tw(db_serialize_https_config_summary, self.request.tid)
 
+    @inlineCallbacks
     def post(self):
-        tw(db_try_to_enable_https, self.request.tid)
+        yield tw(db_try_to_enable_https, self.request.tid)
+
+        invalidate_tls_config(self.request.tid)
 
+    @inlineCallbacks
     def put(self):
-        tw(db_disable_https, self.request.tid)
+        yield tw(db_disable_https, self.request.tid)
+
+        invalidate_tls_config(self.request.tid)
 
+    @inlineCallbacks
     def delete(self):
-        tw(db_reset_https_config, self.request.tid)
+        yield tw(db_reset_https_config, self.request.tid)
+
+        invalidate_tls_config(self.request.tid)
 
 
 class CSRHandler(BaseHandler):
@@ -389,8 +415,11 @@ class AcmeHandler(BaseHandler):
     check_roles = 'admin'
     root_tenant_or_management_only = True
 
+    @inlineCallbacks
     def post(self):
-        return tw(db_acme_cert_request, self.request.tid)
+        yield tw(db_acme_cert_request, self.request.tid)
+
+        invalidate_tls_config(self.request.tid)
 
 
 class AcmeChallengeHandler(BaseHandler):
@@ -37,6 +37,7 @@ def update(session, tid, lang, request):
 class AdminL10NHandler(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'CustomTexts'}
 
     def get(self, lang):
         return get(self.request.tid, lang)
@@ -38,6 +38,7 @@ class NotificationInstance(BaseHandler):
     """
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Config'}
 
     def get(self):
         return tw(db_get_notification, self.request.tid, self.request.language)
@@ -14,6 +14,7 @@ from globaleaks.models import Config, InternalTip, User
 from globaleaks.models.config import db_set_config_variable, ConfigFactory, ConfigL10NFactory
 from globaleaks.orm import db_del, db_get, db_log, transact, tw
 from globaleaks.rest import errors
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
 from globaleaks.transactions import db_get_user
 from globaleaks.utils.crypto import Base64Encoder, GCE
@@ -157,6 +158,7 @@ def enable_user_permission_file_upload(session, tid, user_session):
     :param user_session: The current user session
     """
     user_session.permissions['can_upload_files'] = True
+    Sessions.save(user_session)
 
 
 @transact
@@ -169,6 +171,7 @@ def disable_user_permission_file_upload(session, tid, user_session):
     :param user_session: The current user session
     """
     user_session.permissions['can_upload_files'] = False
+    Sessions.save(user_session)
 
 
 def db_reset_smtp_settings(session, tid):
@@ -176,6 +176,7 @@ def duplicate_questionnaire(session, tid, user_session, questionnaire_id, new_na
 class QuestionnairesCollection(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Questionnaire', 'Step', 'Field'}
 
     def get(self):
         """
@@ -202,6 +203,7 @@ class QuestionnairesCollection(BaseHandler):
 class QuestionnaireInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Questionnaire', 'Step', 'Field'}
 
     def get(self, questionnaire_id):
         """
@@ -235,6 +237,7 @@ class QuestionnaireInstance(BaseHandler):
 class QuestionnareDuplication(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Questionnaire', 'Step', 'Field'}
 
     def post(self):
         """
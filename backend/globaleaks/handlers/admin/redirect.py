@@ -55,6 +55,7 @@ class RedirectCollection(BaseHandler):
     check_roles = 'admin'
     root_tenant_or_management_only = True
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Redirect'}
 
     def get(self):
         """
@@ -80,6 +81,7 @@ class RedirectInstance(BaseHandler):
     check_roles = 'admin'
     root_tenant_or_management_only = True
     invalidate_cache = True
+    invalidate_cache_dependencies = {'Redirect'}
 
     @inlineCallbacks
     def delete(self, redirect_id):
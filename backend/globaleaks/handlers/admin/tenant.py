@@ -1,4 +1,6 @@
 # -*- coding: UTF-8
+from twisted.internet.defer import inlineCallbacks
+
 from globaleaks import models
 from globaleaks.db.appdata import load_appdata, db_load_defaults
 from globaleaks.handlers.base import BaseHandler
@@ -8,6 +10,7 @@ from globaleaks.models.config import db_get_configs, \
     db_get_config_variable, db_set_config_variable
 from globaleaks.orm import db_del, db_get, transact, tw
 from globaleaks.rest import errors, requests
+from globaleaks.sessions import Sessions
 from globaleaks.utils.tls import gen_selfsigned_certificate
 
 
@@ -164,8 +167,13 @@ class TenantInstance(BaseHandler):
 
         return update(int(tid), request)
 
+    @inlineCallbacks
     def delete(self, tid):
         """
         Delete the specified tenant.
         """
-        return tw(db_del, models.Tenant, models.Tenant.id == int(tid))
+        tid = int(tid)
+
+        yield tw(db_del, models.Tenant, models.Tenant.id == tid)
+
+        Sessions.revoke_tenant(tid)
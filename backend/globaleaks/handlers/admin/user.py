@@ -8,6 +8,7 @@ from globaleaks.handlers.user import parse_pgp_options, \
 from globaleaks.models import fill_localized_keys
 from globaleaks.orm import db_del, db_get, db_log, transact, tw
 from globaleaks.rest import errors, requests
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
 from globaleaks.transactions import db_get_user
 from globaleaks.utils.crypto import GCE, Base64Encoder, generateRandomPassword
@@ -173,6 +174,7 @@ def db_get_users(session, tid, role=None, language=None):
 class UsersCollection(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'User'}
 
     def get(self):
         """
@@ -196,6 +198,7 @@ class UsersCollection(BaseHandler):
 class UserInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'User'}
 
     def put(self, user_id):
         """
@@ -210,8 +213,11 @@ class UserInstance(BaseHandler):
                   request,
                   self.request.language)
 
+    @inlineCallbacks
     def delete(self, user_id):
         """
         Delete the specified user.
         """
-        return tw(db_delete_user, self.request.tid, self.session, user_id)
+        yield tw(db_delete_user, self.request.tid, self.session, user_id)
+
+        Sessions.revoke(self.request.tid, user_id)
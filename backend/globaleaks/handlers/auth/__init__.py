@@ -13,14 +13,13 @@ from globaleaks.models import InternalTip, User
 from globaleaks.orm import db_log, transact, tw
 from globaleaks.rest import errors, requests
 from globaleaks.sessions import initialize_submission_session, Sessions
-from globaleaks.settings import Settings
 from globaleaks.state import State
-from globaleaks.utils.crypto import Base64Encoder, GCE
+from globaleaks.utils.crypto import Base64Encoder, GCE, defer_kdf
 from globaleaks.utils.utility import datetime_now, deferred_sleep, uuid4
 
 
 def db_login_failure(session, tid, whistleblower=False):
-    Settings.failed_login_attempts[tid] = Settings.failed_login_attempts.get(tid, 0) + 1
+    State.failed_login_attempts.increment(tid)
 
     db_log(session, tid=tid, type='whistleblower_login_failure' if whistleblower else 'login_failure')
 
@@ -43,7 +42,7 @@ def login_delay(tid):
     | x > 42          | 42             |
      ----------------------------------
     """
-    failed_attempts = Settings.failed_login_attempts.get(tid, 0)
+    failed_attempts = State.failed_login_attempts.count(tid)
 
     if failed_attempts < 5:
         return
@@ -56,32 +55,47 @@ def login_delay(tid):
 
 
 @transact
-def login_whistleblower(session, tid, receipt, client_using_tor, operator_id=None):
+def db_login_whistleblower(session, tid, receipt_hash, client_using_tor, operator_id=None, legacy_receipt_hash=None):
     """
     Login transaction for whistleblowers' access
 
     :param session: An ORM session
     :param tid: A tenant ID
-    :param receipt: A provided receipt
-    :return: Returns a user session in case of success
+    :param receipt_hash: The hash of the provided receipt
+    :param client_using_tor: A boolean signaling Tor usage
+    :param operator_id: The ID of the operator acting on behalf of the whistleblower
+    :param legacy_receipt_hash: The hash of the provided receipt in the legacy scheme used to lookup the tips not yet upgraded
+    :return: Returns the tip data required to setup the whistleblower session or None if no tip matches the current scheme while some tips still use the legacy one
     """
-    hash = GCE.hash_password(receipt, State.tenants[tid].cache.receipt_salt)
+    legacy = legacy_receipt_hash is not None
 
-    itip = session.query(InternalTip) \
-                  .filter(InternalTip.tid == tid,
-                          InternalTip.receipt_hash == hash).one_or_none()
+    if legacy:
+        itip = session.query(InternalTip) \
+                      .filter(InternalTip.tid == tid,
+                              InternalTip.receipt_hash == legacy_receipt_hash,
+                              InternalTip.legacy_receipt.is_(True)).one_or_none()
+    else:
+        itip = session.query(InternalTip) \
+                      .filter(InternalTip.tid == tid,
+                              InternalTip.receipt_hash == receipt_hash).one_or_none()
 
     if itip is None:
+        if not legacy and session.query(InternalTip.id) \
+                                 .filter(InternalTip.tid == tid,
+                                         InternalTip.legacy_receipt.is_(True)).first() is not None:
+            return None
+
         db_login_failure(session, tid, 1)
 
+    if legacy and not itip.crypto_pub_key:
+        # Without a key to be reencrypted the receipt could be upgraded immediately
+        itip.receipt_hash = receipt_hash
+        itip.legacy_receipt = False
+        legacy = False
+
     itip.wb_last_access = datetime_now()
     itip.tor = itip.tor and client_using_tor
 
-    crypto_prv_key = ''
-    if itip.crypto_pub_key:
-        user_key = GCE.derive_key(receipt.encode(), State.tenants[tid].cache.receipt_salt)
-        crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(itip.crypto_prv_key))
-
     itip.access_count += 1
     if operator_id is not None:
         itip.receipt_change_needed = True
@@ -89,27 +103,91 @@ def login_whistleblower(session, tid, receipt, client_using_tor, operator_id=Non
 
     db_log(session, tid=tid, type='whistleblower_login', user_id=operator_id, object_id=itip.id)
 
-    session = Sessions.new(tid, itip.id, tid, 'whistleblower', crypto_prv_key)
+    return {
+        'id': itip.id,
+        'crypto_prv_key': itip.crypto_prv_key if itip.crypto_pub_key else '',
+        'receipt_change_needed': itip.receipt_change_needed,
+        'legacy': legacy
+    }
+
 
-    if itip.receipt_change_needed:
+@transact
+def db_upgrade_receipt(session, itip_id, legacy_receipt_hash, receipt_hash, crypto_prv_key):
+    """
+    Transaction for upgrading a legacy receipt to the current receipt scheme
+
+    :param session: An ORM session
+    :param itip_id: The ID of the tip to be upgraded
+    :param legacy_receipt_hash: The receipt hash in the legacy scheme
+    :param receipt_hash: The receipt hash in the current scheme
+    :param crypto_prv_key: The whistleblower private key encrypted with the new receipt key
+    """
+    itip = session.query(InternalTip) \
+                  .filter(InternalTip.id == itip_id,
+                          InternalTip.receipt_hash == legacy_receipt_hash).one_or_none()
+
+    if itip is not None:
+        itip.receipt_hash = receipt_hash
+        itip.legacy_receipt = False
+        itip.crypto_prv_key = crypto_prv_key
+
+
+@inlineCallbacks
+def login_whistleblower(tid, receipt, client_using_tor, operator_id=None):
+    """
+    Login procedure for whistleblowers' access
+
+    The receipt is derived with a single KDF invocation performed outside
+    of the database transaction; while the tenant has tips not yet upgraded
+    the receipts not matching any tip are derived in the legacy scheme as
+    well, and the tips found that way are upgraded at login.
+
+    :param tid: A tenant ID
+    :param receipt: A provided receipt
+    :param client_using_tor: A boolean signaling Tor usage
+    :param operator_id: The ID of the operator acting on behalf of the whistleblower
+    :return: Returns a user session in case of success
+    """
+    receipt_salt = State.tenants[tid].cache.receipt_salt
+
+    receipt_hash, receipt_key = yield defer_kdf(GCE.derive_receipt, receipt, receipt_salt, tid)
+
+    itip = yield db_login_whistleblower(tid, receipt_hash, client_using_tor, operator_id)
+
+    legacy_receipt_hash = None
+    if itip is None:
+        # Tips of the legacy scheme are looked up with the hash of that scheme
+        legacy_receipt_hash = yield defer_kdf(GCE.hash_password, receipt, receipt_salt, tid)
+        itip = yield db_login_whistleblower(tid, receipt_hash, client_using_tor, operator_id, legacy_receipt_hash)
+
+    crypto_prv_key = ''
+    if itip['crypto_prv_key'] and itip['legacy']:
+        user_key = yield defer_kdf(GCE.derive_key, receipt.encode(), receipt_salt, tid)
+        crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(itip['crypto_prv_key']))
+
+        yield db_upgrade_receipt(itip['id'], legacy_receipt_hash, receipt_hash,
+                                 Base64Encoder.encode(GCE.symmetric_encrypt(receipt_key, crypto_prv_key)))
+    elif itip['crypto_prv_key']:
+        crypto_prv_key = GCE.symmetric_decrypt(receipt_key, Base64Encoder.decode(itip['crypto_prv_key']))
+
+    session = Sessions.new(tid, itip['id'], tid, 'whistleblower', crypto_prv_key)
+
+    if itip['receipt_change_needed']:
         session.properties["new_receipt"] = GCE.generate_receipt()
+        Sessions.save(session)
 
-    return session
+    returnValue(session)
 
 
 @transact
-def login(session, tid, username, password, authcode, client_using_tor, client_ip):
+def get_user_credentials(session, tid, username):
     """
-    Login transaction for users' access
+    Transaction returning the data needed to verify the credentials of a user
 
     :param session: An ORM session
     :param tid: A tenant ID
     :param username: A provided username
-    :param password: A provided password
-    :param authcode: A provided authcode
-    :param client_using_tor: A boolean signaling Tor usage
-    :param client_ip:  The client IP
-    :return: Returns a user session in case of success
+    :return: Returns the user credentials or None if the user does not exist
     """
     if tid in State.tenants and State.tenants[tid].cache.simplified_login:
         user = session.query(User).filter(or_(User.id == username,
@@ -121,19 +199,39 @@ def login(session, tid, username, password, authcode, client_using_tor, client_i
                                           User.enabled.is_(True),
                                           User.tid == tid).one_or_none()
 
-    if not user or not GCE.check_password(password, user.salt, user.hash):
-        db_login_failure(session, tid, 0)
+    if not user:
+        return
 
-    connection_check(tid, user.role, client_ip, client_using_tor)
+    return {
+        'id': user.id,
+        'role': user.role,
+        'salt': user.salt,
+        'hash': user.hash,
+        'two_factor_secret': user.two_factor_secret
+    }
 
-    if user.two_factor_secret:
-        if authcode == '':
-            raise errors.TwoFactorAuthCodeRequired
 
-        State.totp_verify(user.two_factor_secret, authcode)
+@transact
+def db_login(session, tid, user_id, user_hash, user_key):
+    """
+    Login transaction for users' access
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param user_id: The ID of the user authenticated
+    :param user_hash: The password hash verified before the transaction
+    :param user_key: The key derived from the password of the user
+    :return: Returns the user data required to setup the user session
+    """
+    user = session.query(User).filter(User.id == user_id,
+                                      User.enabled.is_(True),
+                                      User.tid == tid).one_or_none()
+
+    # Ensure that the password has not been changed while verifying it
+    if not user or user.hash != user_hash:
+        db_login_failure(session, tid, 0)
 
     crypto_prv_key = ''
-    user_key = GCE.derive_key(password.encode(), user.salt)
     if user.crypto_prv_key:
         crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(user.crypto_prv_key))
     elif State.tenants[tid].cache.encryption:
@@ -153,12 +251,55 @@ def login(session, tid, username, password, authcode, client_using_tor, client_i
 
     db_log(session, tid=tid, type='login', user_id=user.id)
 
-    session = Sessions.new(tid, user.id, user.tid, user.role, crypto_prv_key, user.crypto_escrow_prv_key)
+    return {
+        'id': user.id,
+        'tid': user.tid,
+        'role': user.role,
+        'crypto_prv_key': crypto_prv_key,
+        'crypto_escrow_prv_key': user.crypto_escrow_prv_key,
+        'can_edit_general_settings': user.can_edit_general_settings
+    }
+
+
+@inlineCallbacks
+def login(tid, username, password, authcode, client_using_tor, client_ip):
+    """
+    Login procedure for users' access
+
+    The key derivations are performed outside of the database transactions
+
+    :param tid: A tenant ID
+    :param username: A provided username
+    :param password: A provided password
+    :param authcode: A provided authcode
+    :param client_using_tor: A boolean signaling Tor usage
+    :param client_ip:  The client IP
+    :return: Returns a user session in case of success
+    """
+    user = yield get_user_credentials(tid, username)
+
+    if not user or not (yield defer_kdf(GCE.check_password, password, user['salt'], user['hash'], tid)):
+        yield tw(db_login_failure, tid, 0)
+
+    connection_check(tid, user['role'], client_ip, client_using_tor)
+
+    if user['two_factor_secret']:
+        if authcode == '':
+            raise errors.TwoFactorAuthCodeRequired
+
+        State.totp_verify(user['two_factor_secret'], authcode)
+
+    user_key = yield defer_kdf(GCE.derive_key, password.encode(), user['salt'], tid)
+
+    user = yield db_login(tid, user['id'], user['hash'], user_key)
+
+    session = Sessions.new(tid, user['id'], user['tid'], user['role'], user['crypto_prv_key'], user['crypto_escrow_prv_key'])
 
-    if user.role == 'receiver' and user.can_edit_general_settings:
+    if user['role'] == 'receiver' and user['can_edit_general_settings']:
         session.permissions['can_edit_general_settings'] = True
+        Sessions.save(session)
 
-    return session
+    returnValue(session)
 
 
 class AuthenticationHandler(BaseHandler):
@@ -247,6 +388,7 @@ class ReceiptAuthHandler(BaseHandler):
 
         if operator_id:
             session.properties["operator_session"] = self.session.user_id
+            Sessions.save(session)
             del Sessions[self.session.id]
 
         returnValue(session.serialize())
@@ -271,6 +413,7 @@ class SessionHandler(BaseHandler):
             pass
         else:
             self.session.token = self.state.tokens.new(self.request.tid)
+            Sessions.save(self.session)
 
         return self.session.serialize()
 
@@ -307,6 +450,7 @@ class TenantAuthSwitchHandler(BaseHandler):
                                self.session.ek)
 
         session.properties['management_session'] = True
+        Sessions.save(session)
 
         return {'redirect': '/t/%s/#/login?token=%s' % (State.tenants[tid].cache.uuid, session.id)}
 
@@ -326,5 +470,6 @@ class OperatorAuthSwitchHandler(BaseHandler):
                                self.session.ek)
 
         session.properties['operator_session'] = self.session.user_id
+        Sessions.save(session)
 
         return {'redirect': '/#/login?token=%s' % session.id}
@@ -1,29 +1,29 @@
 # -*- coding: utf-8 -*-
 import base64
-import json
+import io
 import mimetypes
 import os
 import re
 
 from datetime import datetime
 
-from tempfile import NamedTemporaryFile
-
 from twisted.internet import abstract
-from twisted.protocols.basic import FileSender
+from twisted.web.http import datetimeToString
 
 from globaleaks.event import track_handler
 from globaleaks.orm import transact_sync
 from globaleaks.rest import errors
+from globaleaks.rest.validator import compile_type, get_request_validator
 from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.transactions import db_get_user
-from globaleaks.utils.crypto import GCE
+from globaleaks.utils.crypto import GCE, _StreamingEncryptionObject
+from globaleaks.utils.filesender import ThreadedFileSender
 from globaleaks.utils.ip import check_ip
 from globaleaks.utils.log import log
-from globaleaks.utils.pgp import PGPContext
-from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.pgp import get_pgp_context
+from globaleaks.utils.securetempfile import SecureTemporaryFile, write_chunk
 from globaleaks.utils.utility import datetime_now
 
 mimetypes.add_type('text/javascript', '.js')
@@ -39,8 +39,91 @@ def decodeString(string):
     return ''.join(map(chr, uint16_array))
 
 
-def serve_file(request, fo):
-    filesender = FileSender()
+class FileRange(object):
+    """
+    File-like object reading a range of bytes of a file
+    """
+    def __init__(self, fo, start, length):
+        fo.seek(start)
+        self.fo = fo
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return b''
+
+        data = self.fo.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fo.close()
+
+
+def parse_range(value, size):
+    """
+    Parse the value of a Range header
+
+    Only the requests of a single range of bytes are honoured, the others
+    are served the whole file.
+
+    :param value: The value of the header
+    :param size: The size of the file
+    :return: A tuple (start, end) with the positions of the first and of the
+             last byte of the range or None to serve the whole file
+    """
+    match = re.match(rb'^\s*bytes\s*=\s*(\d*)-(\d*)\s*$', value)
+    if match is None or match.groups() == (b'', b''):
+        return None
+
+    start, end = match.groups()
+
+    if not start:
+        # Range of the last bytes of the file
+        length = int(end)
+        if not length or not size:
+            raise errors.RangeNotSatisfiable
+
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    if end and int(end) < start:
+        return None
+
+    if start >= size:
+        raise errors.RangeNotSatisfiable
+
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def check_if_range(request):
+    """
+    Check if the validator of the If-Range header of a request, if any, is
+    the one of the response
+
+    Entity tags are compared with the strong comparison.
+    """
+    value = request.getHeader(b'if-range')
+    if value is None:
+        return True
+
+    header = b'etag' if value.startswith(b'"') else b'last-modified'
+
+    return value in (request.responseHeaders.getRawHeaders(header) or [])
+
+
+def serve_file(request, fo, size=None):
+    """
+    Stream a file as the body of a response
+
+    When the size of the file is known and the response is not compressed
+    on the fly, a request of a range of bytes is answered with 206.
+
+    :param request: A `twisted.web.Request`
+    :param fo: A file-like object
+    :param size: The size of the file or None if not known
+    """
+    filesender = ThreadedFileSender()
 
     def on_success(byte):
         fo.close()
@@ -52,6 +135,29 @@ def serve_file(request, fo):
     if request.finished:
         return
 
+    if size is not None and getattr(request, '_encoder', None) is None:
+        request.setHeader(b'Accept-Ranges', b'bytes')
+
+        start, end = 0, size - 1
+
+        value = request.getHeader(b'range')
+        if value is not None and check_if_range(request):
+            try:
+                byte_range = parse_range(value, size)
+            except errors.RangeNotSatisfiable:
+                fo.close()
+                request.setHeader(b'Content-Range', b'bytes */%d' % size)
+                raise
+
+            if byte_range is not None:
+                start, end = byte_range
+                request.setResponseCode(206)
+                request.setHeader(b'Content-Range', b'bytes %d-%d/%d' % (start, end, size))
+
+        # The file is read up to the size declared even if growing meanwhile
+        fo = FileRange(fo, start, end - start + 1)
+        request.setHeader(b'Content-Length', b'%d' % (end - start + 1))
+
     d = filesender.beginFileTransfer(fo, request)
     d.addCallback(on_success)
     d.addErrback(on_error)
@@ -59,6 +165,21 @@ def serve_file(request, fo):
     return d
 
 
+def set_content_encoding(request, encoding):
+    """
+    Set the content encoding of a response whose body is already encoded
+
+    The compression on the fly of the response is disabled.
+
+    :param request: A `twisted.web.Request`
+    :param encoding: A content encoding or None for identity
+    """
+    request._encoder = None
+    request.responseHeaders.removeHeader(b'content-encoding')
+
+    if encoding is not None:
+        request.setHeader(b'Content-Encoding', encoding.encode())
+
 
 def connection_check(tid, role, client_ip, client_using_tor):
     """
@@ -86,7 +207,7 @@ def db_confirmation_check(session, tid, user_id, secret):
     if user.two_factor_secret:
         State.totp_verify(user.two_factor_secret, secret)
     else:
-        if not GCE.check_password(secret, user.salt, user.hash):
+        if not GCE.check_password(secret, user.salt, user.hash, tid):
             raise errors.InvalidAuthentication
 
 
@@ -99,7 +220,9 @@ class BaseHandler(object):
     check_roles = 'admin'
     handler_exec_time_threshold = 120
     cache_resource = False
+    cache_dependencies = None
     invalidate_cache = False
+    invalidate_cache_dependencies = None
     root_tenant_only = False
     root_tenant_or_management_only = False
     upload_handler = False
@@ -179,41 +302,7 @@ class BaseHandler(object):
 
     @staticmethod
     def validate_type(value, type):
-        retval = False
-
-        if value is None:
-            log.err("-- Invalid python_type, in [%s] expected %s", value, type)
-
-        # if it's callable, than assumes is a primitive class
-        elif callable(type):
-            retval = BaseHandler.validate_python_type(value, type)
-            if not retval:
-                log.err("-- Invalid python_type, in [%s] expected %s", value, type)
-
-        # value as "{foo:bar}"
-        elif isinstance(type, dict):
-            retval = BaseHandler.validate_request(value, type)
-            if not retval:
-                log.err("-- Invalid JSON/dict [%s] expected %s", value, type)
-
-        # regexp
-        elif isinstance(type, str):
-            retval = BaseHandler.validate_regexp(value, type)
-            if not retval:
-                log.err("-- Failed Match in regexp [%s] against %s", value, type)
-
-        # value as "[ type ]"
-        elif isinstance(type, list):
-            # empty list is ok
-            if not value:
-                retval = True
-
-            else:
-                retval = all(BaseHandler.validate_type(x, type[0]) for x in value)
-                if not retval:
-                    log.err("-- List validation failed [%s] of %s", value, type)
-
-        return retval
+        return compile_type(type)(value)
 
     @staticmethod
     def validate_request(request, request_template):
@@ -221,67 +310,10 @@ class BaseHandler(object):
         Takes a string that represents a JSON requests and checks to see if it
         conforms to the request type it is supposed to be.
 
-        This request must be either a dict or a list. This function may be called
-        recursively to validate sub-parameters that are also go GLType.
+        The templates of globaleaks.rest.requests are compiled at import time;
+        see globaleaks.rest.validator.
         """
-        if not isinstance(request, (dict, list)):
-            try:
-                request = json.loads(request)
-            except:
-                raise errors.InputValidationError
-
-        if isinstance(request_template, dict):
-            success_check = 0
-            keys_to_strip = []
-            for key, value in request.items():
-                if key not in request_template:
-                    # strip whatever is not validated
-                    #
-                    # reminder: it's not possible to raise an exception for the
-                    # in case more values are present because it's normal that the
-                    # client will send automatically more data.
-                    #
-                    # e.g. the client will always send 'creation_date' attributes of
-                    #      objects and attributes like this are present generally only
-                    #      from the second request on.
-                    #
-                    keys_to_strip.append(key)
-                    continue
-
-                if not BaseHandler.validate_type(value, request_template[key]):
-                    log.err("Received key %s: type validation fail", key)
-                    raise errors.InputValidationError("Key (%s) type validation failure" % key)
-                success_check += 1
-
-            for key in keys_to_strip:
-                del request[key]
-
-            for key, value in request_template.items():
-                if key not in request:
-                    log.debug("Key %s expected but missing!", key)
-                    log.debug("Received schema %s - Expected %s",
-                              request.keys(), request_template.keys())
-                    raise errors.InputValidationError("Missing key %s" % key)
-
-                if not BaseHandler.validate_type(request[key], value):
-                    log.err("Expected key: %s type validation failure", key)
-                    raise errors.InputValidationError("Key (%s) double validation failure" % key)
-
-                if isinstance(request_template[key], (dict, list)) and request_template[key]:
-                    BaseHandler.validate_request(request[key], request_template[key])
-
-                success_check += 1
-
-            if success_check != len(request_template) * 2:
-                log.err("Success counter double check failure: %d", success_check)
-                raise errors.InputValidationError("Success counter double check failure")
-
-        elif isinstance(request_template, list):
-            if not all(BaseHandler.validate_type(x, request_template[0]) for x in request):
-                raise errors.InputValidationError("Not every element in %s is %s" %
-                                                  (request, request_template[0]))
-
-        return request
+        return get_request_validator(request_template)(request)
 
     def redirect(self, url):
         self.request.setResponseCode(301)
@@ -304,7 +336,7 @@ class BaseHandler(object):
 
         return open(filepath, 'rb')
 
-    def write_file(self, filename, fp):
+    def write_file(self, filename, fp, size=None):
         if isinstance(fp, str):
             fp = self.open_file(fp)
 
@@ -315,23 +347,49 @@ class BaseHandler(object):
 
         self.request.setHeader(b'Content-Type', mimetype)
 
-        return serve_file(self.request, fp)
+        return serve_file(self.request, fp, size)
+
+    def set_file_validators(self, fp):
+        """
+        Set the validators of a response serving a stored file
+
+        :param fp: A file or a file encrypted with GCE
+        :return: The size of the content of the file
+        """
+        if isinstance(fp, _StreamingEncryptionObject):
+            stat = os.fstat(fp.fd.fileno())
+            size = fp.get_size()
+        else:
+            stat = os.fstat(fp.fileno())
+            size = stat.st_size
+
+        self.request.setHeader(b'ETag', b'"%x-%x"' % (int(stat.st_mtime), stat.st_size))
+        self.request.setHeader(b'Last-Modified', datetimeToString(stat.st_mtime))
+
+        return size
 
     def write_file_as_download(self, filename, fp, pgp_key=''):
+        # Only the files stored are served by ranges; the ones generated for
+        # the request, as the ones encrypted with PGP, differ at each request
+        size = None
+
         if isinstance(fp, str):
             fp = self.open_file(fp)
 
         if pgp_key:
             filename += '.pgp'
-            _fp = fp
-            fp = NamedTemporaryFile()
-            PGPContext(pgp_key).encrypt_file(_fp, fp.name)
+            fp = get_pgp_context(pgp_key).encrypt_stream(fp)
+        elif isinstance(fp, (_StreamingEncryptionObject, io.BufferedReader)):
+            size = self.set_file_validators(fp)
+
+        # Ranges refer to the content as is
+        set_content_encoding(self.request, None)
 
         self.request.setHeader(b'Content-Type', 'application/octet-stream')
         self.request.setHeader(b'Content-Disposition',
                                'attachment; filename="%s"' % filename)
 
-        return serve_file(self.request, fp)
+        return serve_file(self.request, fp, size)
 
     def process_file_upload(self):
         if b'flowFilename' not in self.request.args:
@@ -347,24 +405,28 @@ class BaseHandler(object):
                 State.RateLimitingTable.check(self.request.path + b'#' + self.request.client_ip.encode(),
                                               State.tenants[1].cache.threshold_attachments_per_hour_per_ip)
 
-            self.state.TempUploadFiles[file_id] = SecureTemporaryFile(Settings.tmp_path)
+        # The first chunks of a file could be received concurrently by different processes
+        f = self.state.TempUploadFiles.setdefault(file_id, SecureTemporaryFile(Settings.tmp_path))
 
-        f = self.state.TempUploadFiles[file_id]
+        chunk_number = int(self.request.args[b'flowChunkNumber'][0])
+        if chunk_number < 1:
+            raise errors.InputValidationError("Invalid chunk number")
+
+        # Each chunk is written at its offset as the chunks could be received in any order
+        offset = (chunk_number - 1) * int(self.request.args[b'flowChunkSize'][0])
 
         chunk_size = len(self.request.args[b'file'][0])
         if ((chunk_size // (1024 * 1024)) > self.state.tenants[self.request.tid].cache.maximum_filesize or
             (total_file_size // (1024 * 1024)) > self.state.tenants[self.request.tid].cache.maximum_filesize or
+            (offset + chunk_size) // (1024 * 1024) > self.state.tenants[self.request.tid].cache.maximum_filesize or
             f.size // (1024 * 1024) > self.state.tenants[self.request.tid].cache.maximum_filesize):
             log.err("File upload request rejected: file too big", tid=self.request.tid)
             raise errors.FileTooBig(self.state.tenants[self.request.tid].cache.maximum_filesize)
 
-        with f.open('w') as f:
-            f.write(self.request.args[b'file'][0])
-
-            if self.request.args[b'flowChunkNumber'][0] != self.request.args[b'flowTotalChunks'][0]:
-                return None
-
-            f.finalize_write()
+        f = write_chunk(self.state.TempUploadFiles, file_id, self.request.args[b'file'][0], offset,
+                        chunk_number, int(self.request.args[b'flowTotalChunks'][0]))
+        if f is None:
+            return None
 
         mime_type, _ = mimetypes.guess_type(self.request.args[b'flowFilename'][0].decode())
         if mime_type is None:
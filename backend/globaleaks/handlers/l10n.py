@@ -53,6 +53,7 @@ def get_l10n(session, tid, lang):
 class L10NHandler(BaseHandler):
     check_roles = 'any'
     cache_resource = True
+    cache_dependencies = {'Config', 'CustomTexts'}
 
     def get(self, lang):
         return get_l10n(self.request.tid, lang)
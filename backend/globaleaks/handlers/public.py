@@ -598,6 +598,8 @@ class PublicResource(BaseHandler):
     """
     check_roles = 'any'
     cache_resource = True
+    cache_dependencies = {'Config', 'Context', 'EnabledLanguage', 'Field', 'File',
+                          'Questionnaire', 'Step', 'SubmissionStatus', 'User'}
 
     def get(self):
         """
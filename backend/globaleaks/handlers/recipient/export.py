@@ -21,7 +21,6 @@ from globaleaks.rest import errors
 from globaleaks.settings import Settings
 from globaleaks.utils.crypto import Base64Encoder, GCE
 from globaleaks.utils.fs import directory_traversal_check
-from globaleaks.utils.securetempfile import SecureTemporaryFile
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_null, msdos_encode
 from globaleaks.utils.zipstream import ZipStream
@@ -144,6 +143,47 @@ def create_pdf_report(input_text, data):
     return BytesIO(pdf.output())
 
 
+class PDFReport(object):
+    """
+    File-like object generating the PDF report of a tip on first access
+
+    The report is so generated only when the export archive reaches it, in
+    the thread producing the archive instead of the reactor.
+    """
+    def __init__(self, input_text, data):
+        self.input_text = input_text
+        self.data = data
+        self.fo = None
+
+    def open(self):
+        if self.fo is None:
+            self.fo = create_pdf_report(self.input_text, self.data)
+
+        return self.fo
+
+    def read(self, size=-1):
+        return self.open().read(size)
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self.open().seek(offset, whence)
+
+    def tell(self):
+        return self.open().tell()
+
+    def close(self):
+        if self.fo is not None:
+            self.fo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 @inlineCallbacks
 def prepare_tip_export(user_session, tip_export):
     tip_export['tip']['rfiles'] = list(filter(lambda x: x['visibility'] != 'personal', tip_export['tip']['rfiles']))
@@ -192,7 +232,7 @@ def prepare_tip_export(user_session, tip_export):
     export_template = msdos_encode(export_template.decode()).encode()
 
     if REPORTPDF:
-        files.append({'fo': create_pdf_report(export_template.decode(), tip_export), 'name': 'report.pdf'})
+        files.append({'fo': PDFReport(export_template.decode(), tip_export), 'name': 'report.pdf'})
     else:
         files.append({'fo': BytesIO(export_template), 'name': 'report.txt'})
 
@@ -214,14 +254,5 @@ class ExportHandler(BaseHandler):
 
         files = yield prepare_tip_export(self.session, tip_export)
 
-        zipstream = ZipStream(files)
-
-        stf = SecureTemporaryFile(self.state.settings.tmp_path)
-
-        with stf.open('w') as f:
-            for x in zipstream:
-                f.write(x)
-            f.finalize_write()
-
-        with stf.open('r') as f:
-            yield self.write_file_as_download(filename, f, pgp_key)
+        # The archive is produced, and eventually encrypted, while it is sent
+        yield self.write_file_as_download(filename, ZipStream(files), pgp_key)
@@ -2,9 +2,7 @@
 #
 # Handlers implementing platform signup
 from sqlalchemy import not_
-from twisted.internet.threads import deferToThread
 from globaleaks import models
-from globaleaks.db import sync_refresh_tenant_cache
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.tenant import db_create as db_create_tenant
@@ -161,7 +159,7 @@ def signup_activation(session, token, hostname, language):
 
     State.format_and_send_mail(session, 1, signup.email, template_vars)
 
-    deferToThread(sync_refresh_tenant_cache, tenant)
+    State.invalidate_cache(tenant.id)
 
 
 class Signup(BaseHandler):
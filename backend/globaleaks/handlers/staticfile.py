@@ -1,11 +1,154 @@
 # -*- coding: utf-8 -*-
 #
 # Handler exposing application files
+import hashlib
 import os
+from collections import OrderedDict
 
-from globaleaks.handlers.base import BaseHandler
+from twisted.web.http import datetimeToString, stringToDatetime
+
+from globaleaks.handlers.base import BaseHandler, set_content_encoding
+from globaleaks.rest.cache import match_etags, select_encoding
 from globaleaks.utils.fs import directory_traversal_check
 
+# Extensions of the precompressed variants of the files in order of preference
+PRECOMPRESSED_EXTENSIONS = OrderedDict([
+    ('br', '.br'),
+    ('gzip', '.gz')
+])
+
+# Size of the chunks read when computing the digests of the files
+CHUNK_SIZE = 64 * 1024
+
+# Manifests of the directories of the client indexed by their path
+manifests = {}
+
+
+def get_file_digest(path):
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+
+    return h.hexdigest()[:32].encode()
+
+
+def get_stat_key(stat):
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class StaticFile(object):
+    """
+    Entry of a manifest describing a file and its precompressed variants
+    """
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'variants', 'stats')
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        digest = get_file_digest(path)
+
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.etag = b'"' + digest + b'"'
+        self.variants = OrderedDict()
+        self.stats = {path: get_stat_key(stat)}
+
+        for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+            variant_path = path + extension
+            try:
+                variant_stat = os.stat(variant_path)
+            except OSError:
+                self.stats[variant_path] = None
+                continue
+
+            self.stats[variant_path] = get_stat_key(variant_stat)
+
+            # Variants older than the file are left over by a previous build
+            if variant_stat.st_mtime < stat.st_mtime:
+                continue
+
+            self.variants[encoding] = (variant_path,
+                                       variant_stat.st_size,
+                                       b'"' + digest + b'-' + encoding.encode() + b'"')
+
+    def get_variant(self, encoding):
+        """
+        :param encoding: A content encoding or None for identity
+        :return: A tuple (path, size, etag) of the variant of the file
+        """
+        if encoding is None:
+            return self.path, self.size, self.etag
+
+        return self.variants[encoding]
+
+    def is_current(self):
+        """
+        Check that the file and its variants were not changed since indexed
+        """
+        for path, key in self.stats.items():
+            try:
+                if get_stat_key(os.stat(path)) != key:
+                    return False
+            except OSError:
+                if key is not None:
+                    return False
+
+        return True
+
+
+class StaticFileManifest(object):
+    """
+    Index of the files of a directory built once
+
+    The entries of the files changed after the creation of the manifest are
+    rebuilt when requested, and the ones of the files removed are dropped.
+    Files added after the creation of the manifest are not indexed and are
+    served without any validator.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.files = {}
+
+        extensions = tuple(PRECOMPRESSED_EXTENSIONS.values())
+
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+
+                # Precompressed variants are indexed together with their file
+                if filename.endswith(extensions) and os.path.isfile(os.path.splitext(path)[0]):
+                    continue
+
+                self.files[os.path.relpath(path, self.root)] = StaticFile(path)
+
+    def get(self, filename):
+        entry = self.files.get(filename)
+        if entry is None or entry.is_current():
+            return entry
+
+        try:
+            entry = self.files[filename] = StaticFile(entry.path)
+        except OSError:
+            self.files.pop(filename, None)
+            return None
+
+        return entry
+
+
+def get_manifest(root):
+    """
+    Return the manifest of a directory creating it on first use
+    """
+    root = os.path.abspath(root)
+
+    manifest = manifests.get(root)
+    if manifest is None:
+        manifest = manifests[root] = StaticFileManifest(root)
+
+    return manifest
+
 
 class StaticFileHandler(BaseHandler):
     check_roles = 'any'
@@ -20,6 +163,57 @@ class StaticFileHandler(BaseHandler):
 
         self.root = "%s%s" % (os.path.abspath(state.settings.client_path), "/")
 
+    def write_static_file(self, filename, abspath):
+        """
+        Serve a file of the client
+
+        Files indexed by the manifest are served with their validators and
+        with the precompressed variant preferred by the client, answering
+        the conditional requests with 304.
+
+        In development mode the files are served as they are on disk.
+        """
+        if self.state.settings.devel_mode:
+            return self.write_file(filename, abspath)
+
+        entry = get_manifest(self.root).get(os.path.relpath(abspath, self.root))
+        if entry is None:
+            return self.write_file(filename, abspath)
+
+        accept_encoding = (self.request.getHeader(b'accept-encoding') or b'').decode('latin-1')
+        encoding = select_encoding(accept_encoding, entry.variants)
+        path, size, etag = entry.get_variant(encoding)
+
+        if encoding is not None:
+            set_content_encoding(self.request, encoding)
+        elif getattr(self.request, '_encoder', None) is not None:
+            # The body is going to be compressed on the fly
+            etag = b'W/' + etag
+
+        self.request.setHeader(b'Vary', b'Accept-Encoding')
+        self.request.setHeader(b'ETag', etag)
+        self.request.setHeader(b'Last-Modified', datetimeToString(entry.mtime))
+
+        if self.is_not_modified(entry):
+            self.request.setResponseCode(304)
+            return
+
+        return self.write_file(filename, path, size)
+
+    def is_not_modified(self, entry):
+        if_none_match = self.request.getHeader(b'if-none-match')
+        if if_none_match is not None:
+            return match_etags(if_none_match, [entry.etag] + [variant[2] for variant in entry.variants.values()])
+
+        if_modified_since = self.request.getHeader(b'if-modified-since')
+        if if_modified_since is not None:
+            try:
+                return stringToDatetime(if_modified_since.split(b';', 1)[0]) >= entry.mtime
+            except ValueError:
+                pass
+
+        return False
+
     def get(self, filename):
         if not filename:
             filename = 'index.html'
@@ -41,4 +235,4 @@ class StaticFileHandler(BaseHandler):
                                    b"script-src 'self' 'sha256-l4srTx31TC+tE2K4jVVCnC9XfHivkiSs/v+DPWccDDM=';"
                                    b"style-src 'self' 'sha256-pru43GdcNLwb4MwzOriCI9/9cKBzE5xeoLWHlKai1As=';")
 
-        return self.write_file(filename, abspath)
+        return self.write_static_file(filename, abspath)
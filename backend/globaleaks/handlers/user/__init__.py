@@ -9,7 +9,7 @@ from globaleaks.rest import errors, requests
 from globaleaks.state import State
 from globaleaks.transactions import db_get_user
 from globaleaks.utils.crypto import generateRandomKey
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import get_pgp_context, invalidate_pgp_context
 from globaleaks.utils.utility import datetime_now, datetime_null
 
 import globaleaks.handlers.user.validate_email
@@ -25,8 +25,12 @@ def parse_pgp_options(user, request):
     pgp_key_public = request['pgp_key_public']
     remove_key = request['pgp_key_remove']
 
+    # The keyring of the key replaced is no longer needed
+    if user.pgp_key_public and (remove_key or pgp_key_public != user.pgp_key_public):
+        invalidate_pgp_context(user.pgp_key_public)
+
     if not remove_key and pgp_key_public:
-        pgpctx = PGPContext(pgp_key_public)
+        pgpctx = get_pgp_context(pgp_key_public)
         user.pgp_key_public = pgp_key_public
         user.pgp_key_fingerprint = pgpctx.fingerprint
         user.pgp_key_expiration = pgpctx.expiration
@@ -185,6 +189,7 @@ class UserInstance(BaseHandler):
     """
     check_roles = 'user'
     invalidate_cache = True
+    invalidate_cache_dependencies = {'User'}
 
     def get(self):
         return get_user(self.session.user_tid,
@@ -9,6 +9,7 @@ from globaleaks import models
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.orm import db_log, transact
 from globaleaks.rest import errors
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
 from globaleaks.transactions import db_get_user
 from globaleaks.utils.crypto import GCE
@@ -31,7 +32,8 @@ def change_password(session, tid, user_session, password, old_password):
     if not user.password_change_needed:
         if not GCE.check_password(old_password,
                                   user.salt,
-                                  user.hash):
+                                  user.hash,
+                                  tid):
            raise errors.InvalidOldPassword
 
     config = models.config.ConfigFactory(session, tid)
@@ -44,7 +46,7 @@ def change_password(session, tid, user_session, password, old_password):
         raise errors.InputValidationError("The password is too weak")
 
     # Check that the new password is different form the current password
-    password_hash = GCE.hash_password(password, user.salt)
+    password_hash = GCE.hash_password(password, user.salt, tid)
     if user.hash == password_hash:
         raise errors.PasswordReuseError
 
@@ -54,7 +56,7 @@ def change_password(session, tid, user_session, password, old_password):
 
     cc = user_session.cc
     if config.get_val('encryption'):
-        enc_key = GCE.derive_key(password.encode(), user.salt)
+        enc_key = GCE.derive_key(password.encode(), user.salt, tid)
         if not user.crypto_pub_key:
             # The first password change triggers the generation
             # of the user encryption private key and its backup
@@ -77,6 +79,7 @@ def change_password(session, tid, user_session, password, old_password):
     if reset_token:
         srm(os.path.abspath(os.path.join(State.settings.ramdisk_path, reset_token)))
         del user_session.properties['reset_token']
+        Sessions.save(user_session)
 
     db_log(session, tid=tid, type='change_password', user_id=user.id, object_id=user.id)
 
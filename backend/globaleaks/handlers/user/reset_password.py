@@ -161,6 +161,7 @@ def validate_password_reset(session, reset_token, recovery_key, auth_code):
                                 user.crypto_escrow_prv_key)
 
     user_session.properties['reset_token'] = reset_token
+    Sessions.save(user_session)
 
     db_log(session, tid=user.tid, type='login', user_id=user.id)
 
@@ -28,4 +28,4 @@ class ViewerHandler(StaticFileHandler):
 
             self.request.setHeader(b"Cross-Origin-Resource-Policy", "cross-origin")
 
-        return self.write_file(filename, abspath)
+        return self.write_static_file(filename, abspath)
@@ -7,6 +7,7 @@ from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models import serializers
 from globaleaks.orm import transact
+from globaleaks.sessions import Sessions
 from globaleaks.utils.crypto import GCE
 from globaleaks.utils.utility import datetime_now
 
@@ -60,7 +61,10 @@ class SubmissionAttachment(BaseHandler):
 
     def post(self):
         self.uploaded_file['submission'] = True
-        self.session.files.append(self.uploaded_file)
+
+        # The temporary file is kept by State.TempUploadFiles and not in the session
+        self.session.files.append({k: v for k, v in self.uploaded_file.items() if k != 'body'})
+        Sessions.save(self.session)
 
 
 class PostSubmissionAttachment(SubmissionAttachment):
@@ -5,16 +5,19 @@ import base64
 import json
 import re
 
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from nacl.encoding import Base64Encoder
 from nacl.public import PrivateKey
 
 from globaleaks import models
 from globaleaks.handlers.admin.questionnaire import db_get_questionnaire
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import db_get, db_log, transact
+from globaleaks.orm import db_get, db_log, tw
 from globaleaks.rest import errors, requests
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
-from globaleaks.utils.crypto import sha256, GCE
+from globaleaks.utils.crypto import sha256, GCE, defer_kdf
 from globaleaks.utils.json import JSONEncoder
 from globaleaks.utils.utility import get_expiration, datetime_null
 
@@ -161,7 +164,7 @@ def db_create_receivertip(session, receiver, internaltip, tip_key):
     return receivertip
 
 
-def db_create_submission(session, tid, request, user_session, client_using_tor, client_using_mobile):
+def db_create_submission(session, tid, request, user_session, client_using_tor, client_using_mobile, receipt_hash, wb_key):
     encryption = db_get(session, models.Config, (models.Config.tid == tid, models.Config.var_name == 'encryption'))
 
     crypto_is_available = encryption.value
@@ -231,18 +234,14 @@ def db_create_submission(session, tid, request, user_session, client_using_tor,
     if whistleblower_identity is not None:
         itip.enable_whistleblower_identity = True
 
-    receipt = GCE.generate_receipt()
-    itip.receipt_hash = GCE.hash_password(receipt, State.tenants[tid].cache.receipt_salt)
+    itip.receipt_hash = receipt_hash
 
     session.add(itip)
     session.flush()
 
-    user_session.user_id = itip.id
-
     # Evaluate if the whistleblower tip should be encrypted
     if crypto_is_available:
         crypto_tip_prv_key, itip.crypto_tip_pub_key = GCE.generate_keypair()
-        wb_key = GCE.derive_key(receipt.encode(), State.tenants[tid].cache.receipt_salt)
         itip.crypto_pub_key = PrivateKey(user_session.cc, Base64Encoder).public_key.encode(Base64Encoder)
         itip.crypto_prv_key = Base64Encoder.encode(GCE.symmetric_encrypt(wb_key, user_session.cc))
         itip.crypto_tip_prv_key = Base64Encoder.encode(GCE.asymmetric_encrypt(itip.crypto_pub_key, crypto_tip_prv_key))
@@ -295,12 +294,30 @@ def db_create_submission(session, tid, request, user_session, client_using_tor,
 
     db_log(session, tid=tid, type='whistleblower_new_report', user_id=operator_id, object_id=itip.id)
 
-    return {'receipt': receipt}
+    return itip.id
+
+
+@inlineCallbacks
+def create_submission(tid, request, user_session, client_using_tor, client_using_mobile):
+    """
+    Perform a submission
+
+    The receipt hash and key are derived before opening the transaction
+    in order to keep the database write lock only for the time of the writes.
+    """
+    receipt = GCE.generate_receipt()
+    receipt_salt = State.tenants[tid].cache.receipt_salt
+
+    receipt_hash, wb_key = yield defer_kdf(GCE.derive_receipt, receipt, receipt_salt, tid)
+
+    itip_id = yield tw(db_create_submission, tid, request, user_session,
+                       client_using_tor, client_using_mobile,
+                       receipt_hash, wb_key)
 
+    user_session.user_id = itip_id
+    Sessions.save(user_session)
 
-@transact
-def create_submission(session, tid, request, user_session, client_using_tor, client_using_mobile):
-    return db_create_submission(session, tid, request, user_session, client_using_tor, client_using_mobile)
+    returnValue({'receipt': receipt})
 
 
 class SubmissionInstance(BaseHandler):
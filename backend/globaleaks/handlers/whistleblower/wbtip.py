@@ -19,7 +19,7 @@ from globaleaks.models import serializers
 from globaleaks.orm import db_get, transact
 from globaleaks.rest import errors, requests
 from globaleaks.state import State
-from globaleaks.utils.crypto import Base64Encoder, GCE
+from globaleaks.utils.crypto import Base64Encoder, GCE, defer_kdf
 from globaleaks.utils.fs import directory_traversal_check
 from globaleaks.utils.log import log
 from globaleaks.utils.templating import Templating
@@ -144,7 +144,7 @@ def store_additional_questionnaire_answers(session, tid, user_id, answers, langu
 
 
 @transact
-def change_receipt(session, itip_id, cc, new_receipt, receipt_change_needed):
+def db_change_receipt(session, itip_id, cc, receipt_hash, wb_key, receipt_change_needed):
     """
     Transaction for updating old receipt to a new one
     """
@@ -153,22 +153,31 @@ def change_receipt(session, itip_id, cc, new_receipt, receipt_change_needed):
     if itip is None:
         return
 
-    tid = itip.tid
-
     # update receipt
-    itip.receipt_hash = GCE.hash_password(new_receipt, State.tenants[tid].cache.receipt_salt)
+    itip.receipt_hash = receipt_hash
+    itip.legacy_receipt = False
 
     if cc is None:
         return
 
-    wb_key = GCE.derive_key(new_receipt.encode(), State.tenants[tid].cache.receipt_salt)
-
     # update private keys
     itip.crypto_prv_key = Base64Encoder.encode(GCE.symmetric_encrypt(wb_key, cc))
 
     itip.receipt_change_needed = receipt_change_needed
 
 
+@inlineCallbacks
+def change_receipt(tid, itip_id, cc, new_receipt, receipt_change_needed):
+    """
+    Update the receipt performing the key derivations outside of the transaction
+    """
+    receipt_salt = State.tenants[tid].cache.receipt_salt
+
+    receipt_hash, wb_key = yield defer_kdf(GCE.derive_receipt, new_receipt, receipt_salt, tid)
+
+    yield db_change_receipt(itip_id, cc, receipt_hash, wb_key, receipt_change_needed)
+
+
 class Operations(BaseHandler):
     """
     This interface expose some utility methods for the Whistleblower Tip.
@@ -180,7 +189,8 @@ class Operations(BaseHandler):
         if request["operation"] != "change_receipt":
             raise errors.InputValidationError("Invalid command")
 
-        return change_receipt(self.session.user_id, self.session.cc,
+        return change_receipt(self.request.tid,
+                              self.session.user_id, self.session.cc,
                               self.session.properties["new_receipt"],
                               "operator_session" in self.session.properties)
 
@@ -1,5 +1,4 @@
 from globaleaks.jobs import anomalies, \
-                            cache_reset, \
                             certificate_check, \
                             cleaning, \
                             delivery, \
@@ -9,12 +8,10 @@ from globaleaks.jobs import anomalies, \
                             periodic_hourly, \
                             periodic_minutely, \
                             pgp_check, \
-                            session_management, \
                             update_check
 
 jobs_list = [
     anomalies.Anomalies,
-    cache_reset.CacheReset,
     certificate_check.CertificateCheck,
     cleaning.Cleaning,
     delivery.Delivery,
@@ -24,6 +21,5 @@ jobs_list = [
     periodic_hourly.PeriodicHourly,
     periodic_minutely.PeriodicMinutely,
     pgp_check.PGPCheck,
-    session_management.SessionManagement,
     update_check.UpdateCheck,
 ]
@@ -8,7 +8,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from OpenSSL.crypto import load_certificate, FILETYPE_PEM
 
-from globaleaks.handlers.admin.https import db_acme_cert_request, db_load_tls_config
+from globaleaks.handlers.admin.https import db_acme_cert_request, db_load_tls_config, invalidate_tls_config
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.user import db_get_users
@@ -82,6 +82,7 @@ class CertificateCheck(DailyJob):
                 if tls_config:
                     self.state.snimap.unload(tid)
                     self.state.snimap.load(tid, tls_config)
+                    invalidate_tls_config(tid)
                 else:
                     # Send an email to the admin cause this requires user intervention
                     if now > expiration_date - timedelta(self.notify_expr_within) and \
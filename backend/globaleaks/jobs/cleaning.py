@@ -136,6 +136,11 @@ class Cleaning(DailyJob):
         # Delete the outdated ramdisk tokens older than 1 week
         for f in os.listdir(self.state.settings.ramdisk_path):
             path = os.path.join(self.state.settings.ramdisk_path, f)
+
+            # The directories, like the one of the keyrings, are kept
+            if os.path.isdir(path):
+                continue
+
             timestamp = datetime.fromtimestamp(os.path.getmtime(path))
             if is_expired(timestamp, days=7):
                 srm(path)
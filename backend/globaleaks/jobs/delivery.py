@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
+import time
 
-from twisted.internet import abstract
-from twisted.internet.defer import inlineCallbacks
+from datetime import timedelta
+
+from twisted.internet import abstract, reactor
+from twisted.internet.defer import gatherResults, inlineCallbacks, succeed
+from twisted.internet.threads import deferToThreadPool
 
 from globaleaks import models
 from globaleaks.jobs.job import LoopingJob
@@ -10,153 +14,354 @@ from globaleaks.orm import transact
 from globaleaks.settings import Settings
 from globaleaks.utils.crypto import GCE
 from globaleaks.utils.log import log
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import get_pgp_context
+from globaleaks.utils.utility import datetime_now
 
 
 __all__ = ['Delivery']
 
+# Number of bytes of the files delivered at most at each run of the job
+BATCH_BYTES = 256 * 1024 * 1024
+
+# Number of files delivered at most at each run of the job
+BATCH_FILES = 100
+
+# Number of attempts after which the delivery of a file is given up
+MAX_ATTEMPTS = 5
+
+# Delay (seconds) before the retry of a delivery, doubled at each attempt
+RETRY_DELAY = 5
+
+
+def limit_batch(rows, sizes):
+    """
+    Yield the rows of a query of files until the size of the batch is reached
+
+    The first file is always yielded whatever its size.
+
+    :param rows: The rows of the query, whose first element is a file
+    :param sizes: The sizes of the uploaded files indexed by their id
+    """
+    size = 0
+
+    for row in rows:
+        if size >= BATCH_BYTES:
+            break
+
+        size += sizes.get(row[0].id, 0)
+        yield row
+
+
+def db_claim_delivery(f):
+    """
+    Mark a file as being processed
+
+    The retry date is set in advance so that the delivery of the file is
+    retried even if the process dies while processing it.
+    """
+    f.delivery_state = 'processing'
+    f.delivery_attempts += 1
+    f.delivery_date = datetime_now() + timedelta(seconds=RETRY_DELAY * 2 ** (f.delivery_attempts - 1))
+
+
+def db_get_delivery_stats(session):
+    """
+    Return the number of files waiting to be delivered and of files whose
+    delivery has failed
+    """
+    stats = {'backlog': 0, 'failed': 0}
+
+    for model in (models.InternalFile, models.ReceiverFile):
+        stats['backlog'] += session.query(model) \
+                                   .filter(model.delivery_state.in_(['pending', 'processing'])).count()
+
+        stats['failed'] += session.query(model) \
+                                  .filter(model.delivery_state == 'failed').count()
+
+    return stats
+
 
 @transact
-def file_delivery(session):
+def file_delivery(session, sizes):
     """
     This function roll over the InternalFile uploaded, extract a path, id and
     receivers associated, one entry for each combination. representing the
     WhistleblowerFile that need to be created.
+
+    The files are marked as being processed; the WhistleblowerFile are created
+    only once the files have been delivered.
+
+    The sizes of the files are those of the temporary files uploaded, as the
+    sizes recorded in the database may be encrypted.
     """
+    now = datetime_now()
     receiverfiles_maps = {}
     whistleblowerfiles_maps = {}
 
-    for ifile, itip in session.query(models.InternalFile, models.InternalTip) \
-                              .filter(models.InternalFile.new.is_(True),
-                                      models.InternalTip.id == models.InternalFile.internaltip_id) \
-                              .order_by(models.InternalFile.creation_date) \
-                              .limit(20):
-        ifile.new = False
-        src = ifile.id
-
-        for rtip, user in session.query(models.ReceiverTip, models.User) \
-                                 .filter(models.ReceiverTip.internaltip_id == ifile.internaltip_id,
-                                         models.User.id == models.ReceiverTip.receiver_id):
-            receiverfile = models.WhistleblowerFile()
-            receiverfile.internalfile_id = ifile.id
-            receiverfile.receivertip_id = rtip.id
-
-            # https://github.com/globaleaks/globaleaks-whistleblowing-software/issues/444
-            # avoid to mark the receiverfile as new if it is part of a submission
-            # this way we avoid to send unuseful messages
-            receiverfile.new = not ifile.creation_date == itip.creation_date
-
-            session.add(receiverfile)
+    for ifile, itip in limit_batch(session.query(models.InternalFile, models.InternalTip)
+                                          .filter(models.InternalFile.delivery_state.in_(['pending', 'processing']),
+                                                  models.InternalFile.delivery_date <= now,
+                                                  models.InternalTip.id == models.InternalFile.internaltip_id)
+                                          .order_by(models.InternalFile.creation_date)
+                                          .limit(BATCH_FILES), sizes):
+        db_claim_delivery(ifile)
 
-            if ifile.id not in receiverfiles_maps:
-                receiverfiles_maps[ifile.id] = {
-                    'key': itip.crypto_tip_pub_key,
-                    'src': src,
-                    'wbfiles': []
-                }
+        receiverfiles_maps[ifile.id] = {
+            'key': itip.crypto_tip_pub_key,
+            'src': ifile.id,
+            'attempts': ifile.delivery_attempts,
+            'wbfiles': []
+        }
 
+        for _, user in session.query(models.ReceiverTip, models.User) \
+                              .filter(models.ReceiverTip.internaltip_id == ifile.internaltip_id,
+                                      models.User.id == models.ReceiverTip.receiver_id):
             receiverfiles_maps[ifile.id]['wbfiles'].append({
-                'dst': os.path.abspath(os.path.join(Settings.attachments_path, receiverfile.internalfile_id)),
+                'dst': os.path.abspath(os.path.join(Settings.attachments_path, ifile.id)),
                 'pgp_key_public': user.pgp_key_public
             })
 
-    for rfile, itip in session.query(models.ReceiverFile, models.InternalTip)\
-                               .filter(models.ReceiverFile.new.is_(True),
-                                       models.ReceiverFile.internaltip_id == models.InternalTip.id) \
-                               .order_by(models.ReceiverFile.creation_date) \
-                               .limit(20):
-        rfile.new = False
-        src = rfile.id
+    for rfile, itip in limit_batch(session.query(models.ReceiverFile, models.InternalTip)
+                                          .filter(models.ReceiverFile.delivery_state.in_(['pending', 'processing']),
+                                                  models.ReceiverFile.delivery_date <= now,
+                                                  models.ReceiverFile.internaltip_id == models.InternalTip.id)
+                                          .order_by(models.ReceiverFile.creation_date)
+                                          .limit(BATCH_FILES), sizes):
+        db_claim_delivery(rfile)
 
         whistleblowerfiles_maps[rfile.id] = {
             'key': itip.crypto_tip_pub_key,
-            'src': src,
+            'src': rfile.id,
+            'attempts': rfile.delivery_attempts,
             'dst': os.path.abspath(os.path.join(Settings.attachments_path, rfile.id)),
         }
 
-        rfile.new = False
+    return receiverfiles_maps, whistleblowerfiles_maps, db_get_delivery_stats(session)
+
 
-    return receiverfiles_maps, whistleblowerfiles_maps
+@transact
+def update_delivery_states(session, results):
+    """
+    Record the outcome of the deliveries
+
+    :param session: An ORM session
+    :param results: A list of tuples (model name, file id, delivery state)
+    :return: The statistics of the deliveries
+    """
+    for model_name, file_id, state in results:
+        model = getattr(models, model_name)
+
+        f = session.query(model).filter(model.id == file_id).one_or_none()
+        if f is None:
+            continue
+
+        f.delivery_state = state
+
+        if state != 'delivered' or model is not models.InternalFile:
+            continue
+
+        itip = session.query(models.InternalTip).filter(models.InternalTip.id == f.internaltip_id).one()
+
+        for rtip in session.query(models.ReceiverTip) \
+                           .filter(models.ReceiverTip.internaltip_id == f.internaltip_id):
+            receiverfile = models.WhistleblowerFile()
+            receiverfile.internalfile_id = f.id
+            receiverfile.receivertip_id = rtip.id
+
+            # https://github.com/globaleaks/globaleaks-whistleblowing-software/issues/444
+            # avoid to mark the receiverfile as new if it is part of a submission
+            # this way we avoid to send unuseful messages
+            receiverfile.new = not f.creation_date == itip.creation_date
+
+            session.add(receiverfile)
+
+    return db_get_delivery_stats(session)
 
 
 def write_plaintext_file(sf, dest_path):
-    try:
-        with sf.open('rb') as encrypted_file, open(dest_path, "a+b") as plaintext_file:
+    with sf.open('rb') as encrypted_file, open(dest_path, "wb") as plaintext_file:
+        chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
+        while chunk:
+            plaintext_file.write(chunk)
             chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
-            while chunk:
-                plaintext_file.write(chunk)
-                chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
-
-    except Exception as excep:
-        log.err("Unable to create plaintext file %s: %s", dest_path, excep)
 
 
 def write_encrypted_file(key, sf, dest_path):
-    try:
-        with sf.open('rb') as encrypted_file, \
-             GCE.streaming_encryption_open('ENCRYPT', key, dest_path) as seo:
+    with sf.open('rb') as encrypted_file, \
+         GCE.streaming_encryption_open('ENCRYPT', key, dest_path) as seo:
+        chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
+        while chunk:
+            seo.encrypt_chunk(chunk, 0)
             chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
-            while chunk:
-                seo.encrypt_chunk(chunk, 0)
-                chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
 
-            seo.encrypt_chunk(b'', 1)
-    except Exception as excep:
-        log.err("Unable to create plaintext file %s: %s", dest_path, excep)
+        seo.encrypt_chunk(b'', 1)
 
 
-def process_receiverfiles(state, files_maps):
+def deliver_file(sf, dst, key, pgp_key_public=''):
     """
-    Function that process uploaded receiverfiles
+    Write an uploaded file to its destination
 
-    :param state: A reference to the application state
-    :param files_maps: descriptors of whistleblower files to be processed
+    The file is written aside and renamed to its destination only once
+    complete so that a destination never contains a partial file.
+
+    :param sf: The temporary file uploaded
+    :param dst: The path of the destination
+    :param key: The public key of the tip, if the file is to be encrypted
+    :param pgp_key_public: The PGP key, if the file is to be encrypted with PGP
+    :return: The number of bytes delivered
     """
-    for a, m in files_maps.items():
-        sf = state.get_tmp_file_by_name(m['src'])
+    partial_path = dst + '.part'
 
-        for rcounter, rf in enumerate(m['wbfiles']):
-            try:
-                if m['key']:
-                    write_encrypted_file(m['key'], sf, rf['dst'])
-                elif rf['pgp_key_public']:
-                    with sf.open('rb') as encrypted_file:
-                        PGPContext(rf['pgp_key_public']).encrypt_file(encrypted_file, rf['dst'])
-                else:
-                    write_plaintext_file(sf, rf['dst'])
-            except:
-                pass
+    try:
+        if key:
+            write_encrypted_file(key, sf, partial_path)
+        elif pgp_key_public:
+            with sf.open('rb') as encrypted_file:
+                get_pgp_context(pgp_key_public).encrypt_file(encrypted_file, partial_path)
+        else:
+            write_plaintext_file(sf, partial_path)
+
+        os.replace(partial_path, dst)
+    except:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
 
+        raise
 
-def process_whistleblowerfiles(state, files_maps):
+    return sf.size
+
+
+def get_receiverfiles_deliveries(files_maps):
     """
-    Function that process uploaded whistleblowerfiles
+    Return the deliveries of the uploaded receiverfiles
+
+    All the receivers of a file share the same destination, so each file is
+    written only once following the configuration of its last receiver.
 
-    :param state: A reference to the application state
     :param files_maps: descriptors of whistleblower files to be processed
+    :return: A list of tuples (model name, file descriptor, arguments of deliver_file)
     """
-    for _, m in files_maps.items():
-        try:
-            sf = state.get_tmp_file_by_name(m['src'])
+    deliveries = []
 
-            if m['key']:
-                write_encrypted_file(m['key'], sf, m['dst'])
-            else:
-                write_plaintext_file(sf, m['dst'])
-        except:
-            pass
+    for file_id, m in files_maps.items():
+        outputs = {rf['dst']: rf for rf in m['wbfiles']}
+        for dst, rf in outputs.items():
+            deliveries.append(('InternalFile', file_id, m, (dst, m['key'], rf['pgp_key_public'])))
+
+    return deliveries
+
+
+def get_whistleblowerfiles_deliveries(files_maps):
+    """
+    Return the deliveries of the uploaded whistleblowerfiles
+
+    :param files_maps: descriptors of whistleblower files to be processed
+    :return: A list of tuples (model name, file descriptor, arguments of deliver_file)
+    """
+    return [('ReceiverFile', file_id, m, (m['dst'], m['key'])) for file_id, m in files_maps.items()]
 
 
 class Delivery(LoopingJob):
     interval = 5
     monitor_interval = 180
 
+    # Throughput metrics of the deliveries
+    delivered_files = 0
+    delivered_bytes = 0
+    throughput = -1
+
+    # Number of files waiting to be delivered and of failed deliveries
+    backlog = 0
+    failed = 0
+
     @inlineCallbacks
     def operation(self):
         """
         This function creates receiver files
+
+        The files are delivered concurrently in the delivery thread pool; a
+        delivery failed is retried with an exponential backoff until the
+        number of attempts is exhausted.
+        """
+        sizes = {os.path.basename(f.filepath): f.size for f in self.state.TempUploadFiles.values()}
+
+        receiverfiles_maps, whistleblowerfiles_maps, stats = yield file_delivery(sizes)
+        self.backlog, self.failed = stats['backlog'], stats['failed']
+
+        deliveries = get_receiverfiles_deliveries(receiverfiles_maps) + \
+                     get_whistleblowerfiles_deliveries(whistleblowerfiles_maps)
+
+        if not deliveries:
+            return
+
+        start_time = time.time()
+
+        results = yield gatherResults([self.deliver(*delivery) for delivery in deliveries])
+
+        # The files without destinations, as the ones of tips without
+        # receivers, are delivered with nothing to write
+        results += [('InternalFile', file_id, 'delivered', 0)
+                    for file_id, m in receiverfiles_maps.items() if not m['wbfiles']]
+
+        stats = yield update_delivery_states([result[:3] for result in results])
+        self.backlog, self.failed = stats['backlog'], stats['failed']
+
+        sizes = [result[3] for result in results if result[2] == 'delivered']
+        self.update_metrics(len(sizes), sum(sizes), time.time() - start_time)
+
+    def deliver(self, model_name, file_id, m, args):
         """
-        receiverfiles_maps, whistleblowerfiles_maps = yield file_delivery()
+        Deliver a file in the delivery thread pool
 
-        process_receiverfiles(self.state, receiverfiles_maps)
-        process_whistleblowerfiles(self.state, whistleblowerfiles_maps)
+        :return: A deferred fired with a tuple (model name, file id, delivery state, size)
+        """
+        sf = self.state.get_tmp_file_by_name(m['src'], remove=False)
+        if sf is None:
+            # The upload is lost, as when the process is restarted, but the
+            # file could have been completed before
+            state = 'delivered' if os.path.exists(args[0]) else 'failed'
+            if state == 'failed':
+                log.err("Unable to deliver file %s: the upload is no longer available", args[0])
+
+            return succeed((model_name, file_id, state, 0))
+
+        def on_success(size):
+            # The temporary file is removed once delivered
+            sf = self.state.get_tmp_file_by_name(m['src'])
+            if sf is not None:
+                sf.remove()
+            return model_name, file_id, 'delivered', size
+
+        def on_error(failure):
+            state = 'pending' if m['attempts'] < MAX_ATTEMPTS else 'failed'
+            log.err("Unable to deliver file %s (attempt %d/%d): %s",
+                    args[0], m['attempts'], MAX_ATTEMPTS, failure.getErrorMessage())
+            return model_name, file_id, state, 0
+
+        d = deferToThreadPool(reactor, self.state.delivery_tp, deliver_file, sf, *args)
+        d.addCallbacks(on_success, on_error)
+        return d
+
+    def update_metrics(self, files, size, duration):
+        self.delivered_files += files
+        self.delivered_bytes += size
+
+        throughput = size / max(duration, 0.001)
+        if self.throughput == -1:
+            self.throughput = throughput
+        else:
+            self.throughput = (self.throughput * 0.7) + (throughput * 0.3)
+
+        log.debug("Delivered %d files (%d bytes) in %.3f seconds [%d bytes/s]",
+                  files, size, duration, throughput)
+
+    def get_metrics(self):
+        return {
+            'backlog': self.backlog,
+            'failed': self.failed,
+            'delivered_files': self.delivered_files,
+            'delivered_bytes': self.delivered_bytes,
+            'throughput': self.throughput
+        }
@@ -54,6 +54,9 @@ class Job(task.LoopingCall):
         self.end()
 
     def begin(self):
+        # Align the cached data to the changes applied by the other processes
+        self.state.check_generations()
+
         self.active = defer.Deferred()
         self.start_time = int(time.time() * 1000)
 
@@ -76,6 +79,8 @@ class Job(task.LoopingCall):
         if self.high_time == -1 or current_run_time > self.high_time:
             self.high_time = current_run_time
 
+        self.state.publish_jobs_status()
+
         self.active.callback(None)
         self.active = None
 
@@ -85,6 +90,19 @@ class Job(task.LoopingCall):
     def get_delay(self):
         return 0
 
+    def get_metrics(self):
+        """
+        Return the metrics specific to the job exposed with its timings
+        """
+        return {}
+
+    def get_status(self):
+        return {
+            'name': self.name,
+            'timings': self.last_executions,
+            'metrics': self.get_metrics()
+        }
+
     def on_error(self, excep):
         log.err("Exception while running %s" % self.name)
         log.exception(excep)
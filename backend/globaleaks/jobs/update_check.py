@@ -9,7 +9,6 @@ from globaleaks.handlers.admin.user import db_get_users
 from globaleaks.jobs.job import HourlyJob
 from globaleaks.models.config import ConfigFactory
 from globaleaks.orm import transact
-from globaleaks.rest.cache import Cache
 from globaleaks.utils.agent import get_page
 from globaleaks.utils.log import log
 
@@ -51,7 +50,7 @@ def evaluate_update_notification(session, state, latest_version):
     if parse_version(stored_latest) >= parse_version(latest_version):
         return
 
-    Cache.invalidate()
+    state.invalidate_cache()
 
     priv_fact.set_val('latest_version', latest_version)
 
@@ -588,12 +588,15 @@ class _InternalFile(Model):
     name = Column(UnicodeText, nullable=False)
     content_type = Column(JSON, default='', nullable=False)
     size = Column(JSON, default='', nullable=False)
-    new = Column(Boolean, default=True, nullable=False)
     reference_id = Column(UnicodeText(36), default='', nullable=False)
+    delivery_state = Column(Enum(EnumDeliveryState), default='pending', nullable=False)
+    delivery_attempts = Column(Integer, default=0, nullable=False)
+    delivery_date = Column(DateTime, default=datetime_null, nullable=False)
 
     @declared_attr
     def __table_args__(self):
-        return ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+        return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                CheckConstraint(self.delivery_state.in_(EnumDeliveryState.keys())))
 
 
 class _InternalTip(Model):
@@ -623,6 +626,7 @@ class _InternalTip(Model):
     substatus = Column(UnicodeText(36))
     receipt_change_needed = Column(Boolean, default=False, nullable=False)
     receipt_hash = Column(UnicodeText(44), nullable=False)
+    legacy_receipt = Column(Boolean, default=False, nullable=False)
     crypto_prv_key = Column(UnicodeText(84), default='', nullable=False)
     crypto_pub_key = Column(UnicodeText(56), default='', nullable=False)
     crypto_tip_pub_key = Column(UnicodeText(56), default='', nullable=False)
@@ -1025,12 +1029,15 @@ class _ReceiverFile(Model):
     access_date = Column(DateTime, default=datetime_null, nullable=False)
     description = Column(UnicodeText, default="", nullable=False)
     visibility = Column(Enum(EnumVisibility), default='public', nullable=False)
-    new = Column(Boolean, default=True, nullable=False)
+    delivery_state = Column(Enum(EnumDeliveryState), default='pending', nullable=False)
+    delivery_attempts = Column(Integer, default=0, nullable=False)
+    delivery_date = Column(DateTime, default=datetime_null, nullable=False)
 
     @declared_attr
     def __table_args__(self):
         return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
-                CheckConstraint(self.visibility.in_(EnumVisibility.keys())))
+                CheckConstraint(self.visibility.in_(EnumVisibility.keys())),
+                CheckConstraint(self.delivery_state.in_(EnumDeliveryState.keys())))
 
 
 class ArchivedSchema(_ArchivedSchema, Base):
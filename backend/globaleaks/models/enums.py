@@ -21,6 +21,13 @@ class EnumFieldInstance(_Enum):
     reference = 2
 
 
+class EnumDeliveryState(_Enum):
+    pending = 0
+    processing = 1
+    delivered = 2
+    failed = 3
+
+
 class EnumFieldAttrType(_Enum):
     int = 0
     bool = 1
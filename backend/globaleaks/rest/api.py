@@ -37,6 +37,8 @@ from globaleaks.handlers import admin, \
                                 whistleblower
 
 from globaleaks.rest import decorators, errors
+from globaleaks.rest.cache import Cache
+from globaleaks.rest.router import Router
 from globaleaks.state import State, extract_exception_traceback_and_schedule_email
 from globaleaks.utils.json import JSONEncoder
 from globaleaks.utils.sock import isIPAddress
@@ -169,7 +171,7 @@ api_spec = [
 
 
 class APIResourceWrapper(Resource):
-    _registry = None
+    router = None
     isLeaf = True
     method_map = {
       'delete': 200,
@@ -182,7 +184,7 @@ class APIResourceWrapper(Resource):
 
     def __init__(self):
         Resource.__init__(self)
-        self._registry = []
+        self.router = Router()
         self.handler = None
 
         for tup in api_spec:
@@ -192,12 +194,6 @@ class APIResourceWrapper(Resource):
             else:
                 pattern, handler, args = tup
 
-            if not pattern.startswith("^"):
-                pattern = "^" + pattern
-
-            if not pattern.endswith("$"):
-                pattern += "$"
-
             if not hasattr(handler, '_decorated'):
                 handler._decorated = True
                 for m in ['delete', 'get', 'put', 'post']:
@@ -205,7 +201,7 @@ class APIResourceWrapper(Resource):
                     if hasattr(handler, m):
                         decorators.decorate_method(handler, m)
 
-            self._registry.append((re.compile(pattern), handler, args))
+            self.router.add(pattern, handler, args)
 
     def should_redirect_https(self, request):
         if request.isSecure() or \
@@ -286,6 +282,9 @@ class APIResourceWrapper(Resource):
 
         :return: empty `str` or `NOT_DONE_YET`
         """
+        # Align the cached data to the changes applied by the other processes
+        State.check_generations()
+
         request.hostname = request.getRequestHostname()
         request.port = request.getHost().port
         request.headers = request.getAllHeaders()
@@ -382,19 +381,13 @@ class APIResourceWrapper(Resource):
             request.redirect(State.tenants[request.tid].cache['redirects'][request_path])
             return b''
 
-        match = None
-        for regexp, handler, args in self._registry:
-            try:
-                match = regexp.match(request_path)
-            except UnicodeDecodeError:
-                match = None
-            if match:
-                break
-
-        if match is None:
+        route, groups = self.router.resolve(request_path)
+        if route is None:
             self.handle_exception(errors.ResourceNotFound, request)
             return b''
 
+        handler = route.handler
+
         method = request.method.lower().decode()
 
         if method == 'head':
@@ -407,10 +400,18 @@ class APIResourceWrapper(Resource):
             self.handle_exception(errors.MethodNotImplemented, request)
             return b''
 
+        if method == 'get' and handler.cache_resource and \
+                State.settings.enable_api_cache and b'if-none-match' in request.headers:
+            entry = Cache.get_not_modified(request.tid, request.path, request.language,
+                                           request.headers[b'if-none-match'])
+            if entry is not None:
+                decorators.serve_cache_entry(request, entry)
+                request.setResponseCode(304)
+                return b''
+
         f = getattr(handler, method)
-        groups = match.groups()
 
-        self.handler = handler(State, request, **args)
+        self.handler = handler(State, request, **route.args)
 
         request.setResponseCode(self.method_map[method])
 
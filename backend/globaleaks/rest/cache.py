@@ -1,31 +1,314 @@
 # -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Content encodings of the cached responses in order of preference
+ENCODINGS = OrderedDict()
+
+if brotli is not None:
+    ENCODINGS['br'] = lambda data: brotli.compress(data, quality=11)
+
+if zstandard is not None:
+    ENCODINGS['zstd'] = lambda data: zstandard.ZstdCompressor(level=19).compress(data)
+
+ENCODINGS['gzip'] = lambda data: gzip.compress(data, 9)
+
+# Dependency recorded by the invalidations of all the data of a tenant
+ALL_DEPENDENCIES = '*'
+
+# Dependencies whose data is never inherited from the root tenant by the other tenants
+TENANT_LOCAL_DEPENDENCIES = frozenset({'Context', 'Redirect', 'SubmissionStatus', 'User'})
+
+
+class Generations(object):
+    """
+    Generation counters of the cached data of the tenants
+
+    Every invalidation of the data of a tenant is assigned a number of a
+    monotonically increasing sequence; each process keeps track of the last
+    sequence number observed and reloads only the data changed since then.
+
+    Counters are kept per tenant and per dependency, that is the name of the
+    model or of the set of models changed.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.tenants = {}
+
+    def bump(self, tid, dependencies=None):
+        with self.lock:
+            self.sequence += 1
+            for dependency in dependencies or (ALL_DEPENDENCIES,):
+                self.tenants[(tid, dependency)] = self.sequence
+
+            return self.sequence
+
+    def get_sequence(self):
+        return self.sequence
+
+    def changed_since(self, sequence):
+        """
+        :return: The sorted list of the tuples (tid, dependency) changed since the specified sequence number
+        """
+        with self.lock:
+            return sorted(key for key, value in self.tenants.items() if value > sequence)
+
+
+def select_encoding(accept_encoding, encodings=None):
+    """
+    Select the content encoding of a response
+
+    :param accept_encoding: The value of the Accept-Encoding header of the request
+    :param encodings: The available encodings in order of preference; by default the ones of the cache
+    :return: The preferred encoding among the ones accepted by the client or None for identity
+    """
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        parts = item.split(';')
+        q = 1.0
+        for param in parts[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0
+
+        qvalues[parts[0].strip().lower()] = q
+
+    selected, selected_q = None, qvalues.get('identity', 0.001)
+    for encoding in ENCODINGS if encodings is None else encodings:
+        q = qvalues.get(encoding, qvalues.get('*', 0))
+        if q > selected_q:
+            selected, selected_q = encoding, q
+
+    return selected
+
+
+def match_etags(if_none_match, etags):
+    """
+    Check if the value of an If-None-Match header matches any of the specified entity tags
+
+    As for the conditional GET requests the comparison is weak.
+    """
+    if not if_none_match:
+        return False
+
+    for etag in if_none_match.split(b','):
+        etag = etag.strip()
+        if etag.startswith(b'W/'):
+            etag = etag[2:]
+
+        if etag == b'*' or etag in etags:
+            return True
+
+    return False
+
+
+class CacheEntry(object):
+    """
+    Cached response of a resource
+
+    The body is kept together with its variants compressed with each of the
+    supported encodings and with the strong entity tags identifying them.
+    As the compression happens once per entry, the highest compression
+    levels are used.
+    """
+    __slots__ = ('content_type', 'data', 'etag', 'variants', 'size', 'dependencies')
+
+    def __init__(self, content_type, data, dependencies=None):
+        if isinstance(data, str):
+            data = data.encode()
+
+        digest = hashlib.sha256(data).hexdigest()[:32].encode()
+
+        self.content_type = content_type
+        self.data = data
+        self.etag = b'"' + digest + b'"'
+        self.variants = {}
+        self.size = len(data)
+        self.dependencies = frozenset(dependencies) if dependencies is not None else None
+
+        for encoding, compress in ENCODINGS.items():
+            variant = compress(data)
+            self.variants[encoding] = (variant, b'"' + digest + b'-' + encoding.encode() + b'"')
+            self.size += len(variant)
+
+    def get_variant(self, encoding):
+        """
+        :param encoding: A content encoding or None for identity
+        :return: A tuple (body, etag) of the variant of the response
+        """
+        if encoding is None:
+            return self.data, self.etag
+
+        return self.variants[encoding]
+
+    def depends_on(self, dependencies):
+        """
+        Check if the entry depends on any of the specified dependencies
+
+        Entries with unknown dependencies and invalidations of unknown
+        dependencies are considered related.
+        """
+        return self.dependencies is None or dependencies is None or \
+            ALL_DEPENDENCIES in dependencies or not self.dependencies.isdisjoint(dependencies)
+
+    def match(self, if_none_match):
+        """
+        Check if the value of an If-None-Match header matches the entry
+
+        :param if_none_match: The value of the header
+        :return: True if the client already has the current version of the resource
+        """
+        return match_etags(if_none_match, [self.etag] + [variant[1] for variant in self.variants.values()])
+
+
 class Cache(object):
-    memory_cache_dict = {}
+    """
+    Cache of the responses of the resources whose content depends only on the
+    tenant and on the language
+
+    The cache is bounded to max_size bytes; the entries least recently used
+    are evicted to make room for the new ones.
+
+    Entries are tagged with the dependencies declared by the handlers
+    producing them so that the changes of a model invalidate only the
+    resources built from it.
+    """
+    max_size = 64 * 1024 * 1024
+
+    lock = threading.RLock()
+    entries = OrderedDict()
+    tenants = {}
+    size = 0
+    counters = {}
+    invalidations = 0
+
+    @classmethod
+    def _count(cls, tid, counter):
+        if tid not in cls.counters:
+            cls.counters[tid] = {'hits': 0, 'misses': 0, 'evictions': 0, 'not_modified': 0}
+
+        cls.counters[tid][counter] += 1
+
+    @classmethod
+    def _remove(cls, key):
+        entry = cls.entries.pop(key)
+        cls.size -= entry.size
+
+        keys = cls.tenants[key[0]]
+        keys.discard(key)
+        if not keys:
+            del cls.tenants[key[0]]
 
     @classmethod
     def get(cls, tid, resource, language):
-        if tid in cls.memory_cache_dict \
-           and resource in cls.memory_cache_dict[tid] \
-           and language in cls.memory_cache_dict[tid][resource]:
-            return cls.memory_cache_dict[tid][resource][language]
+        key = (tid, resource, language)
+
+        with cls.lock:
+            entry = cls.entries.get(key)
+            if entry is None:
+                cls._count(tid, 'misses')
+                return
+
+            cls.entries.move_to_end(key)
+            cls._count(tid, 'hits')
+            return entry
+
+    @classmethod
+    def get_not_modified(cls, tid, resource, language, if_none_match):
+        """
+        Return the entry of a resource if it matches the If-None-Match header of a request
+        """
+        key = (tid, resource, language)
+
+        with cls.lock:
+            entry = cls.entries.get(key)
+            if entry is None or not entry.match(if_none_match):
+                return
+
+            cls.entries.move_to_end(key)
+            cls._count(tid, 'hits')
+            cls._count(tid, 'not_modified')
+            return entry
+
+    @classmethod
+    def set(cls, tid, resource, language, content_type, data, dependencies=None):
+        return cls.store(tid, resource, language, CacheEntry(content_type, data, dependencies))
 
     @classmethod
-    def set(cls, tid, resource, language, content_type, data):
-        if tid not in Cache.memory_cache_dict:
-            cls.memory_cache_dict[tid] = {}
+    def store(cls, tid, resource, language, entry):
+        key = (tid, resource, language)
 
-        if resource not in Cache.memory_cache_dict[tid]:
-            cls.memory_cache_dict[tid][resource] = {}
+        with cls.lock:
+            if key in cls.entries:
+                cls._remove(key)
 
-        entry = (content_type, data)
+            if entry.size > cls.max_size:
+                return entry
 
-        cls.memory_cache_dict[tid][resource][language] = entry
+            while cls.size + entry.size > cls.max_size:
+                evicted = next(iter(cls.entries))
+                cls._remove(evicted)
+                cls._count(evicted[0], 'evictions')
+
+            cls.entries[key] = entry
+            cls.tenants.setdefault(tid, set()).add(key)
+            cls.size += entry.size
 
         return entry
 
     @classmethod
-    def invalidate(cls, tid=1):
-        if tid == 1:
-            cls.memory_cache_dict.clear()
-        else:
-            cls.memory_cache_dict.pop(tid, None)
+    def invalidate(cls, tid=1, dependencies=None):
+        """
+        Invalidate the entries of a tenant depending on the specified dependencies
+
+        As the other tenants may inherit the data of the root tenant, the
+        invalidation of the root tenant applies to all the tenants unless
+        only tenant local dependencies are specified.
+
+        :param tid: A tenant ID
+        :param dependencies: A collection of dependencies or None to invalidate all the entries
+        """
+        with cls.lock:
+            cls.invalidations += 1
+
+            if tid == 1 and dependencies is None:
+                cls.entries.clear()
+                cls.tenants.clear()
+                cls.size = 0
+                return
+
+            if tid == 1 and not TENANT_LOCAL_DEPENDENCIES.issuperset(dependencies):
+                keys = list(cls.entries)
+            else:
+                keys = list(cls.tenants.get(tid, ()))
+
+            for key in keys:
+                if cls.entries[key].depends_on(dependencies):
+                    cls._remove(key)
+
+    @classmethod
+    def stats(cls):
+        with cls.lock:
+            return {
+                'size': cls.size,
+                'max_size': cls.max_size,
+                'entries': len(cls.entries),
+                'tenants': {tid: dict(counters) for tid, counters in cls.counters.items()}
+            }
@@ -2,17 +2,20 @@
 import json
 
 from datetime import timedelta
-from twisted.internet import defer
-from twisted.internet.threads import deferToThread
+from twisted.internet import defer, threads
 
-from globaleaks.db import sync_refresh_tenant_cache
+from globaleaks.handlers.base import set_content_encoding
 from globaleaks.rest import errors
-from globaleaks.rest.cache import Cache
+from globaleaks.rest.cache import Cache, CacheEntry, select_encoding
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
 from globaleaks.utils.json import JSONEncoder
 from globaleaks.utils.tempdict import TempDict
 from globaleaks.utils.utility import datetime_now, deferred_sleep
 
+# Waiters of the resources being generated after a miss of the cache
+cache_get_in_flight = {}
+
 
 def decorator_qos(f):
     # Decorator that keeps alternating request on different tenants giving:
@@ -62,6 +65,7 @@ def decorator_rate_limit(f):
                 self.session.ratelimit_count = 0
 
             self.session.ratelimit_count += 1
+            Sessions.save(self.session)
 
             if self.session.ratelimit_count > 5:
                 d = deferred_sleep(self.session.ratelimit_count // 5)
@@ -108,12 +112,46 @@ def decorator_authentication(f, roles):
     return wrapper
 
 
+def serve_cache_entry(request, entry):
+    """
+    Set the headers of a response served from the cache and return its body
+
+    The variant of the body compressed with the encoding preferred by the
+    client is served as is, bypassing the compression on the fly.
+    """
+    encoding = select_encoding((request.getHeader(b'accept-encoding') or b'').decode('latin-1'))
+    data, etag = entry.get_variant(encoding)
+
+    set_content_encoding(request, encoding)
+    request.setHeader(b'Content-type', entry.content_type)
+    request.setHeader(b'Vary', b'Accept-Encoding')
+    request.setHeader(b'ETag', etag)
+
+    return data
+
+
 def decorator_cache_get(f):
     # Decorator that checks if the requests resource is cached
+    #
+    # Concurrent requests missing the cache for the same resource wait for
+    # the response generated for the first one instead of generating it again
     def wrapper(self, *args, **kwargs):
-        c = Cache.get(self.request.tid, self.request.path, self.request.language)
-        if c is None:
-            d = defer.maybeDeferred(f, self, *args, **kwargs)
+        key = (self.request.tid, self.request.path, self.request.language)
+
+        c = Cache.get(*key)
+        if c is not None:
+            return serve_cache_entry(self.request, c)
+
+        # Each request waits on its own deferred so that it could be cancelled independently
+        d = defer.Deferred()
+        d.addCallback(lambda entry: serve_cache_entry(self.request, entry))
+
+        waiters = cache_get_in_flight.get(key)
+        if waiters is not None:
+            waiters.append(d)
+        else:
+            waiters = cache_get_in_flight[key] = [d]
+            invalidations = Cache.invalidations
 
             def callback(data):
                 if isinstance(data, (dict, list)):
@@ -121,16 +159,26 @@ def decorator_cache_get(f):
                     data = json.dumps(data, cls=JSONEncoder)
 
                 c = self.request.responseHeaders.getRawHeaders(b'Content-type', [b'application/json'])[0]
-                return Cache.set(self.request.tid, self.request.path, self.request.language, c, data)[1]
 
-            d.addCallback(callback)
+                # The compression of the variants is performed out of the reactor
+                return threads.deferToThread(CacheEntry, c, data, self.cache_dependencies)
 
-            return d
+            def store(entry):
+                # The response is not cached if it could have been built on data invalidated meanwhile
+                if Cache.invalidations == invalidations:
+                    Cache.store(*key, entry)
 
-        else:
-            self.request.setHeader(b'Content-type', c[0])
+                return entry
 
-        return c[1]
+            def release(result):
+                del cache_get_in_flight[key]
+
+                for waiter in waiters:
+                    waiter.callback(result)
+
+            defer.maybeDeferred(f, self, *args, **kwargs).addCallback(callback).addCallback(store).addBoth(release)
+
+        return d
 
     return wrapper
 
@@ -141,8 +189,7 @@ def decorator_cache_invalidate(f):
 
         if self.invalidate_cache:
             def callback(result):
-                Cache.invalidate(self.request.tid)
-                deferToThread(sync_refresh_tenant_cache, self.request.tid)
+                State.invalidate_cache(self.request.tid, self.invalidate_cache_dependencies)
                 return result
 
             d.addCallback(callback)
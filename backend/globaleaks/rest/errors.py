@@ -187,3 +187,9 @@ class DuplicateUserError(GLException):
     reason = "A user with this username already exists"
     error_code = 17
     status_code = 422
+
+
+class RangeNotSatisfiable(GLException):
+    reason = "The requested range is not satisfiable"
+    error_code = 18
+    status_code = 416
@@ -11,6 +11,7 @@ import copy
 
 from globaleaks import models
 from globaleaks.models.config_desc import ConfigL10NFilters
+from globaleaks.rest.validator import compile_templates
 
 alphanumeric_str_regexp = r'^[^<>\/.{}\[\]]*$'
 phone_regexp = r'^[+]?[0-9]*$'
@@ -570,3 +571,6 @@ SubmissionSubStatusDesc = {
 SessionUpdateDesc = {
     'token': str
 }
+
+
+compile_templates(globals())
@@ -0,0 +1,179 @@
+# -*- coding: utf-8
+#   router
+#   ******
+#
+# Resolution of the request paths to the handlers of the API.
+#
+# Routes without parameters are resolved with a dictionary lookup; the others
+# are attached to a tree of the path segments of their literal prefix so that
+# only the regular expressions of the routes sharing the prefix of the path are
+# tried, in the order of their declaration.
+import re
+
+# Characters having a special meaning in the regular expressions of the routes
+REGEXP_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+
+# Quantifiers making the atom preceding them optional
+REGEXP_OPTIONAL_QUANTIFIERS = set('?*{')
+
+
+def has_top_level_alternation(pattern):
+    """
+    Return True if a pattern contains an alternation outside of any group
+    """
+    depth = 0
+    in_class = False
+    escaped = False
+
+    for c in pattern:
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+
+    return False
+
+
+def get_literal_prefix(pattern):
+    """
+    Return the literal prefix of a pattern, that is the part required at the
+    beginning of every path matched by the pattern
+
+    The prefix ends at the first special character, excluding the character
+    made optional by a quantifier; the patterns with a top-level alternation
+    have no prefix.
+    """
+    if has_top_level_alternation(pattern):
+        return ''
+
+    for i, c in enumerate(pattern):
+        if c in REGEXP_SPECIAL_CHARS:
+            if c in REGEXP_OPTIONAL_QUANTIFIERS:
+                i -= 1
+
+            return pattern[:i]
+
+    return pattern
+
+
+class Route(object):
+    __slots__ = ('index', 'pattern', 'prefix', 'regexp', 'handler', 'args', 'hits')
+
+    def __init__(self, index, pattern, handler, args):
+        self.index = index
+        self.pattern = pattern
+        self.handler = handler
+        self.args = args
+        self.hits = 0
+
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+
+        if pattern.endswith('$'):
+            pattern = pattern[:-1]
+
+        self.prefix = get_literal_prefix(pattern)
+        self.regexp = re.compile('^' + pattern + '$') if self.prefix != pattern else None
+
+
+class RouteNode(object):
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+
+
+class Router(object):
+    """
+    Map of the request paths to the handlers of the API
+
+    The result of the resolution is the same of trying the regular expressions
+    of the routes one by one in the order of their declaration.
+    """
+    def __init__(self, spec=()):
+        self.routes = []
+        self.exact = {}
+        self.tree = RouteNode()
+
+        for entry in spec:
+            self.add(*entry)
+
+    def add(self, pattern, handler, args=None):
+        route = Route(len(self.routes), pattern, handler, args or {})
+        self.routes.append(route)
+
+        if route.regexp is None:
+            self.exact.setdefault(route.prefix, route)
+            return
+
+        # Routes are attached to the node of the complete segments of their prefix
+        node = self.tree
+        for segment in route.prefix.split('/')[:-1]:
+            node = node.children.setdefault(segment, RouteNode())
+
+        node.routes.append(route)
+
+    def get_candidates(self, path):
+        """
+        Return the parametric routes whose literal prefix is a prefix of the path
+        """
+        candidates = []
+
+        node = self.tree
+        for segment in path.split('/')[:-1]:
+            candidates.extend(node.routes)
+            node = node.children.get(segment)
+            if node is None:
+                break
+        else:
+            candidates.extend(node.routes)
+
+        candidates.sort(key=lambda route: route.index)
+
+        return candidates
+
+    def resolve(self, path):
+        """
+        Resolve a request path
+
+        :param path: The path of the request
+        :return: A tuple (route, groups) or (None, None) if no route matches the path
+        """
+        exact = self.exact.get(path)
+
+        for route in self.get_candidates(path):
+            if exact is not None and exact.index < route.index:
+                break
+
+            if not path.startswith(route.prefix):
+                continue
+
+            match = route.regexp.match(path)
+            if match is not None:
+                route.hits += 1
+                return route, match.groups()
+
+        if exact is not None:
+            exact.hits += 1
+            return exact, ()
+
+        return None, None
+
+    def stats(self):
+        return [{
+            'pattern': route.pattern,
+            'handler': route.handler.__name__,
+            'hits': route.hits
+        } for route in sorted(self.routes, key=lambda route: route.hits, reverse=True)]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8
+#   site
+#   ****
+#
+# HTTP site serving the API, shared by the main process and by the workers
+from twisted.web import resource, server
+
+from globaleaks.handlers.staticfile import get_manifest
+from globaleaks.rest.api import APIResourceWrapper
+from globaleaks.settings import Settings
+from globaleaks.utils.log import openLogFile, logFormatter
+
+
+# Set Gzip Encoder compression level to 1 prioritizing speed over compression
+server.GzipEncoderFactory.compressLevel = 1
+
+
+class Request(server.Request):
+    log_ip_and_ua = False
+
+
+class Site(server.Site):
+    requestFactory = Request
+
+    def _openLogFile(self, path):
+        return openLogFile(path, Settings.log_file_size, Settings.num_log_files)
+
+
+def get_api_factory():
+    # Index the files of the client before serving any request
+    if not Settings.devel_mode:
+        get_manifest(Settings.client_path)
+
+    arw = resource.EncodingResourceWrapper(APIResourceWrapper(), [server.GzipEncoderFactory()])
+    api_factory = Site(arw, logPath=Settings.accesslogfile, logFormatter=logFormatter)
+    api_factory.displayTracebacks = False
+    return api_factory
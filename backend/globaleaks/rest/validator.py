@@ -0,0 +1,214 @@
+# -*- coding: utf-8
+#   validator
+#   *********
+#
+# Compilation of the request templates of globaleaks.rest.requests into trees
+# of validation functions.
+#
+# Each template is walked only once: regular expressions are compiled, the
+# dispatch on the kind of each type is resolved in advance and every request
+# is then checked by calling the resulting closures.
+import json
+import re
+
+from globaleaks.rest import errors
+from globaleaks.utils.log import log
+
+# Validators of the templates compiled by compile_templates
+_validators = {}
+
+
+def _compile_python_type(python_type):
+    if python_type == int:
+        def validate(value):
+            try:
+                int(value)
+                return True
+            except:
+                return False
+
+    elif python_type == bool:
+        def validate(value):
+            return value == 'true' or value == 'false' or isinstance(value, bool)
+
+    else:
+        def validate(value):
+            return isinstance(value, python_type)
+
+    return validate
+
+
+def _compile_regexp(regexp):
+    match = re.compile(regexp).match
+
+    def validate(value):
+        return match(value) is not None
+
+    return validate
+
+
+def _compile_dict(template):
+    validate_request = compile_request(template)
+
+    def validate(value):
+        return bool(validate_request(value))
+
+    return validate
+
+
+def _compile_list(template):
+    if not template:
+        # A list without the type of its items accepts only empty lists
+        def validate(value):
+            return not value
+
+        return validate
+
+    validate_item = compile_type(template[0])
+
+    def validate(value):
+        if not value:
+            return True
+
+        for item in value:
+            if not validate_item(item):
+                return False
+
+        return True
+
+    return validate
+
+
+def compile_type(type):
+    """
+    Compile the type of a value of a request template
+
+    :param type: A python type, a regexp, a request template or a list containing the type of the items
+    :return: A function returning True if a value is of the specified type
+    """
+    if callable(type):
+        validate = _compile_python_type(type)
+    elif isinstance(type, dict):
+        validate = _compile_dict(type)
+    elif isinstance(type, str):
+        validate = _compile_regexp(type)
+    elif isinstance(type, list):
+        validate = _compile_list(type)
+    else:
+        def validate(value):
+            return False
+
+    def validate_type(value):
+        return value is not None and validate(value)
+
+    return validate_type
+
+
+def _compile_dict_request(template):
+    validators = {key: compile_type(value) for key, value in template.items()}
+
+    # Values of nested templates are validated again as requests when not
+    # received as a dict or a list, requiring them to be valid JSON
+    required = [(key, compile_request(value) if isinstance(value, (dict, list)) and value else None)
+                for key, value in template.items()]
+
+    def validate(request):
+        keys_to_strip = []
+        for key, value in request.items():
+            validate_type = validators.get(key)
+            if validate_type is None:
+                # strip whatever is not validated
+                keys_to_strip.append(key)
+                continue
+
+            if not validate_type(value):
+                log.err("Received key %s: type validation fail", key)
+                raise errors.InputValidationError("Key (%s) type validation failure" % key)
+
+        for key in keys_to_strip:
+            del request[key]
+
+        for key, validate_request in required:
+            if key not in request:
+                log.debug("Key %s expected but missing!", key)
+                raise errors.InputValidationError("Missing key %s" % key)
+
+            if validate_request is not None and not isinstance(request[key], (dict, list)):
+                validate_request(request[key])
+
+    return validate
+
+
+def _compile_list_request(template):
+    if not template:
+        def validate(request):
+            if request:
+                raise errors.InputValidationError("Unexpected elements in %s" % (request,))
+
+        return validate
+
+    validate_item = compile_type(template[0])
+
+    def validate(request):
+        for item in request:
+            if not validate_item(item):
+                raise errors.InputValidationError("Not every element in %s is %s" % (request, template[0]))
+
+    return validate
+
+
+def compile_request(template):
+    """
+    Compile a request template
+
+    :param template: A request template
+    :return: A function taking a request, either parsed or in JSON format, and
+             returning the parsed request stripped of the keys not present in
+             the template; errors.InputValidationError is raised if the
+             request does not conform to the template
+    """
+    if isinstance(template, dict):
+        validate = _compile_dict_request(template)
+    elif isinstance(template, list):
+        validate = _compile_list_request(template)
+    else:
+        validate = None
+
+    def validate_request(request):
+        if not isinstance(request, (dict, list)):
+            try:
+                request = json.loads(request)
+            except:
+                raise errors.InputValidationError
+
+        if validate is not None:
+            validate(request)
+
+        return request
+
+    return validate_request
+
+
+def compile_templates(namespace):
+    """
+    Compile the request templates defined in a namespace
+
+    :param namespace: A dictionary of the request templates
+    """
+    for name, template in namespace.items():
+        if not name.startswith('_') and isinstance(template, (dict, list)):
+            _validators[id(template)] = (template, compile_request(template))
+
+
+def get_request_validator(template):
+    """
+    Return the validator of a request template
+
+    Templates compiled by compile_templates are not compiled again; they are
+    expected not to be changed after their compilation.
+    """
+    compiled = _validators.get(id(template))
+    if compiled is not None and compiled[0] is template:
+        return compiled[1]
+
+    return compile_request(template)
@@ -31,12 +31,12 @@ class Session(dict):
         }
 
     def __getattr__(self, name):
-        if name in self or name == 'attrs':
+        if name in self:
             return self[name]
-        elif name in self.attrs:
-            return self.attrs[name]
+        elif 'attrs' in self and name in self['attrs']:
+            return self['attrs'][name]
         else:
-            raise AttributeError
+            raise AttributeError(name)
 
     def __setattr__(self, name, value):
         if name in self or name == 'attrs':
@@ -79,6 +79,10 @@ class SessionsFactory(TempDict):
     """Extends TempDict to provide session management functions ontop of temp session keys"""
     reset_timeout_on_access = False
 
+    def get_tags(self, session):
+        return ('user:%s:%s' % (session.tid, session.user_id),
+                'tenant:%s' % session.tid)
+
     def get(self, key):
         session = TempDict.get(self, sha256(key))
 
@@ -87,10 +91,30 @@ class SessionsFactory(TempDict):
             decrypted_copy.decrypt(key)
             return decrypted_copy
 
+    def save(self, session):
+        """
+        Write back the changes applied to the attributes of a session
+        """
+        key = session.id if isinstance(session.id, bytes) else sha256(session.id)
+
+        stored = self.backend.get(key)
+        if stored is not None:
+            stored.attrs = session.attrs
+            TempDict.save(self, key, stored)
+
+    def get_user_sessions(self, tid, user_id):
+        """
+        Return the ids of the sessions of the specified user
+        """
+        return self.keys_by_tag('user:%s:%s' % (tid, user_id))
+
     def revoke(self, tid, user_id):
-        for k, v in list(self.items()):
-            if v.tid == tid and v.user_id == user_id:
-                del self[k]
+        for k in self.get_user_sessions(tid, user_id):
+            del self[k]
+
+    def revoke_tenant(self, tid):
+        for k in self.keys_by_tag('tenant:%s' % tid):
+            del self[k]
 
     def new(self, tid, user_id, user_tid, user_role, cc='', ek=''):
         self.revoke(tid, user_id)
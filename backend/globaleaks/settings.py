@@ -42,10 +42,6 @@ class SettingsClass(object, metaclass=Singleton):
 
         self.accept_submissions = True
 
-        # statistical, referred to latest period
-        # and resetted by session_management sched
-        self.failed_login_attempts = {}
-
         self.onionservice = None
 
         # SOCKS default
@@ -83,8 +79,20 @@ class SettingsClass(object, metaclass=Singleton):
 
         self.enable_api_cache = True
 
+        # Backend of the temporary state (sessions, tokens, rate limits):
+        # 'memory' keeps it in the process, 'shared' on a database in the ramdisk
+        self.state_backend = 'memory'
+
+        # Number of processes serving the API
+        self.workers = 1
+
+        # Identifier of the worker process; 0 in the main process
+        self.worker_id = 0
+
     def eval_paths(self):
         self.pidfile_path = os.path.join(self.ramdisk_path, 'globaleaks.pid')
+        self.state_db_path = os.path.join(self.ramdisk_path, 'state.db')
+        self.keyring_path = os.path.join(self.ramdisk_path, 'keyrings')
 
         self.files_path = os.path.abspath(os.path.join(self.working_path, 'files'))
         self.attachments_path = os.path.abspath(os.path.join(self.working_path, 'attachments'))
@@ -93,9 +101,12 @@ class SettingsClass(object, metaclass=Singleton):
 
         self.db_file_path = os.path.abspath(os.path.join(self.working_path, 'globaleaks.db'))
 
+        # Each worker rotates its own log files
+        log_suffix = '.worker%d' % self.worker_id if self.worker_id else ''
+
         self.log_path = os.path.abspath(os.path.join(self.working_path, 'log'))
-        self.logfile = os.path.abspath(os.path.join(self.log_path, 'globaleaks.log'))
-        self.accesslogfile = os.path.abspath(os.path.join(self.log_path, "access.log"))
+        self.logfile = os.path.abspath(os.path.join(self.log_path, 'globaleaks%s.log' % log_suffix))
+        self.accesslogfile = os.path.abspath(os.path.join(self.log_path, "access%s.log" % log_suffix))
 
         # Client path detection
         for path in possible_client_paths:
@@ -126,16 +137,44 @@ class SettingsClass(object, metaclass=Singleton):
         self.nodaemon = options.nodaemon
         self.bind_address = options.ip
         self.migrate_only = options.migrate_only
+        self.state_backend = options.state_backend
+        self.workers = max(1, options.workers)
+
+        if self.workers > 1:
+            # Sessions and tokens need to be accessible by all the workers
+            self.state_backend = 'shared'
 
         if options.devel_mode:
             self.set_devel_mode()
 
         if options.orm_debug:
+            self.orm_debug = True
             enable_orm_debug()
 
         if options.working_path:
             self.working_path = options.working_path
 
+    def serialize(self):
+        """
+        Serialize the settings in order to pass them to the workers
+
+        :return: A dictionary of the settings representable in JSON
+        """
+        return {k: v for k, v in vars(self).items()
+                if v is None or isinstance(v, (bool, int, float, str, list))}
+
+    def load(self, settings):
+        """
+        Load the settings serialized by the main process
+
+        :param settings: A dictionary returned by serialize
+        """
+        for k, v in settings.items():
+            setattr(self, k, v)
+
+        if self.orm_debug:
+            enable_orm_debug()
+
 
 # Settings is a singleton class exported once
 Settings = SettingsClass()
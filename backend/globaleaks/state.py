@@ -8,24 +8,30 @@ from acme.errors import ValidationError
 
 from txtorcon.torcontrolprotocol import TorProtocolError
 from sqlalchemy.exc import OperationalError
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
 from twisted.internet.defer import succeed, AlreadyCalledError, CancelledError
 from twisted.internet.error import ConnectionLost, ConnectionRefusedError, DNSLookupError, NoRouteError, TimeoutError
 from twisted.mail.smtp import SMTPError
 from twisted.python.failure import Failure
+from twisted.python.threadable import isInIOThread
 from twisted.python.threadpool import ThreadPool
 from twisted.web.client import ResponseNeverReceived
 
 from globaleaks import __version__, orm
 from globaleaks.orm import tw
 from globaleaks.rest import errors
+from globaleaks.rest.cache import ALL_DEPENDENCIES, Cache, Generations
 from globaleaks.settings import Settings
 from globaleaks.transactions import db_schedule_email
 from globaleaks.utils.agent import get_tor_agent, get_web_agent
-from globaleaks.utils.crypto import sha256, totpVerify
+from globaleaks.utils.crypto import kdf_pool, set_kdf_thread_pool, sha256, totpVerify
+from globaleaks.utils.filesender import set_file_thread_pool
 from globaleaks.utils.log import log
 from globaleaks.utils.mail import sendmail
 from globaleaks.utils.objectdict import ObjectDict
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import get_pgp_context, set_keyring_path
+from globaleaks.utils.sharedstate import SharedGenerations, SharedJobsStatus, use_shared_backend
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.sni import SNIMap
 from globaleaks.utils.sock import reserve_tcp_socket
@@ -52,12 +58,30 @@ silenced_exceptions = (
   ValidationError
 )
 
+# Models loaded in the cache of the tenants by db_refresh_tenant_cache
+TENANT_CACHE_DEPENDENCIES = {
+  'Config',
+  'EnabledLanguage',
+  'Redirect',
+  'Tenant',
+  'User'
+}
+
+# Pseudo-dependency invalidated when the HTTPS configuration of a tenant
+# changes, requiring to reload its TLS context in the SNI map
+TLS_CONFIG_DEPENDENCY = 'TLSConfig'
+
 
 class RateLimitingStatus(object):
     def __init__(self):
         self.counter = 0
 
 
+class UsedToken(object):
+    def __init__(self, token):
+        self.token = token
+
+
 class RateLimitingDict(TempDict):
     def check(self, key, limit):
         if key not in self:
@@ -69,11 +93,33 @@ class RateLimitingDict(TempDict):
             raise errors.ForbiddenOperation()
 
         status.counter += 1
+        self.save(key, status)
 
 
 RateLimitingTable = RateLimitingDict(3600)
 
 
+class FailedLoginAttemptsDict(TempDict):
+    """
+    Counters of the failed logins of the tenants
+
+    Each counter is reset once the timeout elapses from the first failure.
+    """
+    reset_timeout_on_access = False
+
+    def increment(self, tid):
+        if tid not in self:
+            self[tid] = RateLimitingStatus()
+
+        status = self[tid]
+        status.counter += 1
+        self.save(tid, status)
+
+    def count(self, tid):
+        status = self.get(tid)
+        return status.counter if status is not None else 0
+
+
 class TenantState(object):
     def __init__(self):
         self.cache = ObjectDict()
@@ -94,7 +140,8 @@ class TenantState(object):
 
 class StateClass(ObjectDict, metaclass=Singleton):
     def __init__(self):
-        self.reset_cache = False
+        self.generations = Generations()
+        self.seen_generation = 0
         self.start_time = datetime_now()
         self.settings = Settings
 
@@ -102,10 +149,13 @@ class StateClass(ObjectDict, metaclass=Singleton):
 
         self.https_socks = []
         self.http_socks = []
+        self.workers_socks = []
+        self.workers = None
 
         self.snimap = SNIMap()
 
         self.jobs = []
+        self.jobs_status = None
         self.jobs_monitor = None
         self.services = []
         self.tor = None
@@ -125,11 +175,21 @@ class StateClass(ObjectDict, metaclass=Singleton):
         self.orm_tp = None
         self.set_orm_tp(ThreadPool(4, 16))
 
+        self.kdf_tp = None
+        self.set_kdf_tp(ThreadPool(0, kdf_pool.get_workers(), 'kdf'))
+
+        self.file_tp = None
+        self.set_file_tp(ThreadPool(0, 4, 'file'))
+
+        self.delivery_tp = ThreadPool(0, 4, 'delivery')
+
         self.tokens = TokenList(60)
         self.TempKeys = TempDict(3600 * 72)
         self.TwoFactorTokens = TempDict(120)
         self.TempUploadFiles = TempDict(3600)
         self.RateLimitingTable = RateLimitingDict(3600)
+        self.failed_login_attempts = FailedLoginAttemptsDict(60)
+        self.state_store = None
 
         self.shutdown = False
 
@@ -137,11 +197,44 @@ class StateClass(ObjectDict, metaclass=Singleton):
         os.umask(0o77)
         self.settings.eval_paths()
         self.create_directories()
+        set_keyring_path(self.settings.keyring_path)
+        self.init_state_backend()
+
+    def init_state_backend(self):
+        """
+        Move the temporary state on a store shared by all the processes
+        serving the site when the shared state backend is configured
+        """
+        from globaleaks.sessions import Sessions
+
+        if self.settings.state_backend != 'shared' or self.state_store is not None:
+            return
+
+        self.state_store = use_shared_backend({
+            'sessions': Sessions,
+            'tokens': self.tokens,
+            'two_factor_tokens': self.TwoFactorTokens,
+            'rate_limiting': self.RateLimitingTable,
+            'failed_login_attempts': self.failed_login_attempts,
+            'upload_files': self.TempUploadFiles
+        }, self.settings.state_db_path)
+
+        self.generations = SharedGenerations(self.state_store)
+        self.seen_generation = self.generations.get_sequence()
+        self.jobs_status = SharedJobsStatus(self.state_store)
 
     def set_orm_tp(self, orm_tp):
         self.orm_tp = orm_tp
         orm.set_thread_pool(orm_tp)
 
+    def set_kdf_tp(self, kdf_tp):
+        self.kdf_tp = kdf_tp
+        set_kdf_thread_pool(kdf_tp)
+
+    def set_file_tp(self, file_tp):
+        self.file_tp = file_tp
+        set_file_thread_pool(file_tp)
+
     def get_agent(self):
         if 1 not in self.tenants or self.tenants[1].cache.anonymize_outgoing_connections:
             return get_tor_agent(self.settings.socks_port)
@@ -175,36 +268,119 @@ class StateClass(ObjectDict, metaclass=Singleton):
                         self.settings.files_path,
                         self.settings.attachments_path,
                         self.settings.ramdisk_path,
+                        self.settings.keyring_path,
                         self.settings.tmp_path,
                         self.settings.log_path]:
             self.create_directory(dirpath)
 
     def bind_tcp_ports(self):
-        # Allocate local ports
-        for port in self.settings.bind_local_ports:
-            sock, fail = reserve_tcp_socket('127.0.0.1', port)
-            if fail is not None:
-                log.err("Could not reserve socket for %s (error: %s)",
-                        fail.args[0], fail.args[1])
-                continue
-
-            if port == 8443:
-                self.https_socks += [sock]
-            else:
-                self.http_socks += [sock]
-
-        # Allocate remote ports
-        for port in self.settings.bind_remote_ports:
-            sock, fail = reserve_tcp_socket(self.settings.bind_address, port)
-            if fail is not None:
-                log.err("Could not reserve socket for %s (error: %s)",
-                        fail.args[0], fail.args[1])
-                continue
-
-            if port == 8443:
-                self.https_socks += [sock]
+        # With multiple workers each process listens on its own set of sockets
+        # bound with SO_REUSEPORT so that the kernel balances the connections
+        reuse_port = self.settings.workers > 1
+
+        addresses = [('127.0.0.1', port) for port in self.settings.bind_local_ports] + \
+                    [(self.settings.bind_address, port) for port in self.settings.bind_remote_ports]
+
+        for worker_id in range(self.settings.workers):
+            http_socks, https_socks = [], []
+
+            for ip, port in addresses:
+                sock, fail = reserve_tcp_socket(ip, port, reuse_port)
+                if fail is not None:
+                    log.err("Could not reserve socket for %s (error: %s)",
+                            fail.args[0], fail.args[1])
+                    continue
+
+                if port == 8443:
+                    https_socks += [sock]
+                else:
+                    http_socks += [sock]
+
+            if worker_id == 0:
+                self.http_socks, self.https_socks = http_socks, https_socks
             else:
-                self.http_socks += [sock]
+                self.workers_socks.append((http_socks, https_socks))
+
+    def publish_jobs_status(self):
+        """
+        Publish the status of the jobs to the other processes serving the site
+        """
+        if self.jobs_status is not None:
+            self.jobs_status.set([job.get_status() for job in self.jobs])
+
+    def get_jobs_status(self):
+        """
+        :return: The timings and metrics of the jobs run by the main process
+        """
+        if self.jobs_status is not None:
+            return self.jobs_status.get()
+
+        return [job.get_status() for job in self.jobs]
+
+    def invalidate_cache(self, tid=1, dependencies=None):
+        """
+        Invalidate the cached data of a tenant, or of all the tenants if the
+        root tenant is specified, in all the processes serving the site
+
+        :param tid: A tenant ID
+        :param dependencies: The names of the models changed or None if unknown
+        """
+        self.generations.bump(tid, dependencies)
+
+        if isInIOThread():
+            self.check_generations()
+        else:
+            reactor.callFromThread(self.check_generations)
+
+    def check_generations(self):
+        """
+        Reload the cached data of the tenants changed since the last check
+        """
+        from globaleaks.db import sync_refresh_snimap, sync_refresh_tenant_cache
+
+        sequence = self.generations.get_sequence()
+        if sequence == self.seen_generation:
+            return
+
+        changes = {}
+        for tid, dependency in self.generations.changed_since(self.seen_generation):
+            changes.setdefault(tid, set()).add(dependency)
+
+        self.seen_generation = sequence
+
+        to_refresh = []
+        to_reload = []
+        for tid, dependencies in sorted(changes.items()):
+            if ALL_DEPENDENCIES in dependencies:
+                dependencies = None
+
+            Cache.invalidate(tid, dependencies)
+
+            if dependencies is None or not TENANT_CACHE_DEPENDENCIES.isdisjoint(dependencies):
+                to_refresh.append(tid)
+
+            if dependencies is None or TLS_CONFIG_DEPENDENCY in dependencies:
+                to_reload.append(tid)
+
+        if 1 in to_refresh:
+            to_refresh = [1]
+
+        if 1 in to_reload:
+            to_reload = [1]
+
+        for tid in to_refresh:
+            deferToThread(sync_refresh_tenant_cache, tid)
+
+        for tid in to_reload:
+            deferToThread(sync_refresh_snimap, tid)
+
+    def broadcast(self, message_type, **kwargs):
+        """
+        Notify the other processes serving the site of a change of the state
+        """
+        if self.workers is not None:
+            message = dict(kwargs, type=message_type)
+            reactor.callFromThread(self.workers.broadcast, message)
 
     def print_listening_interfaces(self):
         print("GlobaLeaks is now running and accessible at the following urls:")
@@ -265,7 +441,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
             # unencrypted if one address in the list does not have a public key set.
             if pgp_key_public:
                 try:
-                    body = PGPContext(pgp_key_public).encrypt_message(mail_body)
+                    body = get_pgp_context(pgp_key_public).encrypt_message(mail_body)
                 except:
                     continue
 
@@ -311,7 +487,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
             # Opportunisticly encrypt the mail body. NOTE that mails will go out
             # unencrypted if one address in the list does not have a public key set.
             if pgp_key_public:
-                mail_body = PGPContext(pgp_key_public).encrypt_message(mail_body)
+                mail_body = get_pgp_context(pgp_key_public).encrypt_message(mail_body)
 
             # avoid waiting for the notification to send and instead rely on threads to handle it
             tw(db_schedule_email, 1, mail_address, mail_subject, mail_body)
@@ -321,21 +497,19 @@ class StateClass(ObjectDict, metaclass=Singleton):
 
         db_schedule_email(session, tid, mail_address, mail_subject, mail_body)
 
-    def get_tmp_file_by_name(self, filename):
+    def get_tmp_file_by_name(self, filename, remove=True):
         for k, v in self.TempUploadFiles.items():
             if os.path.basename(v.filepath) == filename:
-                return self.TempUploadFiles.pop(k)
+                return self.TempUploadFiles.pop(k) if remove else v
 
     def update_tor_exits_list(self):
         net_agent = self.get_agent()
         log.debug('Fetching list of Tor exit nodes')
-        return self.tor_exit_set.update(net_agent)
+        d = self.tor_exit_set.update(net_agent)
+        d.addCallback(lambda _: self.broadcast('tor_exit_set', ips=list(self.tor_exit_set)))
+        return d
 
     def totp_verify(self, secret, token):
-        class UsedToken(object):
-            def __init__(self, token):
-               self.token = token
-
         # Check token reuse
         previous_token = self.TwoFactorTokens.get(secret)
         if previous_token and previous_token.token == token:
@@ -7,7 +7,6 @@ from globaleaks.handlers.user import UserInstance
 from globaleaks.handlers.whistleblower.wbtip import WBTipInstance
 from globaleaks.rest import errors
 from globaleaks.sessions import Sessions
-from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.tests import helpers
 
@@ -94,7 +93,7 @@ class TestAuthentication(helpers.TestHandlerWithPopulatedDB):
 
             yield self.assertFailure(handler.post(), errors.InvalidAuthentication)
 
-        self.assertEqual(Settings.failed_login_attempts[1], failed_login)
+        self.assertEqual(State.failed_login_attempts.count(1), failed_login)
 
     @inlineCallbacks
     def test_single_session_per_user(self):
@@ -2,14 +2,16 @@
 from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks import models
 from globaleaks.handlers import auth
 from globaleaks.handlers.user import UserInstance
 from globaleaks.handlers.whistleblower.wbtip import WBTipInstance
+from globaleaks.orm import db_get, transact
 from globaleaks.rest import errors
 from globaleaks.sessions import Sessions
-from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.utils.crypto import Base64Encoder, GCE
 
 
 class TestAuthentication(helpers.TestHandlerWithPopulatedDB):
@@ -70,6 +72,13 @@ class TestAuthentication(helpers.TestHandlerWithPopulatedDB):
         State.tenants[1].cache['https_admin'] = False
         yield self.assertFailure(handler.post(), errors.TorNetworkRequired)
 
+    @inlineCallbacks
+    def test_invalid_login_password_changed_during_verification(self):
+        user = yield auth.get_user_credentials(1, 'admin')
+
+        yield self.assertFailure(auth.db_login(1, user['id'], 'STALEHASH', b''),
+                                 errors.InvalidAuthentication)
+
     @inlineCallbacks
     def test_invalid_login_wrong_password(self):
         handler = self.request({
@@ -94,7 +103,7 @@ class TestAuthentication(helpers.TestHandlerWithPopulatedDB):
 
             yield self.assertFailure(handler.post(), errors.InvalidAuthentication)
 
-        self.assertEqual(Settings.failed_login_attempts[1], failed_login)
+        self.assertEqual(State.failed_login_attempts.count(1), failed_login)
 
     @inlineCallbacks
     def test_single_session_per_user(self):
@@ -196,6 +205,34 @@ class TestReceiptAuth(helpers.TestHandlerWithPopulatedDB):
         })
         yield self.assertFailure(handler.post(), errors.InvalidAuthentication)
 
+    @inlineCallbacks
+    def test_invalid_whistleblower_login_kdf_invocations(self):
+        calls = []
+
+        def defer_kdf(function, *args, **kwargs):
+            calls.append(function)
+            return auth_defer_kdf(function, *args, **kwargs)
+
+        auth_defer_kdf = auth.defer_kdf
+        self.patch(auth, 'defer_kdf', defer_kdf)
+
+        yield self.perform_full_submission_actions()
+
+        handler = self.request({'receipt': 'INVALIDRECEIPT'})
+        yield self.assertFailure(handler.post(), errors.InvalidAuthentication)
+        self.assertEqual(calls, [GCE.derive_receipt])
+
+        @transact
+        def set_legacy_receipt(session):
+            session.query(models.InternalTip).update({'legacy_receipt': True})
+
+        yield set_legacy_receipt()
+
+        del calls[:]
+        handler = self.request({'receipt': 'INVALIDRECEIPT'})
+        yield self.assertFailure(handler.post(), errors.InvalidAuthentication)
+        self.assertEqual(calls, [GCE.derive_receipt, GCE.hash_password])
+
     @inlineCallbacks
     def test_successful_whistleblower_login(self):
         yield self.perform_full_submission_actions()
@@ -206,6 +243,40 @@ class TestReceiptAuth(helpers.TestHandlerWithPopulatedDB):
         response = yield handler.post()
         self.assertTrue('id' in response)
 
+    @inlineCallbacks
+    def test_successful_whistleblower_login_with_legacy_receipt(self):
+        yield self.perform_full_submission_actions()
+
+        receipt_salt = State.tenants[1].cache.receipt_salt
+        legacy_hash = GCE.hash_password(self.lastReceipt, receipt_salt)
+        legacy_key = GCE.derive_key(self.lastReceipt.encode(), receipt_salt)
+
+        @transact
+        def set_legacy_receipt(session):
+            receipt_hash, receipt_key = GCE.derive_receipt(self.lastReceipt, receipt_salt)
+            itip = session.query(models.InternalTip).filter(models.InternalTip.receipt_hash == receipt_hash).one()
+            cc = GCE.symmetric_decrypt(receipt_key, Base64Encoder.decode(itip.crypto_prv_key))
+            itip.receipt_hash = legacy_hash
+            itip.legacy_receipt = True
+            itip.crypto_prv_key = Base64Encoder.encode(GCE.symmetric_encrypt(legacy_key, cc))
+            return itip.id
+
+        itip_id = yield set_legacy_receipt()
+
+        for _ in range(2):
+            handler = self.request({'receipt': self.lastReceipt})
+            response = yield handler.post()
+            self.assertEqual(response['user_id'], itip_id)
+
+        @transact
+        def get_receipt(session):
+            itip = db_get(session, models.InternalTip, models.InternalTip.id == itip_id)
+            return itip.receipt_hash, itip.legacy_receipt
+
+        receipt_hash, legacy_receipt = yield get_receipt()
+        self.assertNotEqual(receipt_hash, legacy_hash)
+        self.assertFalse(legacy_receipt)
+
     @inlineCallbacks
     def test_accept_whistleblower_login_in_https(self):
         yield self.perform_full_submission_actions()
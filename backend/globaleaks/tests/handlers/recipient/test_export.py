@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
+from io import BytesIO
+from zipfile import ZipFile
 
 from globaleaks.handlers.recipient import export
 from globaleaks.jobs.delivery import Delivery
 from globaleaks.tests import helpers
+from globaleaks.utils.pgp import PGPContext
 from twisted.internet.defer import inlineCallbacks
 
 
 class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
     complex_field_population = True
+    pgp_configuration = 'NONE'
     _handler = export.ExportHandler
 
     # All of the setup here is used by the templating that goes into the data.txt file.
@@ -32,3 +36,54 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
 
         yield handler.get(rtips_desc[0]['id'])
         self.assertNotEqual(handler.request.getResponseBody(), b'')
+
+        # The archive is streamed without a declared length
+        self.assertIsNone(handler.request.responseHeaders.getRawHeaders(b'content-length'))
+
+        with ZipFile(BytesIO(handler.request.getResponseBody()), 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertTrue(any(name.startswith('report.') for name in f.namelist()))
+
+
+class TestExportHandlerWithPGP(TestExportHandler):
+    pgp_configuration = 'ALL'
+
+    @inlineCallbacks
+    def test_export(self):
+        rtips_desc = yield self.get_rtips()
+
+        handler = self.request({}, role='receiver')
+        handler.session.user_id = rtips_desc[0]['receiver_id']
+
+        yield handler.get(rtips_desc[0]['id'])
+
+        self.assertIn(b'.zip.pgp', handler.request.responseHeaders.getRawHeaders(b'content-disposition')[0])
+
+        pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+        pgpctx.gnupg.import_keys(helpers.PGPKEYS['VALID_PGP_KEY2_PRV'])
+        decrypted = pgpctx.gnupg.decrypt(handler.request.getResponseBody())
+        self.assertTrue(decrypted.ok)
+
+        with ZipFile(BytesIO(decrypted.data), 'r') as f:
+            self.assertIsNone(f.testzip())
+
+
+class TestPDFReport(helpers.TestGL):
+    def test_pdf_report(self):
+        calls = []
+
+        def create_pdf_report(input_text, data):
+            calls.append((input_text, data))
+            return BytesIO(b'%PDF-1.7')
+
+        self.patch(export, 'create_pdf_report', create_pdf_report)
+
+        with export.PDFReport('report', {}) as report:
+            # The report is generated only when it is read
+            self.assertEqual(calls, [])
+            self.assertEqual(report.read(), b'%PDF-1.7')
+            report.seek(0)
+            self.assertEqual(report.read(4), b'%PDF')
+
+        self.assertEqual(calls, [('report', {})])
+        self.assertTrue(report.fo.closed)
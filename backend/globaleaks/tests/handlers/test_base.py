@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import json
+import os
 
-from globaleaks.handlers.base import BaseHandler
-from globaleaks.rest.errors import InputValidationError
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.handlers.base import BaseHandler, parse_range
+from globaleaks.rest.errors import InputValidationError, RangeNotSatisfiable
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
+from globaleaks.utils.crypto import GCE
 
 FUTURE = 100
 
@@ -62,3 +67,101 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     def test_validate_regexp_valid(self):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
+
+
+class TestRanges(helpers.TestHandlerWithPopulatedDB):
+    _handler = BaseHandlerMock
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range(b'bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range(b'bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range(b'bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse_range(b'bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range(b'bytes=-2000', 1000), (0, 999))
+
+        for value in [b'bytes=0-1,5-6', b'bytes=5-1', b'bytes=-', b'items=0-1', b'bytes=a-b']:
+            self.assertIsNone(parse_range(value, 1000))
+
+        for value in [b'bytes=1000-', b'bytes=-0']:
+            self.assertRaises(RangeNotSatisfiable, parse_range, value, 1000)
+
+    def write_encrypted_file(self, data):
+        prv_key, pub_key = GCE.generate_keypair()
+        path = os.path.join(Settings.tmp_path, 'encrypted')
+
+        with GCE.streaming_encryption_open('ENCRYPT', pub_key, path) as seo:
+            for i in range(0, len(data), 1000):
+                seo.encrypt_chunk(data[i:i + 1000], 0)
+
+            seo.encrypt_chunk(b'', 1)
+
+        return prv_key, path
+
+    @inlineCallbacks
+    def test_download_by_ranges(self):
+        data = os.urandom(10000)
+        prv_key, path = self.write_encrypted_file(data)
+
+        for value, start, end in [(b'bytes=0-0', 0, 0),
+                                  (b'bytes=1500-4321', 1500, 4321),
+                                  (b'bytes=9000-', 9000, 9999),
+                                  (b'bytes=-10', 9990, 9999)]:
+            handler = self.request(headers={b'range': value})
+            yield handler.write_file_as_download('file', GCE.streaming_encryption_open('DECRYPT', prv_key, path))
+
+            self.assertEqual(handler.request.responseCode, 206)
+            self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'content-range'),
+                             [b'bytes %d-%d/10000' % (start, end)])
+            self.assertEqual(handler.request.getResponseBody(), data[start:end + 1])
+
+        # Ranges are not served if the file changed
+        handler = self.request(headers={b'range': b'bytes=0-0', b'if-range': b'"changed"'})
+        yield handler.write_file_as_download('file', GCE.streaming_encryption_open('DECRYPT', prv_key, path))
+        self.assertEqual(handler.request.getResponseBody(), data)
+
+        handler = self.request(headers={b'range': b'bytes=10000-'})
+        self.assertRaises(RangeNotSatisfiable, handler.write_file_as_download,
+                          'file', GCE.streaming_encryption_open('DECRYPT', prv_key, path))
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'content-range'), [b'bytes */10000'])
+
+    @inlineCallbacks
+    def test_download_by_ranges_with_if_range(self):
+        path = os.path.join(Settings.tmp_path, 'plaintext')
+        with open(path, 'wb') as f:
+            f.write(b'0123456789')
+
+        handler = self.request()
+        yield handler.write_file_as_download('file', path)
+        self.assertEqual(handler.request.getResponseBody(), b'0123456789')
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'accept-ranges'), [b'bytes'])
+        etag = handler.request.responseHeaders.getRawHeaders(b'etag')[0]
+
+        handler = self.request(headers={b'range': b'bytes=5-', b'if-range': etag})
+        yield handler.write_file_as_download('file', path)
+        self.assertEqual(handler.request.getResponseBody(), b'56789')
+
+
+class TestUploads(helpers.TestHandlerWithPopulatedDB):
+    _handler = BaseHandlerMock
+
+    def test_chunks_received_in_any_order(self):
+        chunks = [os.urandom(1000), os.urandom(1000), os.urandom(1500)]
+
+        for number in (3, 1, 2):
+            handler = self.request(role='admin', args={
+                b'flowFilename': [b'file.txt'],
+                b'flowIdentifier': [b'upload'],
+                b'flowChunkNumber': [str(number).encode()],
+                b'flowChunkSize': [b'1000'],
+                b'flowTotalChunks': [b'3'],
+                b'flowTotalSize': [b'3500'],
+                b'file': [chunks[number - 1]]
+            })
+            handler.process_file_upload()
+
+            # The file is complete only once all the chunks are written
+            self.assertEqual(handler.uploaded_file is None, number != 2)
+
+        self.assertEqual(handler.uploaded_file['size'], 3500)
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
+import gzip
+from collections import OrderedDict
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.rest.cache import Cache
+from globaleaks.rest import cache
+from globaleaks.rest.cache import Cache, select_encoding
+from globaleaks.rest.decorators import serve_cache_entry
 from globaleaks.tests import helpers
 
 
@@ -11,20 +16,107 @@ class TestCache(helpers.TestGL):
         yield helpers.TestGL.setUp(self)
 
         Cache.invalidate()
+        Cache.counters.clear()
+        self.patch(Cache, 'max_size', Cache.max_size)
 
     def test_cache(self):
-        self.assertEqual(Cache.memory_cache_dict, {})
+        self.assertEqual(len(Cache.entries), 0)
         self.assertIsNone(Cache.get(1, "passante_di_professione", "it"))
         self.assertIsNone(Cache.get(1, "passante_di_professione", "en"))
         self.assertIsNone(Cache.get(2, "passante_di_professione", "ca"))
         Cache.set(1, "passante_di_professione", "it", 'text/plain', 'ititit')
         Cache.set(1, "passante_di_professione", "en", 'text/plain', 'enenen')
         Cache.set(2, "passante_di_professione", "ca", 'text/plain', 'cacaca')
-        self.assertTrue("passante_di_professione" in Cache.memory_cache_dict[1])
-        self.assertTrue("passante_di_professione" in Cache.memory_cache_dict[2])
-        self.assertIsNone(Cache.get(1, "passante_di_professione", "ca"))
-        self.assertTrue("it" in Cache.memory_cache_dict[1]['passante_di_professione'])
-        self.assertTrue("en" in Cache.memory_cache_dict[1]['passante_di_professione'])
+        self.assertEqual(Cache.get(1, "passante_di_professione", "it").data, b'ititit')
+        self.assertEqual(Cache.get(2, "passante_di_professione", "ca").data, b'cacaca')
         self.assertIsNone(Cache.get(1, "passante_di_professione", "ca"))
+        Cache.invalidate(2)
+        self.assertIsNone(Cache.get(2, "passante_di_professione", "ca"))
+        self.assertIsNotNone(Cache.get(1, "passante_di_professione", "en"))
         Cache.invalidate()
-        self.assertEqual(Cache.memory_cache_dict, {})
+        self.assertEqual(len(Cache.entries), 0)
+        self.assertEqual(Cache.size, 0)
+
+        stats = Cache.stats()
+        self.assertEqual(stats['tenants'][1], {'hits': 2, 'misses': 3, 'evictions': 0, 'not_modified': 0})
+        self.assertEqual(stats['tenants'][2], {'hits': 1, 'misses': 2, 'evictions': 0, 'not_modified': 0})
+
+    def test_entry(self):
+        entry = Cache.set(1, b'/api/public', 'en', b'application/json', '{"a": 1}')
+
+        self.assertEqual(entry.data, b'{"a": 1}')
+        gzip_data, gzip_etag = entry.get_variant('gzip')
+        self.assertEqual(gzip.decompress(gzip_data), entry.data)
+        self.assertNotEqual(entry.etag, gzip_etag)
+        self.assertEqual(entry.etag, Cache.set(1, b'/api/public', 'it', b'application/json', b'{"a": 1}').etag)
+
+        self.assertTrue(entry.match(entry.etag))
+        self.assertTrue(entry.match(b'"x", W/' + gzip_etag))
+        self.assertTrue(entry.match(b'*'))
+        self.assertFalse(entry.match(b'"x"'))
+        self.assertFalse(entry.match(None))
+
+        self.assertIsNone(Cache.get_not_modified(1, b'/api/public', 'en', b'"x"'))
+        self.assertIs(Cache.get_not_modified(1, b'/api/public', 'en', entry.etag), entry)
+
+    def test_lru_eviction(self):
+        entry = Cache.set(1, b'/api/public', 'en', b'application/json', b'x' * 1000)
+        Cache.max_size = entry.size * 2
+
+        Cache.set(2, b'/api/public', 'en', b'application/json', b'x' * 1000)
+        Cache.get(1, b'/api/public', 'en')
+        Cache.set(3, b'/api/public', 'en', b'application/json', b'x' * 1000)
+
+        self.assertIsNotNone(Cache.get(1, b'/api/public', 'en'))
+        self.assertIsNone(Cache.get(2, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(3, b'/api/public', 'en'))
+        self.assertEqual(Cache.size, entry.size * 2)
+        self.assertEqual(Cache.stats()['tenants'][2]['evictions'], 1)
+
+        # Entries bigger than the cache are not stored
+        Cache.set(4, b'/api/public', 'en', b'application/json', b'x' * 100000)
+        self.assertIsNone(Cache.get(4, b'/api/public', 'en'))
+        self.assertEqual(len(Cache.entries), 2)
+
+    def test_serve_cache_entry(self):
+        entry = Cache.set(1, b'/api/public', 'en', b'application/json', b'{}')
+
+        request = helpers.forge_request()
+        self.assertEqual(serve_cache_entry(request, entry), entry.data)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'ETag'), [entry.etag])
+        self.assertIsNone(request.responseHeaders.getRawHeaders(b'Content-Encoding'))
+
+        # Simulate the encoder set by twisted for the clients accepting gzip
+        request = helpers.forge_request(headers={'Accept-Encoding': 'deflate, gzip'})
+        request._encoder = object()
+        request.responseHeaders.setRawHeaders(b'content-encoding', [b'gzip'])
+        self.assertEqual(serve_cache_entry(request, entry), entry.get_variant('gzip')[0])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'ETag'), [entry.get_variant('gzip')[1]])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Content-Encoding'), [b'gzip'])
+        self.assertIsNone(request._encoder)
+
+    def test_select_encoding(self):
+        self.patch(cache, 'ENCODINGS', OrderedDict([('br', None), ('zstd', None), ('gzip', None)]))
+
+        self.assertIsNone(select_encoding(''))
+        self.assertIsNone(select_encoding('deflate'))
+        self.assertIsNone(select_encoding('gzip;q=0'))
+        self.assertEqual(select_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(select_encoding('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(select_encoding('zstd, gzip'), 'zstd')
+        self.assertEqual(select_encoding('*'), 'br')
+        self.assertEqual(select_encoding('*, br;q=0'), 'zstd')
+        self.assertIsNone(select_encoding('gzip;q=0.5, identity'))
+
+    def test_invalidate_dependencies(self):
+        Cache.set(1, b'/api/public', 'en', b'application/json', b'{}', {'Context', 'User'})
+        Cache.set(1, b'/l10n/en', 'en', b'application/json', b'{}', {'CustomTexts'})
+        Cache.set(1, b'/unknown', 'en', b'application/json', b'{}')
+
+        Cache.invalidate(1, {'User'})
+        self.assertIsNone(Cache.get(1, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(1, b'/l10n/en', 'en'))
+        self.assertIsNone(Cache.get(1, b'/unknown', 'en'))
+
+        Cache.invalidate(1, {'CustomTexts'})
+        self.assertIsNone(Cache.get(1, b'/l10n/en', 'en'))
@@ -1,14 +1,82 @@
 # -*- coding: utf-8 -*-
+import gzip
+import os
+
 from twisted.internet.defer import inlineCallbacks
+from twisted.web.http import datetimeToString
 
-from globaleaks.handlers.staticfile import StaticFileHandler
+from globaleaks.handlers import staticfile
+from globaleaks.handlers.staticfile import StaticFileHandler, StaticFileManifest
 from globaleaks.rest import errors
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
+SCRIPT = b'console.log("GlobaLeaks");\n' * 100
+
+
+class TestStaticFileManifest(helpers.TestGL):
+    def setUp(self):
+        self.root = self.mktemp()
+        os.makedirs(os.path.join(self.root, 'js'))
+
+        for filename, data in (('index.html', b'<!doctype html>'),
+                               ('js/main.js', SCRIPT),
+                               ('js/main.js.gz', gzip.compress(SCRIPT)),
+                               ('js/main.js.br', b'stale'),
+                               ('orphan.gz', b'orphan')):
+            with open(os.path.join(self.root, filename), 'wb') as f:
+                f.write(data)
+
+        # The brotli variant is left over by a previous build
+        path = os.path.join(self.root, 'js/main.js.br')
+        os.utime(path, (0, 0))
+
+        return helpers.TestGL.setUp(self)
+
+    def test_manifest(self):
+        manifest = StaticFileManifest(self.root)
+
+        self.assertEqual(sorted(manifest.files), ['index.html', 'js/main.js', 'orphan.gz'])
+
+        entry = manifest.get('js/main.js')
+        self.assertEqual(entry.size, len(SCRIPT))
+        self.assertEqual(list(entry.variants), ['gzip'])
+        self.assertNotEqual(entry.get_variant(None)[2], entry.get_variant('gzip')[2])
+
+        self.assertIsNone(manifest.get('unexistent'))
+
+    def test_manifest_changed_files(self):
+        manifest = StaticFileManifest(self.root)
+        entry = manifest.get('index.html')
+
+        with open(os.path.join(self.root, 'index.html'), 'wb') as f:
+            f.write(b'<!doctype html><html></html>')
+
+        updated = manifest.get('index.html')
+        self.assertEqual(updated.size, len(b'<!doctype html><html></html>'))
+        self.assertNotEqual(updated.etag, entry.etag)
+
+        # Adding a precompressed variant refreshes the entry of the file
+        with open(os.path.join(self.root, 'index.html.gz'), 'wb') as f:
+            f.write(gzip.compress(b'<!doctype html><html></html>'))
+
+        self.assertEqual(list(manifest.get('index.html').variants), ['gzip'])
+
+        os.remove(os.path.join(self.root, 'js/main.js'))
+        self.assertIsNone(manifest.get('js/main.js'))
+        self.assertNotIn('js/main.js', manifest.files)
+
 
 class TestStaticFileHandler(helpers.TestHandler):
     _handler = StaticFileHandler
 
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandler.setUp(self)
+
+        # The manifest is not used in development mode
+        Settings.devel_mode = False
+
     @inlineCallbacks
     def test_get_existent(self):
         handler = self.request()
@@ -19,3 +87,68 @@ class TestStaticFileHandler(helpers.TestHandler):
         handler = self.request()
 
         return self.assertRaises(errors.ResourceNotFound, handler.get, 'unexistent')
+
+    def get_manifest_entry(self, handler, filename):
+        return staticfile.get_manifest(handler.root).get(filename)
+
+    @inlineCallbacks
+    def test_get_precompressed(self):
+        root = self.mktemp()
+        os.makedirs(root)
+
+        for filename, data in (('main.js', SCRIPT), ('main.js.gz', gzip.compress(SCRIPT))):
+            with open(os.path.join(root, filename), 'wb') as f:
+                f.write(data)
+
+        handler = self.request(headers={b'accept-encoding': b'gzip, deflate'})
+        handler.root = root + '/'
+        yield handler.get('main.js')
+
+        entry = self.get_manifest_entry(handler, 'main.js')
+        self.assertEqual(gzip.decompress(handler.request.getResponseBody()), SCRIPT)
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'content-encoding'), [b'gzip'])
+        self.assertIn(entry.get_variant('gzip')[2], handler.request.responseHeaders.getRawHeaders(b'etag'))
+
+        handler = self.request(headers={b'accept-encoding': b'identity'})
+        handler.root = root + '/'
+        yield handler.get('main.js')
+
+        self.assertEqual(handler.request.getResponseBody(), SCRIPT)
+        self.assertIsNone(handler.request.responseHeaders.getRawHeaders(b'content-encoding'))
+        self.assertIn(entry.etag, handler.request.responseHeaders.getRawHeaders(b'etag'))
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request()
+        entry = self.get_manifest_entry(handler, 'index.html')
+
+        for headers in ({b'if-none-match': entry.etag},
+                        {b'if-none-match': b'"other", W/' + entry.etag},
+                        {b'if-modified-since': datetimeToString(entry.mtime)}):
+            handler = self.request(headers=headers)
+            self.assertIsNone(handler.get(''))
+            self.assertEqual(handler.request.responseCode, 304)
+            self.assertEqual(handler.request.written, [])
+
+        handler = self.request(headers={b'if-none-match': b'"other"'})
+        yield handler.get('')
+        self.assertNotEqual(handler.request.responseCode, 304)
+        self.assertTrue(handler.request.getResponseBody().startswith(b'<!doctype html>'))
+
+    @inlineCallbacks
+    def test_get_devel_mode(self):
+        root = self.mktemp()
+        os.makedirs(root)
+
+        with open(os.path.join(root, 'main.js'), 'wb') as f:
+            f.write(SCRIPT)
+
+        Settings.devel_mode = True
+
+        handler = self.request(headers={b'accept-encoding': b'gzip'})
+        handler.root = root + '/'
+        yield handler.get('main.js')
+
+        self.assertEqual(handler.request.getResponseBody(), SCRIPT)
+        self.assertIsNone(handler.request.responseHeaders.getRawHeaders(b'etag'))
+        self.assertNotIn(os.path.abspath(handler.root), staticfile.manifests)
@@ -136,7 +136,7 @@ class FakeThreadPool(object):
 def init_state():
     Settings.set_devel_mode()
     Settings.disable_notifications = True
-    Settings.failed_login_attempts.clear()
+    State.failed_login_attempts.clear()
     Settings.working_path = os.path.abspath('./working_path')
 
     Settings.eval_paths()
@@ -145,6 +145,9 @@ def init_state():
         shutil.rmtree(Settings.working_path)
 
     orm.set_thread_pool(FakeThreadPool())
+    State.set_kdf_tp(FakeThreadPool())
+    State.set_file_tp(FakeThreadPool())
+    State.delivery_tp = FakeThreadPool()
 
     State.settings.enable_api_cache = False
     State.tenants[1] = TenantState()
@@ -541,6 +544,15 @@ def forge_request(uri=b'https://www.globaleaks.org/',
 
     request.notifyFinish = notifyFinish
 
+    def registerProducer(producer, streaming):
+        # Push producers write to the request on their own
+        if streaming:
+            request.producer = producer
+        else:
+            DummyRequest.registerProducer(request, producer, streaming)
+
+    request.registerProducer = registerProducer
+
     request.requestHeaders.setRawHeaders('host', [b'127.0.0.1'])
     request.requestHeaders.setRawHeaders('user-agent', [b'NSA Agent'])
 
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs import delivery
+from globaleaks.jobs.delivery import Delivery
+from globaleaks.orm import transact
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_null
+
+
+@transact
+def get_delivery_states(session):
+    return sorted((f.delivery_state, f.delivery_attempts) for f in session.query(models.InternalFile))
+
+
+@transact
+def expire_retry_dates(session):
+    for model in (models.InternalFile, models.ReceiverFile):
+        session.query(model).update({'delivery_date': datetime_null()})
+
+
+class TestDelivery(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGLWithPopulatedDB.setUp(self)
+
+        self.deliveries = []
+
+        deliver_file = delivery.deliver_file
+
+        def count_deliveries(sf, dst, *args):
+            self.deliveries.append(dst)
+            return deliver_file(sf, dst, *args)
+
+        self.patch(delivery, 'deliver_file', count_deliveries)
+
+    def crash_while_writing(self, times):
+        """
+        Make the writes of the files fail after a partial write
+        """
+        write_encrypted_file = delivery.write_encrypted_file
+        self.crashes = times
+
+        def crashing_write(key, sf, dest_path):
+            if self.crashes == 0:
+                return write_encrypted_file(key, sf, dest_path)
+
+            self.crashes -= 1
+
+            with open(dest_path, 'wb') as f:
+                f.write(b'partial')
+
+            raise IOError("No space left on device")
+
+        self.patch(delivery, 'write_encrypted_file', crashing_write)
+
+    def list_attachments(self):
+        return sorted(os.listdir(Settings.attachments_path))
+
+    @inlineCallbacks
+    def test_delivery(self):
+        yield self.perform_full_submission_actions()
+
+        job = Delivery()
+        yield job.run()
+
+        # The files of the receivers of a tip are written once
+        yield self.test_model_count(models.WhistleblowerFile, 8)
+        self.assertEqual(len(self.deliveries), 4)
+        self.assertEqual(len(set(self.deliveries)), 4)
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('delivered', 1)] * 4)
+
+        self.assertEqual(job.get_metrics()['backlog'], 0)
+        self.assertEqual(job.delivered_files, 4)
+        self.assertGreater(job.delivered_bytes, 0)
+        self.assertGreater(job.throughput, 0)
+
+    @inlineCallbacks
+    def test_delivery_batch(self):
+        self.patch(delivery, 'BATCH_BYTES', 1)
+
+        yield self.perform_full_submission_actions()
+
+        # Each run delivers a single file as the first exceeds the batch size
+        for i in range(4):
+            yield Delivery().run()
+            self.assertEqual(len(self.deliveries), i + 1)
+
+        yield self.test_model_count(models.WhistleblowerFile, 8)
+
+    @inlineCallbacks
+    def test_delivery_retry(self):
+        yield self.perform_full_submission_actions()
+
+        attachments = self.list_attachments()
+
+        self.crash_while_writing(4)
+
+        job = Delivery()
+        yield job.run()
+
+        # No partial file is left and the files are not made available
+        self.assertEqual(self.list_attachments(), attachments)
+        yield self.test_model_count(models.WhistleblowerFile, 0)
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('pending', 1)] * 4)
+        self.assertEqual(job.get_metrics()['backlog'], 4)
+
+        # The retries are delayed
+        yield job.run()
+        self.assertEqual(len(self.deliveries), 4)
+
+        yield expire_retry_dates()
+        yield job.run()
+
+        self.assertEqual(len(self.deliveries), 8)
+        yield self.test_model_count(models.WhistleblowerFile, 8)
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('delivered', 2)] * 4)
+        self.assertEqual(job.get_metrics()['backlog'], 0)
+
+    @inlineCallbacks
+    def test_delivery_failure(self):
+        self.patch(delivery, 'MAX_ATTEMPTS', 2)
+
+        yield self.perform_full_submission_actions()
+
+        self.crash_while_writing(8)
+
+        job = Delivery()
+        for _ in range(3):
+            yield expire_retry_dates()
+            yield job.run()
+
+        # The deliveries are given up once the attempts are exhausted
+        self.assertEqual(len(self.deliveries), 8)
+        yield self.test_model_count(models.WhistleblowerFile, 0)
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('failed', 2)] * 4)
+        self.assertEqual(job.get_metrics()['failed'], 4)
+
+    @inlineCallbacks
+    def test_delivery_after_crash(self):
+        yield self.perform_full_submission_actions()
+
+        # The process dies after having claimed the files, having
+        # completed one of them and losing two uploads
+        sizes = {os.path.basename(f.filepath): f.size for f in self.state.TempUploadFiles.values()}
+        receiverfiles_maps, _, _ = yield delivery.file_delivery(sizes)
+
+        lost = sorted(receiverfiles_maps)[:2]
+        for file_id in lost:
+            self.state.get_tmp_file_by_name(file_id)
+
+        with open(os.path.join(Settings.attachments_path, lost[0]), 'wb') as f:
+            f.write(b'completed')
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('processing', 1)] * 4)
+
+        # The files claimed are retried once their retry date expires
+        job = Delivery()
+        yield job.run()
+        self.assertEqual(self.deliveries, [])
+
+        yield expire_retry_dates()
+        yield job.run()
+
+        states = yield get_delivery_states()
+        self.assertEqual(states, [('delivered', 2)] * 3 + [('failed', 2)])
+        self.assertEqual(len(self.deliveries), 2)
+        yield self.test_model_count(models.WhistleblowerFile, 6)
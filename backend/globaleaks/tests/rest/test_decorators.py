@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from twisted.internet import defer
+
+from globaleaks.rest import errors
+from globaleaks.rest.cache import Cache
+from globaleaks.rest.decorators import cache_get_in_flight, decorator_cache_get
+from globaleaks.tests import helpers
+
+
+class SerializerHandler(object):
+    """
+    Handler whose responses are generated on demand by the test
+    """
+    cache_dependencies = None
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.request = helpers.forge_request(uri=b'https://www.globaleaks.org/api/public')
+
+    def get(self):
+        self.serializer.invocations += 1
+        d = defer.Deferred()
+        self.serializer.pending.append(d)
+        return d
+
+
+class Serializer(object):
+    def __init__(self):
+        self.invocations = 0
+        self.pending = []
+
+    def request(self):
+        handler = SerializerHandler(self)
+        return handler, decorator_cache_get(SerializerHandler.get)(handler)
+
+
+class TestDecoratorCacheGet(helpers.TestGL):
+    def setUp(self):
+        Cache.invalidate()
+        self.addCleanup(cache_get_in_flight.clear)
+        return helpers.TestGL.setUp(self)
+
+    @defer.inlineCallbacks
+    def test_concurrent_misses_share_the_serialization(self):
+        serializer = Serializer()
+        requests = [serializer.request() for _ in range(10)]
+
+        self.assertEqual(serializer.invocations, 1)
+
+        serializer.pending[0].callback({'key': 'value'})
+
+        results = yield defer.gatherResults([d for _, d in requests])
+        self.assertEqual(results, [b'{"key": "value"}'] * 10)
+        self.assertEqual(cache_get_in_flight, {})
+
+        for handler, _ in requests:
+            self.assertIn(b'application/json', handler.request.responseHeaders.getRawHeaders(b'Content-type'))
+
+        # The following requests are served from the cache
+        self.assertEqual(serializer.request()[1], b'{"key": "value"}')
+        self.assertEqual(serializer.invocations, 1)
+
+    def test_failures_are_propagated_to_all_the_waiters(self):
+        serializer = Serializer()
+        requests = [serializer.request() for _ in range(3)]
+
+        serializer.pending[0].errback(errors.ResourceNotFound())
+
+        for _, d in requests:
+            self.failureResultOf(d, errors.ResourceNotFound)
+
+        self.assertEqual(cache_get_in_flight, {})
+
+        serializer.request()
+        self.assertEqual(serializer.invocations, 2)
+
+    @defer.inlineCallbacks
+    def test_cancellation_of_a_waiter(self):
+        serializer = Serializer()
+        requests = [serializer.request() for _ in range(2)]
+
+        requests[0][1].cancel()
+        self.failureResultOf(requests[0][1], defer.CancelledError)
+
+        serializer.pending[0].callback({})
+        result = yield requests[1][1]
+        self.assertEqual(result, b'{}')
+
+    @defer.inlineCallbacks
+    def test_invalidation_during_the_serialization(self):
+        serializer = Serializer()
+        _, d = serializer.request()
+
+        Cache.invalidate()
+        serializer.pending[0].callback({})
+
+        result = yield d
+        self.assertEqual(result, b'{}')
+        self.assertIsNone(Cache.get(1, b'/api/public', 'en'))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import re
+
+from twisted.trial import unittest
+
+from globaleaks.rest.api import api_spec
+from globaleaks.rest.router import Router, get_literal_prefix
+
+UUID = '3aab5ad3-ab3d-4d1b-b1ea-4b1c7a1e4a17'
+
+PATHS = [
+    '', '/', '/api', '/api/', '/api/health', '/api/public', '/api/public/',
+    '/api/auth/token', '/api/auth/tenantauthswitch/2', '/api/auth/tenantauthswitch/x',
+    '/api/user/reset/password', '/api/user/reset/password/', '/api/user/reset/password/token',
+    '/api/recipient/rtips', '/api/recipient/rtips/' + UUID, '/api/recipient/rtips/' + UUID + '/comments',
+    '/api/recipient/rtips/' + UUID + '/export', '/api/recipient/rtips/' + UUID + '/unknown',
+    '/api/recipient/rtips/' + UUID.upper(), '/api/whistleblower/wbtip/wbfiles',
+    '/api/whistleblower/wbtip/wbfiles/' + UUID, '/api/admin/questionnaires/default',
+    '/api/admin/questionnaires/duplicate', '/api/admin/questionnaires/' + UUID,
+    '/api/admin/l10n/en', '/api/admin/l10n/xx', '/api/admin/config/tls/files/cert',
+    '/api/admin/files/logo', '/api/admin/tenants/12', '/api/admin/tenants/' + '1' * 21,
+    '/api/admin/statuses/closed', '/api/admin/statuses/closed/substatuses',
+    '/api/admin/statuses/closed/substatuses/' + UUID, '/api/admin/statuses/' + UUID + '/substatuses/' + UUID,
+    '/api/signup/' + 'a' * 64, '/api/signup/' + 'a' * 63,
+    '/.well-known/acme-challenge/' + 'a' * 43, '/.well-known/security.txt', '/xwell-known/security.txt',
+    '/robots.txt', '/robotsXtxt', '/sitemap.xml', '/s/favicon', '/l10n/en', '/l10n/it',
+    '/admin', '/login', '/submission', '/admin/', '/viewer/index.html', '/index.html',
+    '/js/scripts.min.js', '/data/favicon.ico', '/a b', '/api/unknown/route'
+]
+
+
+class LinearRouter(object):
+    """
+    Resolution of the paths trying every route, kept as a reference for the
+    router and for benchmarking it
+    """
+    def __init__(self, spec):
+        self.routes = []
+        for entry in spec:
+            pattern = entry[0]
+            if not pattern.startswith("^"):
+                pattern = "^" + pattern
+
+            if not pattern.endswith("$"):
+                pattern += "$"
+
+            self.routes.append((re.compile(pattern), entry[1]))
+
+    def resolve(self, path):
+        for regexp, handler in self.routes:
+            match = regexp.match(path)
+            if match:
+                return handler, match.groups()
+
+        return None, None
+
+
+class TestRouter(unittest.TestCase):
+    def test_get_literal_prefix(self):
+        self.assertEqual(get_literal_prefix('/api/admin/users/([a-f0-9]+)'), '/api/admin/users/')
+        self.assertEqual(get_literal_prefix('/robots.txt'), '/robots')
+        self.assertEqual(get_literal_prefix('/api/public'), '/api/public')
+
+        # Atoms made optional by a quantifier are not part of the prefix
+        self.assertEqual(get_literal_prefix('/api/users?'), '/api/user')
+        self.assertEqual(get_literal_prefix('/api/users*/x'), '/api/user')
+        self.assertEqual(get_literal_prefix('/api/users{0,2}/x'), '/api/user')
+        self.assertEqual(get_literal_prefix('/api/users+'), '/api/users')
+
+        # Patterns with a top-level alternation have no prefix
+        self.assertEqual(get_literal_prefix('/api/public|/api/users'), '')
+        self.assertEqual(get_literal_prefix('/api/(public|users)'), '/api/')
+        self.assertEqual(get_literal_prefix('/api/[|]'), '/api/')
+        self.assertEqual(get_literal_prefix('/api/\\|'), '/api/')
+
+    def test_equivalence_with_linear_scan(self):
+        router = Router(api_spec)
+        linear = LinearRouter(api_spec)
+
+        for path in PATHS:
+            route, groups = router.resolve(path)
+            expected = linear.resolve(path)
+            self.assertEqual((route.handler if route else None, groups), expected, path)
+
+    def test_equivalence_with_optional_prefixes(self):
+        spec = [
+            (r'/api/users?', 'optional'),
+            (r'/api/xs*/y', 'star'),
+            (r'/api/zs{0,2}/y', 'repetition'),
+            (r'/api/public|/api/other', 'alternation'),
+            (r'/api/(.*)', 'any')
+        ]
+
+        router = Router(spec)
+        linear = LinearRouter(spec)
+
+        for path in ['/api/user', '/api/users', '/api/x/y', '/api/xss/y', '/api/z/y', '/api/zss/y',
+                     '/api/public', '/api/other', '/api/otherx', '/api/publicx', '/api/none']:
+            route, groups = router.resolve(path)
+            self.assertEqual((route.handler if route else None, groups), linear.resolve(path), path)
+
+    def test_order_of_declaration(self):
+        router = Router([
+            (r'/api/(.*)', 'first'),
+            (r'/api/public', 'second'),
+            (r'/api/public/(.*)', 'third')
+        ])
+
+        self.assertEqual(router.resolve('/api/public')[0].handler, 'first')
+        self.assertEqual(router.resolve('/api/public/x')[0].handler, 'first')
+
+    def test_hits(self):
+        router = Router([(r'/api/public', object), (r'/api/users/([0-9]+)', dict)])
+
+        router.resolve('/api/public')
+        router.resolve('/api/users/1')
+        router.resolve('/api/users/2')
+        router.resolve('/api/users/x')
+
+        self.assertEqual(router.stats(), [
+            {'pattern': '/api/users/([0-9]+)', 'handler': 'dict', 'hits': 2},
+            {'pattern': '/api/public', 'handler': 'object', 'hits': 1}
+        ])
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import copy
+import json
+import re
+
+from twisted.trial import unittest
+
+from globaleaks.rest import errors, requests
+from globaleaks.rest.validator import get_request_validator
+from globaleaks.tests import helpers
+
+
+def legacy_validate_type(value, type):
+    """
+    Recursive implementation of the validation of a value, kept as a
+    reference for the compiled validators and for benchmarking them
+    """
+    if value is None:
+        return False
+
+    if callable(type):
+        if type == int:
+            try:
+                int(value)
+                return True
+            except:
+                return False
+
+        if type == bool and (value == 'true' or value == 'false'):
+            return True
+
+        return isinstance(value, type)
+
+    if isinstance(type, dict):
+        return legacy_validate_request(value, type)
+
+    if isinstance(type, str):
+        return bool(re.match(type, value))
+
+    if isinstance(type, list):
+        return not value or all(legacy_validate_type(x, type[0]) for x in value)
+
+    return False
+
+
+def legacy_validate_request(request, request_template):
+    """
+    Recursive implementation of the validation of a request, kept as a
+    reference for the compiled validators and for benchmarking them
+    """
+    if not isinstance(request, (dict, list)):
+        try:
+            request = json.loads(request)
+        except:
+            raise errors.InputValidationError
+
+    if isinstance(request_template, dict):
+        keys_to_strip = []
+        for key, value in request.items():
+            if key not in request_template:
+                keys_to_strip.append(key)
+                continue
+
+            if not legacy_validate_type(value, request_template[key]):
+                raise errors.InputValidationError("Key (%s) type validation failure" % key)
+
+        for key in keys_to_strip:
+            del request[key]
+
+        for key, value in request_template.items():
+            if key not in request:
+                raise errors.InputValidationError("Missing key %s" % key)
+
+            if not legacy_validate_type(request[key], value):
+                raise errors.InputValidationError("Key (%s) double validation failure" % key)
+
+            if isinstance(request_template[key], (dict, list)) and request_template[key]:
+                legacy_validate_request(request[key], request_template[key])
+
+    elif isinstance(request_template, list):
+        if not all(legacy_validate_type(x, request_template[0]) for x in request):
+            raise errors.InputValidationError("Not every element in %s is %s" %
+                                              (request, request_template[0]))
+
+    return request
+
+
+def get_sample_value(type):
+    if type == int:
+        return 1
+    elif type == bool:
+        return True
+    elif type == str:
+        return 'text'
+    elif type == dict:
+        return {'key': 'value'}
+    elif type == list:
+        return ['value']
+    elif isinstance(type, dict):
+        return {key: get_sample_value(value) for key, value in type.items()}
+    elif isinstance(type, list):
+        return [get_sample_value(type[0])] if type else []
+    elif isinstance(type, str):
+        return ''
+
+
+def get_templates():
+    return {name: template for name, template in vars(requests).items()
+            if not name.startswith('_') and isinstance(template, (dict, list))}
+
+
+def get_payloads(template):
+    """
+    Generate valid and invalid requests for a template
+    """
+    sample = get_sample_value(template)
+    yield sample
+    yield json.dumps(sample)
+    yield dict(sample, unexpected='value') if isinstance(sample, dict) else sample + [None]
+
+    if isinstance(template, dict):
+        for key in template:
+            request = copy.deepcopy(sample)
+            del request[key]
+            yield request
+
+            for value in (None, 0, 1, '', 'true', 'text', '{}', '[1]', {}, {'a': 1}, [], [1], [{}]):
+                request = copy.deepcopy(sample)
+                request[key] = value
+                yield request
+
+
+def validate(function, request, template):
+    try:
+        return function(copy.deepcopy(request), template)
+    except errors.InputValidationError as e:
+        return e.reason
+    except Exception as e:
+        return type(e)
+
+
+class TestValidator(unittest.TestCase):
+    def test_templates_are_precompiled(self):
+        for template in get_templates().values():
+            self.assertIs(get_request_validator(template), get_request_validator(template))
+
+    def test_equivalence_with_recursive_implementation(self):
+        for name, template in get_templates().items():
+            for request in get_payloads(template):
+                expected = validate(legacy_validate_request, request, template)
+                result = validate(lambda r, t: get_request_validator(t)(r), request, template)
+                self.assertEqual(result, expected, "%s: %r" % (name, request))
+
+    def test_equivalence_on_questionnaire(self):
+        with open(helpers.DATA_DIR + '/questionnaires/valid.json') as f:
+            questionnaire = json.load(f)
+
+        for step in questionnaire['steps']:
+            for template in (requests.AdminStepDesc, requests.AdminStepDescRaw):
+                self.assertEqual(validate(lambda r, t: get_request_validator(t)(r), step, template),
+                                 validate(legacy_validate_request, step, template))
+
+            for field in step['children']:
+                for template in (requests.AdminFieldDesc, requests.AdminFieldDescRaw):
+                    self.assertEqual(validate(lambda r, t: get_request_validator(t)(r), field, template),
+                                     validate(legacy_validate_request, field, template))
+
+    def test_error_messages(self):
+        validator = get_request_validator(requests.SubmissionStatusDesc)
+
+        e = self.assertRaises(errors.InputValidationError, validator, {'label': 'label', 'order': 'x'})
+        self.assertEqual(e.reason, "Invalid Input [Key (order) type validation failure]")
+
+        e = self.assertRaises(errors.InputValidationError, validator, {'label': 'label'})
+        self.assertEqual(e.reason, "Invalid Input [Missing key order]")
+
+        self.assertEqual(validator('{"label": "label", "order": 1, "id": "x"}'), {'label': 'label', 'order': 1})
+
+    def test_empty_list_template(self):
+        validator = get_request_validator([])
+        self.assertEqual(validator([]), [])
+        self.assertRaises(errors.InputValidationError, validator, [1])
+
+        validator = get_request_validator({'list': []})
+        self.assertEqual(validator({'list': []}), {'list': []})
+        self.assertRaises(errors.InputValidationError, validator, {'list': [1]})
@@ -6,6 +6,8 @@ from globaleaks.db import refresh_tenant_cache
 from globaleaks.handlers.admin.node import db_update_enabled_languages
 from globaleaks.orm import tw
 from globaleaks.rest import api
+from globaleaks.rest.cache import Cache
+from globaleaks.state import State
 from globaleaks.tests.helpers import TestGL, forge_request
 
 
@@ -125,3 +127,20 @@ class TestAPI(TestGL):
         self.assertFalse(request.client_using_tor)
         self.assertEqual(request.responseCode, 302)
         self.assertEqual(request.responseHeaders.getRawHeaders('location')[0], 'https://www.globaleaks.org/')
+
+    def test_if_none_match(self):
+        self.patch(State.settings, 'enable_api_cache', True)
+
+        entry = Cache.set(1, b'/api/public', 'en', b'application/json', b'{}')
+
+        request = forge_request(uri=b'https://www.globaleaks.org/api/public',
+                                headers={'If-None-Match': entry.etag})
+        self.api.render(request)
+        self.assertEqual(request.responseCode, 304)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'ETag'), [entry.etag])
+        self.assertEqual(request.written, [])
+
+        request = forge_request(uri=b'https://www.globaleaks.org/api/public',
+                                headers={'If-None-Match': b'"outdated"'})
+        self.api.render(request)
+        self.assertEqual(request.responseCode, 200)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from globaleaks.sessions import Sessions
+from globaleaks.tests import helpers
+
+
+class TestSessions(helpers.TestGL):
+    def test_new_revokes_previous_user_sessions(self):
+        first = Sessions.new(1, 'user', 1, 'receiver')
+        second = Sessions.new(1, 'user', 1, 'receiver')
+
+        self.assertIsNone(Sessions.get(first.id))
+        self.assertIsNotNone(Sessions.get(second.id))
+        self.assertEqual(len(Sessions.get_user_sessions(1, 'user')), 1)
+
+    def test_revoke(self):
+        Sessions.new(1, 'user1', 1, 'receiver')
+        Sessions.new(1, 'user2', 1, 'receiver')
+
+        Sessions.revoke(1, 'user1')
+
+        self.assertEqual(Sessions.get_user_sessions(1, 'user1'), [])
+        self.assertEqual(len(Sessions.get_user_sessions(1, 'user2')), 1)
+
+    def test_revoke_tenant(self):
+        Sessions.new(1, 'user1', 1, 'receiver')
+        Sessions.new(2, 'user2', 2, 'receiver')
+        Sessions.new(2, 'user3', 2, 'receiver')
+
+        Sessions.revoke_tenant(2)
+
+        self.assertEqual(len(Sessions), 1)
+        self.assertEqual(len(Sessions.keys_by_tag('tenant:1')), 1)
+        self.assertEqual(Sessions.keys_by_tag('tenant:2'), [])
+
+    def test_regenerate(self):
+        session = Sessions.new(1, 'user', 1, 'receiver')
+        session = Sessions.regenerate(Sessions.get(session.id))
+
+        self.assertEqual(len(Sessions), 1)
+        self.assertEqual(len(Sessions.get_user_sessions(1, 'user')), 1)
+
+    def test_index_is_updated_on_expiration(self):
+        Sessions.new(1, 'user', 1, 'receiver')
+
+        self.test_reactor.advance(Sessions.timeout)
+
+        self.assertEqual(len(Sessions), 0)
+        self.assertEqual(Sessions.get_user_sessions(1, 'user'), [])
+        self.assertEqual(Sessions.backend.tags, {})
+
+    def test_save_updates_index(self):
+        session_id = Sessions.new(1, 'submission', 1, 'whistleblower').id
+        session = Sessions.get(session_id)
+
+        session.user_id = 'itip'
+        Sessions.save(session)
+
+        self.assertEqual(Sessions.get_user_sessions(1, 'submission'), [])
+        self.assertEqual(len(Sessions.get_user_sessions(1, 'itip')), 1)
+
+        self.assertIsNotNone(Sessions.get(session_id))
+        Sessions.new(1, 'itip', 1, 'whistleblower')
+        self.assertIsNone(Sessions.get(session_id))
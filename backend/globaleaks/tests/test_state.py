@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from globaleaks import state
+from globaleaks.db import sync_refresh_snimap, sync_refresh_tenant_cache
+from globaleaks.rest.cache import Cache, Generations
+from globaleaks.state import State, TLS_CONFIG_DEPENDENCY
+from globaleaks.tests import helpers
+from globaleaks.utils.sharedstate import SharedGenerations, SQLiteStore
+
+
+class TestGenerations(helpers.TestGL):
+    def test_generations(self):
+        generations = Generations()
+        self.assertEqual(generations.get_sequence(), 0)
+
+        generations.bump(2)
+        generations.bump(3)
+        generations.bump(2)
+
+        self.assertEqual(generations.get_sequence(), 3)
+        self.assertEqual(generations.changed_since(0), [(2, '*'), (3, '*')])
+        self.assertEqual(generations.changed_since(2), [(2, '*')])
+        self.assertEqual(generations.changed_since(3), [])
+
+        generations.bump(2, {'Context', 'User'})
+        self.assertEqual(generations.changed_since(3), [(2, 'Context'), (2, 'User')])
+
+    def test_shared_generations(self):
+        path = self.mktemp()
+        store1, store2 = SQLiteStore(path), SQLiteStore(path)
+        self.addCleanup(store1.close)
+        self.addCleanup(store2.close)
+
+        a, b = SharedGenerations(store1), SharedGenerations(store2)
+        self.assertEqual(b.get_sequence(), 0)
+
+        a.bump(2)
+        a.bump(3)
+        b.bump(2, {'Context'})
+
+        self.assertEqual(a.get_sequence(), 3)
+        self.assertEqual(a.changed_since(0), [(2, '*'), (2, 'Context'), (3, '*')])
+        self.assertEqual(a.changed_since(2), [(2, 'Context')])
+
+    def test_check_generations(self):
+        for tid in (1, 2):
+            Cache.set(tid, b'/api/public', 'en', 'application/json', b'{}')
+
+        # Simulate the invalidation operated by another process
+        State.generations.bump(2)
+        self.assertIsNotNone(Cache.get(2, b'/api/public', 'en'))
+
+        State.check_generations()
+        self.assertIsNone(Cache.get(2, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(1, b'/api/public', 'en'))
+
+        State.invalidate_cache(1)
+        self.assertIsNone(Cache.get(1, b'/api/public', 'en'))
+        self.assertEqual(State.seen_generation, State.generations.get_sequence())
+
+    def test_check_generations_reloads(self):
+        calls = []
+        self.patch(state, 'deferToThread', lambda f, tid: calls.append((f, tid)))
+
+        State.invalidate_cache(1, {'User'})
+        self.assertEqual(calls, [(sync_refresh_tenant_cache, 1)])
+
+        del calls[:]
+        State.invalidate_cache(2, {'Config', TLS_CONFIG_DEPENDENCY})
+        self.assertEqual(calls, [(sync_refresh_tenant_cache, 2), (sync_refresh_snimap, 2)])
+
+        del calls[:]
+        State.invalidate_cache(2, {'Context'})
+        self.assertEqual(calls, [])
+
+    def test_check_generations_with_dependencies(self):
+        for tid in (1, 2):
+            Cache.set(tid, b'/api/public', 'en', 'application/json', b'{}', {'Context', 'Questionnaire'})
+            Cache.set(tid, b'/l10n/en', 'en', 'application/json', b'{}', {'Config', 'CustomTexts'})
+
+        State.invalidate_cache(2, {'Context'})
+        self.assertIsNone(Cache.get(2, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(2, b'/l10n/en', 'en'))
+        self.assertIsNotNone(Cache.get(1, b'/api/public', 'en'))
+
+        # The contexts of the root tenant are not inherited by the other tenants
+        Cache.set(2, b'/api/public', 'en', 'application/json', b'{}', {'Context', 'Questionnaire'})
+        State.invalidate_cache(1, {'Context'})
+        self.assertIsNone(Cache.get(1, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(2, b'/api/public', 'en'))
+
+        # The questionnaires of the root tenant are instead available to all the tenants
+        State.invalidate_cache(1, {'Questionnaire'})
+        self.assertIsNone(Cache.get(2, b'/api/public', 'en'))
+        self.assertIsNotNone(Cache.get(1, b'/l10n/en', 'en'))
+        self.assertIsNotNone(Cache.get(2, b'/l10n/en', 'en'))
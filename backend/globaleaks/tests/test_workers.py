@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import json
+import socket
+
+from globaleaks.rest.cache import Cache
+from globaleaks.settings import Settings
+from globaleaks.state import State
+from globaleaks.tests import helpers
+from globaleaks.utils.sock import reserve_tcp_socket
+from globaleaks import workers
+from globaleaks.workers import handle_message, ControlProtocol, WorkerPool, WorkerProtocol
+
+
+class FakeWorker(object):
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+class TestWorkers(helpers.TestGL):
+    def test_sockets_bound_with_reuse_port(self):
+        sock1, fail = reserve_tcp_socket('127.0.0.1', 0, True)
+        self.assertIsNone(fail)
+
+        port = sock1.getsockname()[1]
+        sock2, fail = reserve_tcp_socket('127.0.0.1', port, True)
+        self.assertIsNone(fail)
+        self.assertEqual(sock2.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT), 1)
+
+        sock1.close()
+        sock2.close()
+
+    def test_dispatch_relays_to_other_workers(self):
+        pool = WorkerPool([])
+        origin, other = FakeWorker(), FakeWorker()
+        pool.workers = {1: origin, 2: other}
+
+        message = {'type': 'accept_submissions', 'value': True}
+        pool.dispatch(message, origin)
+
+        self.assertEqual(origin.messages, [])
+        self.assertEqual(other.messages, [message])
+
+    def test_handle_state_messages(self):
+        Cache.set(1, b'/api/public', 'en', 'application/json', b'{}')
+
+        handle_message({'type': 'accept_submissions', 'value': False})
+        self.assertFalse(State.accept_submissions)
+        self.assertIsNone(Cache.get(1, b'/api/public', 'en'))
+        handle_message({'type': 'accept_submissions', 'value': True})
+        self.assertTrue(State.accept_submissions)
+
+        handle_message({'type': 'tor_exit_set', 'ips': ['1.2.3.4']})
+        self.assertEqual(State.tor_exit_set, {'1.2.3.4'})
+        handle_message({'type': 'tor_exit_set', 'ips': []})
+
+    def test_settings_sent_on_control_channel(self):
+        spawned, sent = [], []
+        self.patch(workers.reactor, 'spawnProcess',
+                   lambda protocol, executable, args, **kwargs: spawned.append(args))
+        self.patch(WorkerProtocol, 'send', lambda worker, message: sent.append(message))
+
+        pool = WorkerPool([([], [])])
+        pool.spawn(1)
+
+        self.assertNotIn('--settings', spawned[0])
+        self.assertEqual(sent[0], {'type': 'settings', 'settings': Settings.serialize()})
+
+        class FakeSetupWorker(object):
+            def setup(self, settings):
+                sent.append(settings)
+
+        protocol = ControlProtocol(FakeSetupWorker())
+        protocol.lineReceived(json.dumps(sent[0]).encode())
+        self.assertEqual(sent[-1], sent[0]['settings'])
+
+    def test_worker_settings(self):
+        settings = json.loads(json.dumps(Settings.serialize()))
+        self.assertEqual(settings['working_path'], Settings.working_path)
+        self.assertEqual(settings['devel_mode'], Settings.devel_mode)
+        self.assertEqual(settings['rsa_key_bits'], Settings.rsa_key_bits)
+
+        self.addCleanup(Settings.eval_paths)
+        self.addCleanup(setattr, Settings, 'worker_id', 0)
+
+        # Each worker writes its own log files
+        Settings.load({'worker_id': 2})
+        Settings.eval_paths()
+        self.assertTrue(Settings.logfile.endswith('globaleaks.worker2.log'))
+        self.assertTrue(Settings.accesslogfile.endswith('access.worker2.log'))
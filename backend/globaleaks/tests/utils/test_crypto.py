@@ -1,10 +1,14 @@
 # -*- coding: utf-8
 import filecmp
 import os
+import random
+import threading
+import time
 
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
-from globaleaks.utils.crypto import Base64Encoder, GCE
+from globaleaks.utils import crypto
+from globaleaks.utils.crypto import Base64Encoder, GCE, _KDFPool, _StreamingEncryptionObject, _hkdf_expand
 
 password = b'password'
 message = b'message'
@@ -25,6 +29,17 @@ class TestCryptoUtils(helpers.TestGL):
     def test_derive_key(self):
         GCE.derive_key(password, salt)
 
+    def test_derive_receipt(self):
+        hash, key = GCE.derive_receipt(password, salt)
+        self.assertEqual(len(hash), 44)
+        self.assertEqual(len(key), 32)
+        self.assertEqual((hash, key), GCE.derive_receipt(password, salt))
+
+        # The values are not derived from the secrets of the legacy scheme
+        for legacy_secret in [Base64Encoder.decode(hash_argon2), GCE.derive_key(password, salt)]:
+            self.assertNotEqual(key, _hkdf_expand(legacy_secret, b'GlobaLeaks receipt key'))
+            self.assertNotEqual(Base64Encoder.decode(hash), _hkdf_expand(legacy_secret, b'GlobaLeaks receipt hash'))
+
     def test_crypto_generate_key_encrypt_decrypt_key(self):
         enc_key = GCE.generate_key()
         enc = GCE.symmetric_encrypt(enc_key, message)
@@ -71,9 +86,169 @@ class TestCryptoUtils(helpers.TestGL):
         self.assertFalse(filecmp.cmp(a, b, False))
         self.assertTrue(filecmp.cmp(a, c, False))
 
+    def encrypt_file(self, pub_key, path, data, sizes):
+        with GCE.streaming_encryption_open('ENCRYPT', pub_key, path) as seo:
+            for size in sizes[:-1]:
+                seo.encrypt_chunk(data[:size], 0)
+                data = data[size:]
+
+            seo.encrypt_chunk(data, 1)
+
+    def test_seek_encrypted_file(self):
+        prv_key, pub_key = GCE.generate_keypair()
+        path = os.path.join(Settings.tmp_path, 'b')
+        data = os.urandom(10000)
+
+        layouts = [
+            # Chunks of the same length followed by an empty one as written by the delivery
+            [1000] * 10 + [0],
+            # Chunks of the same length followed by a shorter one
+            [3000] * 3 + [1000],
+            # Chunks of different lengths
+            [100, 5000, 10, 4890],
+            # Single chunk
+            [10000]
+        ]
+
+        for sizes in layouts:
+            self.encrypt_file(pub_key, path, data, sizes)
+
+            with GCE.streaming_encryption_open('DECRYPT', prv_key, path) as seo:
+                self.assertEqual(seo.get_size(), len(data))
+
+                for position in [0, 999, 1000, 2999, 3000, 9999, 10000] + random.sample(range(10000), 20):
+                    self.assertEqual(seo.seek(position), position)
+                    self.assertEqual(seo.read(1500), data[position:position + 1500])
+                    self.assertEqual(seo.tell(), min(position + 1500, 10000))
+
+                seo.seek(-100, os.SEEK_END)
+                self.assertEqual(seo.read(), data[-100:])
+                self.assertEqual(seo.read(), b'')
+
+                seo.seek(10)
+                seo.seek(10, os.SEEK_CUR)
+                self.assertEqual(seo.read(7), data[20:27])
+
+    def test_read_encrypted_file(self):
+        prv_key, pub_key = GCE.generate_keypair()
+        path = os.path.join(Settings.tmp_path, 'b')
+        data = os.urandom(10000)
+
+        self.encrypt_file(pub_key, path, data, [4096, 4096, 1808])
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, path) as seo:
+            output = []
+            while True:
+                chunk = seo.read(1000)
+                if not chunk:
+                    break
+
+                self.assertLessEqual(len(chunk), 1000)
+                output.append(chunk)
+
+            self.assertEqual([len(x) for x in output], [1000] * 10)
+            self.assertEqual(b''.join(output), data)
+
+    def test_verify_encrypted_file(self):
+        prv_key, pub_key = GCE.generate_keypair()
+        path = os.path.join(Settings.tmp_path, 'b')
+        data = os.urandom(10000)
+
+        self.encrypt_file(pub_key, path, data, [1000] * 10 + [0])
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, path) as seo:
+            seo.seek(5000)
+            self.assertTrue(seo.verify())
+            self.assertEqual(seo.read(10), data[5000:5010])
+
+        # Truncation at the boundary of a chunk
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - _StreamingEncryptionObject.chunk_overhead)
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, path) as seo:
+            self.assertFalse(seo.verify())
+
+        # Tampering of the last chunk
+        self.encrypt_file(pub_key, path, data, [3000] * 3 + [1000])
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\x00' if f.read(1) != b'\x00' else b'\x01')
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, path) as seo:
+            seo.seek(5000)
+            self.assertFalse(seo.verify())
+            self.assertEqual(seo.tell(), 5000)
+            self.assertEqual(seo.read(10), data[5000:5010])
+
     def test_recovery_key(self):
         prv_key, _ = GCE.generate_keypair()
         bck_key, rec_key = GCE.generate_recovery_key(prv_key)
         plain_rec_key = GCE.asymmetric_decrypt(prv_key, Base64Encoder.decode(rec_key))
         x = GCE.symmetric_decrypt(plain_rec_key, Base64Encoder.decode(bck_key))
         self.assertEqual(x, prv_key)
+
+
+class TestKDFPool(helpers.TestGL):
+    def _run_concurrently(self, pool, tids):
+        lock = threading.Lock()
+        running = {'all': 0, 'max': 0}
+
+        def kdf():
+            with lock:
+                running['all'] += 1
+                running['max'] = max(running['max'], running['all'])
+
+            time.sleep(0.05)
+
+            with lock:
+                running['all'] -= 1
+
+        threads = [threading.Thread(target=pool.run, args=(tid, kdf)) for tid in tids]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        return running['max']
+
+    def test_concurrency_is_bounded(self):
+        pool = _KDFPool(workers=3)
+        self.assertEqual(self._run_concurrently(pool, [1] * 10), 3)
+
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 10)
+        self.assertEqual(stats['running'], 0)
+        self.assertEqual(stats['waiting'], 0)
+        self.assertTrue(stats['max_waiting'] >= 7)
+
+    def test_tenant_cap(self):
+        pool = _KDFPool(workers=2, tenant_cap=1)
+        pool.running = 1
+        pool.running_by_tenant = {1: 1}
+
+        # A tenant can use idle workers over its cap when no one else waits
+        self.assertTrue(pool._can_run(1))
+
+        pool.waiting = 1
+        pool.waiting_by_tenant = {2: 1}
+        self.assertFalse(pool._can_run(1))
+        self.assertTrue(pool._can_run(2))
+
+    def test_automatic_sizing(self):
+        pool = _KDFPool()
+        self.assertTrue(pool.get_workers() >= 1)
+        self.assertTrue(pool.get_tenant_cap() >= 1)
+
+    def test_sizing_is_computed_once(self):
+        memory = [16 << 30]
+        self.patch(crypto, '_get_available_memory', lambda: memory[0])
+        self.patch(crypto.os, 'cpu_count', lambda: 4)
+
+        pool = _KDFPool()
+        self.assertEqual(pool.get_size(), (4, 2))
+
+        # The memory allocated by the running derivations does not shrink the pool
+        memory[0] = 0
+        self.assertTrue(pool._can_run(1))
+        self.assertEqual(pool.get_size(), (4, 2))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import io
+
+from twisted.internet.defer import Deferred
+from twisted.trial import unittest
+
+from globaleaks.utils import filesender
+from globaleaks.utils.filesender import ThreadedFileSender
+
+DATA = bytes(range(256)) * 1024
+
+
+class PausingConsumer(object):
+    """
+    Consumer pausing the producer after each write as a transport with a full buffer
+    """
+    def __init__(self):
+        self.producer = None
+        self.data = []
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
+    def write(self, data):
+        self.data.append(data)
+        self.producer.pauseProducing()
+
+
+class TestThreadedFileSender(unittest.TestCase):
+    def setUp(self):
+        self.patch(filesender, '_FILE_THREAD_POOL', None)
+
+    def test_transfer_with_back_pressure(self):
+        sender = ThreadedFileSender()
+        sender.CHUNK_SIZE = 1024
+        consumer = PausingConsumer()
+
+        d = sender.beginFileTransfer(io.BytesIO(DATA), consumer)
+
+        # The chunks read while the consumer is paused are bounded
+        self.assertEqual(len(consumer.data), 1)
+        self.assertEqual(len(sender.queue), sender.max_pending)
+
+        while consumer.producer is not None:
+            consumer.producer.resumeProducing()
+
+        self.assertEqual(self.successResultOf(d), DATA[-1:])
+        self.assertEqual(b''.join(consumer.data), DATA)
+
+    def test_stop_during_read(self):
+        reads = []
+
+        sender = ThreadedFileSender()
+        sender.read = lambda: reads.append(Deferred()) or reads[-1]
+        consumer = PausingConsumer()
+
+        d = sender.beginFileTransfer(io.BytesIO(DATA), consumer)
+        sender.stopProducing()
+
+        # The transfer ends only when the read in progress completes
+        self.assertNoResult(d)
+
+        reads[0].callback(DATA[:1024])
+        self.failureResultOf(d)
+        self.assertEqual(consumer.data, [])
+
+    def test_read_error(self):
+        sender = ThreadedFileSender()
+        consumer = PausingConsumer()
+
+        f = io.BytesIO(DATA)
+        f.close()
+
+        d = sender.beginFileTransfer(f, consumer)
+        self.failureResultOf(d, ValueError)
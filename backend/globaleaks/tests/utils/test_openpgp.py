@@ -0,0 +1,59 @@
+# -*- coding: utf-8
+import os
+from io import BytesIO
+
+from globaleaks.tests import helpers
+from globaleaks.utils import openpgp
+from globaleaks.utils.openpgp import OpenPGPPublicKey
+from globaleaks.utils.pgp import PGPContext
+
+
+class TestOpenPGP(helpers.TestGL):
+    def test_encrypt(self):
+        for key in ['VALID_PGP_KEY1_PRV', 'VALID_PGP_KEY3_PRV', 'VALID_PGP_KEY4_PRV']:
+            pgpctx = PGPContext(helpers.PGPKEYS[key])
+            encryption_key = pgpctx.get_encryption_key()
+
+            # Sizes around the size of the partial bodies of the packets
+            for size in [0, 1, openpgp.PARTIAL_BODY_SIZE - 6, openpgp.PARTIAL_BODY_SIZE * 3 + 1]:
+                data = os.urandom(size)
+
+                for armor in [False, True]:
+                    output = BytesIO()
+                    encryption_key.encrypt(BytesIO(data), output, armor)
+
+                    decrypted = pgpctx.gnupg.decrypt(output.getvalue())
+                    self.assertTrue(decrypted.ok)
+                    self.assertEqual(decrypted.data, data)
+
+    def test_load_key(self):
+        pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+
+        # The encryption subkey is selected
+        self.assertEqual(pgpctx.encryption_key.fingerprint, '4B315CA964D50FC4DF4E0D9D9627366BCD601640')
+        self.assertEqual(pgpctx.encryption_key.keyid.hex().upper(), '9627366BCD601640')
+
+        self.assertRaises(ValueError, OpenPGPPublicKey, helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], '00' * 20)
+        self.assertRaises(ValueError, OpenPGPPublicKey, 'invalid', pgpctx.fingerprint)
+
+    def test_crc24(self):
+        def reference_crc24(data):
+            crc = openpgp.CRC24_INIT
+            for c in data:
+                crc ^= c << 16
+                for _ in range(8):
+                    crc <<= 1
+                    if crc & 0x1000000:
+                        crc ^= openpgp.CRC24_POLY
+
+            return crc
+
+        self.assertEqual(openpgp.crc24(b'123456789'), 0x21cf02)
+
+        for size in [0, 1, 7, 8, 9, 64, 1000, openpgp.PARTIAL_BODY_SIZE + 1]:
+            data = os.urandom(size)
+            self.assertEqual(openpgp.crc24(data), reference_crc24(data))
+
+            # The checksum is updated incrementally by the armor
+            self.assertEqual(openpgp.crc24(data[size // 2:], openpgp.crc24(data[:size // 2])),
+                             reference_crc24(data))
@@ -1,9 +1,38 @@
 # -*- coding: utf-8
 import os
 from datetime import datetime
+from io import BytesIO
 
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils import openpgp, pgp
+from globaleaks.utils.pgp import PGPContext, get_pgp_context, invalidate_pgp_context
+
+
+# Keys of the interoperability tests by the type of their encryption key
+KEY_TYPES = {
+    'VALID_PGP_KEY1_PRV': 'rsa1024',
+    'VALID_PGP_KEY5_PRV': 'rsa2048',
+    'VALID_PGP_KEY6_PRV': 'rsa3072',
+    'VALID_PGP_KEY2_PRV': 'rsa4096',
+    'VALID_PGP_KEY3_PRV': 'cv25519',
+    'VALID_PGP_KEY7_PRV': 'nistp256',
+    'VALID_PGP_KEY4_PRV': 'nistp384',
+    'VALID_PGP_KEY8_PRV': 'nistp521'
+}
+
+
+def get_recipient_keyid(message):
+    """
+    :return: The ID of the key to which a message is encrypted
+    """
+    if message.startswith(b'-----BEGIN'):
+        message = openpgp.dearmor(message)
+
+    tag, body = next(openpgp.iter_packets(message))
+    assert tag == openpgp.TAG_PKESK
+
+    return body[1:9].hex().upper()
 
 
 class TestPGP(helpers.TestGL):
@@ -23,14 +52,91 @@ class TestPGP(helpers.TestGL):
         # these are the same lines used in delivery.py
         pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
 
-        with open(file_src, 'wb+') as f:
-            f.write(self.secret_content.encode())
-            f.seek(0)
+        for encryption_key in (pgpctx.encryption_key, None):
+            # The files are armored both in process and by gpg
+            pgpctx.encryption_key = encryption_key
+
+            with open(file_src, 'wb+') as f:
+                f.write(self.secret_content.encode())
+                f.seek(0)
 
-            pgpctx.encrypt_file(f, file_dst)
+                pgpctx.encrypt_file(f, file_dst)
 
-        with open(file_dst, 'rb') as f:
-            self.assertEqual(str(pgpctx.gnupg.decrypt_file(f)), self.secret_content)
+            with open(file_dst, 'rb') as f:
+                self.assertTrue(f.read().startswith(b'-----BEGIN PGP MESSAGE-----'))
+                f.seek(0)
+                self.assertEqual(str(pgpctx.gnupg.decrypt_file(f)), self.secret_content)
+
+    def test_encrypt_stream(self):
+        pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+
+        plaintext = BytesIO(self.secret_content.encode() * 100)
+        stream = pgpctx.encrypt_stream(plaintext)
+        encrypted = b''.join(iter(lambda: stream.read(1024), b''))
+        stream.close()
+
+        self.assertTrue(plaintext.closed)
+        self.assertEqual(str(pgpctx.gnupg.decrypt(encrypted)), self.secret_content * 100)
+
+    def test_encrypt_key_types(self):
+        file_dst = os.path.join(os.getcwd(), 'test_encrypted_file.txt')
+        plaintext = os.urandom(openpgp.PARTIAL_BODY_SIZE + 1)
+
+        for key, key_type in KEY_TYPES.items():
+            pgpctx = PGPContext(helpers.PGPKEYS[key])
+
+            # The key is used in process without forking gpg
+            encryption_key = pgpctx.get_encryption_key()
+            self.assertIsNotNone(encryption_key, key_type)
+
+            # The key selected is the one that gpg would select
+            encrypted = pgpctx.gnupg.encrypt(b'', pgpctx.fingerprint, armor=False).data
+            self.assertEqual(encryption_key.keyid.hex().upper(), get_recipient_keyid(encrypted), key_type)
+
+            encrypted_body = pgpctx.encrypt_message(self.secret_content)
+            self.assertEqual(str(pgpctx.gnupg.decrypt(encrypted_body)), self.secret_content, key_type)
+
+            pgpctx.encrypt_file(BytesIO(plaintext), file_dst)
+            with open(file_dst, 'rb') as f:
+                self.assertEqual(pgpctx.gnupg.decrypt_file(f).data, plaintext, key_type)
+
+    def test_encrypt_subkey_selection(self):
+        # The key has the encryption subkeys in order of creation:
+        # a valid cv25519, a valid rsa2048, a revoked cv25519 and an expired rsa2048
+        pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY9_PRV'])
+
+        encryption_key = pgpctx.get_encryption_key()
+        self.assertEqual(encryption_key.keyid.hex().upper(), '344EC3E6E714E804')
+        self.assertEqual(encryption_key.algorithm, openpgp.ALGORITHM_RSA)
+
+        encrypted_body = pgpctx.encrypt_message(self.secret_content)
+        self.assertEqual(get_recipient_keyid(encrypted_body.encode()), '344EC3E6E714E804')
+        self.assertEqual(str(pgpctx.gnupg.decrypt(encrypted_body)), self.secret_content)
+
+        encrypted = pgpctx.gnupg.encrypt(b'', pgpctx.fingerprint, armor=False).data
+        self.assertEqual(get_recipient_keyid(encrypted), '344EC3E6E714E804')
+
+    def test_encrypt_gpg_fallback(self):
+        pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+        pgpctx.encryption_key = None
+
+        encrypted_body = pgpctx.encrypt_message(self.secret_content)
+
+        self.assertEqual(str(pgpctx.gnupg.decrypt(encrypted_body)), self.secret_content)
+
+    def test_encrypt_expired_key(self):
+        pgpctx = PGPContext(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB'])
+
+        self.assertIsNone(pgpctx.get_encryption_key())
+        self.assertRaises(errors.InputValidationError, pgpctx.encrypt_message, self.secret_content)
+
+    def test_encrypt_revoked_key(self):
+        pgpctx = PGPContext(helpers.PGPKEYS['REVOKED_PGP_KEY_PUB'])
+
+        self.assertIsNone(pgpctx.get_encryption_key())
+        self.assertRaises(errors.InputValidationError, pgpctx.encrypt_message, self.secret_content)
+        self.assertRaises(errors.InputValidationError, pgpctx.encrypt_file, BytesIO(b'data'),
+                          os.path.join(os.getcwd(), 'test_encrypted_file.txt'))
 
     def test_read_expirations(self):
         pgpctx = PGPContext(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
@@ -42,3 +148,50 @@ class TestPGP(helpers.TestGL):
 
         self.assertEqual(pgpctx.expiration,
                          datetime.utcfromtimestamp(1391012793))
+
+
+class TestPGPContextCache(helpers.TestGL):
+    def setUp(self):
+        self.patch(pgp, '_keyrings', pgp.OrderedDict())
+        return helpers.TestGL.setUp(self)
+
+    def test_get_pgp_context(self):
+        key1 = helpers.PGPKEYS['VALID_PGP_KEY1_PUB']
+        key2 = helpers.PGPKEYS['VALID_PGP_KEY2_PUB']
+
+        pgpctx = get_pgp_context(key1)
+        self.assertIs(get_pgp_context(key1), pgpctx)
+        self.assertIsNot(get_pgp_context(key2), pgpctx)
+
+        # The keyrings are created in the configured directory
+        self.assertEqual(os.path.dirname(pgpctx.tempdir.name), self.state.settings.keyring_path)
+
+    def test_get_pgp_context_eviction(self):
+        self.patch(pgp, 'KEYRING_CACHE_SIZE', 2)
+
+        key1 = helpers.PGPKEYS['VALID_PGP_KEY1_PUB']
+        key2 = helpers.PGPKEYS['VALID_PGP_KEY2_PUB']
+        key3 = helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB']
+
+        pgpctx1 = get_pgp_context(key1)
+        pgpctx2 = get_pgp_context(key2)
+
+        # The least recently used keyring is evicted
+        get_pgp_context(key1)
+        get_pgp_context(key3)
+
+        self.assertEqual(len(pgp._keyrings), 2)
+        self.assertIs(get_pgp_context(key1), pgpctx1)
+        self.assertIsNot(get_pgp_context(key2), pgpctx2)
+
+    def test_invalidate_pgp_context(self):
+        key = helpers.PGPKEYS['VALID_PGP_KEY1_PUB']
+
+        pgpctx = get_pgp_context(key)
+        invalidate_pgp_context(key)
+
+        self.assertIsNot(get_pgp_context(key), pgpctx)
+
+    def test_get_pgp_context_invalid_key(self):
+        self.assertRaises(errors.InputValidationError, get_pgp_context, 'invalid')
+        self.assertEqual(len(pgp._keyrings), 0)
@@ -1,4 +1,7 @@
 # -*- coding: utf-8
+import os
+import pickle
+
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 from globaleaks.utils.securetempfile import SecureTemporaryFile
@@ -16,3 +19,39 @@ class TestSecureTemporaryFiles(helpers.TestGL):
         with a.open('r') as f:
             for x in range(1000):
                 self.assertTrue(antani == f.read(10).decode())
+
+    def test_temporary_file_offsets(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        data = os.urandom(1000)
+
+        # Chunks not aligned to the AES block written in any order
+        with a.open('w') as f:
+            for offset, length in ((517, 483), (0, 17), (17, 14), (31, 486)):
+                f.write(data[offset:offset + length], offset)
+
+        self.assertEqual(a.size, 1000)
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_temporary_file_pickle(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+
+        # Sizes not aligned to the AES block
+        chunks = [os.urandom(n) for n in (1, 15, 17, 1000)]
+
+        for chunk in chunks:
+            with a.open('w') as f:
+                f.write(chunk)
+
+            # The write continues on a copy, as done by another process
+            a = pickle.loads(pickle.dumps(a))
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+        # The file is removed only explicitly
+        del f
+        self.assertTrue(os.path.exists(a.filepath))
+        a.remove()
+        self.assertFalse(os.path.exists(a.filepath))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import threading
+
+from globaleaks.rest import errors
+from globaleaks.sessions import SessionsFactory
+from globaleaks.settings import Settings
+from globaleaks.state import FailedLoginAttemptsDict, RateLimitingDict, State, UsedToken
+from globaleaks.tests import helpers
+from globaleaks.utils.securetempfile import SecureTemporaryFile, write_chunk
+from globaleaks.utils.sharedstate import loads, use_shared_backend, SharedJobsStatus
+from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.token import TokenList
+
+
+class Value(object):
+    pass
+
+
+class FakeJob(object):
+    def get_status(self):
+        return {'name': 'Delivery', 'timings': [(1, 2)], 'metrics': {'backlog': 3}}
+
+
+class TestSharedBackend(helpers.TestGL):
+    def setUp(self):
+        self.path = self.mktemp()
+        self.stores = []
+        return helpers.TestGL.setUp(self)
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+
+        return helpers.TestGL.tearDown(self)
+
+    def process(self, **tempdicts):
+        """
+        Simulate a process attaching its TempDicts to the shared store
+        """
+        self.stores.append(use_shared_backend(tempdicts, self.path))
+        return tempdicts
+
+    def test_entries_are_shared(self):
+        a = self.process(tokens=TokenList(60))['tokens']
+        b = self.process(tokens=TokenList(60))['tokens']
+
+        token = a.new(1)
+        self.assertIn(token.id, b)
+        self.assertEqual(len(b), 1)
+        self.assertEqual(b.get(token.id).tid, 1)
+
+        b.pop(token.id)
+        self.assertNotIn(token.id, a)
+        self.assertRaises(errors.InternalServerError, a.validate, token.id + b':0')
+
+    def test_expiration(self):
+        a = self.process(test=TempDict(10))['test']
+        b = self.process(test=TempDict(10))['test']
+
+        a['x'] = UsedToken('123456')
+        self.test_reactor.advance(5)
+        b.get('x')
+        self.test_reactor.advance(7)
+        self.assertIn('x', a)
+
+        self.test_reactor.advance(10)
+        self.assertNotIn('x', a)
+        self.assertEqual(len(b), 0)
+
+    def test_namespaces_are_isolated(self):
+        tempdicts = self.process(a=TempDict(), b=TempDict())
+
+        tempdicts['a'][1] = UsedToken('123456')
+        self.assertNotIn(1, tempdicts['b'])
+
+    def test_rate_limiting(self):
+        a = self.process(rate_limiting=RateLimitingDict(3600))['rate_limiting']
+        b = self.process(rate_limiting=RateLimitingDict(3600))['rate_limiting']
+
+        a.check(b'key', 2)
+        b.check(b'key', 2)
+        self.assertRaises(errors.ForbiddenOperation, a.check, b'key', 2)
+
+    def test_failed_login_attempts(self):
+        a = self.process(failed_login_attempts=FailedLoginAttemptsDict(60))['failed_login_attempts']
+        b = self.process(failed_login_attempts=FailedLoginAttemptsDict(60))['failed_login_attempts']
+
+        a.increment(1)
+        self.test_reactor.advance(30)
+        b.increment(1)
+        b.increment(2)
+        self.assertEqual(a.count(1), 2)
+        self.assertEqual(a.count(2), 1)
+        self.assertEqual(a.count(3), 0)
+
+        # The counters expire after the timeout from the first failure
+        self.test_reactor.advance(31)
+        self.assertEqual(b.count(1), 0)
+        self.assertEqual(b.count(2), 1)
+
+    def test_upload_files(self):
+        a = self.process(upload_files=TempDict(3600))['upload_files']
+        b = self.process(upload_files=TempDict(3600))['upload_files']
+
+        # The first chunks of an upload are received concurrently by different processes
+        f = a.setdefault('id', SecureTemporaryFile(Settings.tmp_path))
+        self.assertEqual(b.setdefault('id', SecureTemporaryFile(Settings.tmp_path)).filepath, f.filepath)
+
+        # The chunks are received in any order by the two processes
+        chunks = [os.urandom(n) for n in (1000, 1000, 1000, 17)]
+        for i, files in ((3, a), (1, b), (0, a)):
+            self.assertIsNone(write_chunk(files, 'id', chunks[i], i * 1000, i + 1, 4))
+
+        # A chunk sent again is ignored
+        self.assertIsNone(write_chunk(a, 'id', chunks[1], 1000, 2, 4))
+
+        f = write_chunk(b, 'id', chunks[2], 2000, 3, 4)
+        self.assertEqual(f.chunks, {1, 2, 3, 4})
+
+        with a['id'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    def test_upload_files_concurrent_chunks(self):
+        processes = [self.process(upload_files=TempDict(3600))['upload_files'] for _ in range(2)]
+        processes[0]['id'] = SecureTemporaryFile(Settings.tmp_path)
+
+        chunks = [os.urandom(100) for _ in range(40)]
+        completed = []
+
+        def upload(files, numbers):
+            for i in numbers:
+                f = write_chunk(files, 'id', chunks[i], i * 100, i + 1, len(chunks))
+                if f is not None:
+                    completed.append(f)
+
+        # The two processes write the chunks interleaved with each other
+        threads = [threading.Thread(target=upload, args=(processes[i], range(i, len(chunks), 2)))
+                   for i in range(2)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(completed), 1)
+
+        with processes[1]['id'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    def test_sessions(self):
+        a = self.process(sessions=SessionsFactory(timeout=60))['sessions']
+        b = self.process(sessions=SessionsFactory(timeout=60))['sessions']
+
+        session = a.new(1, 'user', 1, 'receiver', 'cc', 'ek')
+        session.properties['key'] = 'value'
+        a.save(session)
+
+        shared = b.get(session.id)
+        self.assertEqual(shared.cc, b'cc')
+        self.assertEqual(shared.properties, {'key': 'value'})
+        self.assertEqual(len(b.get_user_sessions(1, 'user')), 1)
+
+        b.revoke_tenant(1)
+        self.assertIsNone(a.get(session.id))
+
+    def test_jobs_status(self):
+        self.process()
+        self.process()
+        a, b = SharedJobsStatus(self.stores[0]), SharedJobsStatus(self.stores[1])
+
+        self.assertEqual(b.get(), [])
+
+        # The jobs run by the main process are served by the workers
+        self.patch(State, 'jobs', [FakeJob()])
+        self.patch(State, 'jobs_status', a)
+        State.publish_jobs_status()
+
+        self.patch(State, 'jobs', [])
+        self.patch(State, 'jobs_status', b)
+        self.assertEqual(State.get_jobs_status(),
+                         [{'name': 'Delivery', 'timings': [[1, 2]], 'metrics': {'backlog': 3}}])
+
+    def test_unsafe_values_are_refused(self):
+        self.assertRaises(pickle.UnpicklingError, loads, pickle.dumps(Value()))
@@ -15,6 +15,10 @@ class TestObject(object):
             raise Exception
 
 
+class Value(object):
+    pass
+
+
 class TestTempDict(helpers.TestGL):
     def test_timeout(self):
         timeout = 1337
@@ -33,3 +37,86 @@ class TestTempDict(helpers.TestGL):
         self.assertEqual(len(xxx), 0)
 
         self.assertEqual(TestObject.callbacks_count, timeout)
+
+    def test_single_timer(self):
+        xxx = TempDict(timeout=10)
+
+        for x in range(1000):
+            xxx[x] = Value()
+
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 1)
+
+        self.test_reactor.advance(10)
+        self.assertEqual(len(xxx), 0)
+        self.assertEqual(xxx.stats()['expired'], 1000)
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 0)
+
+    def test_reset_timeout_on_access(self):
+        xxx = TempDict(timeout=10)
+        xxx[1] = Value()
+        xxx[2] = Value()
+
+        self.test_reactor.advance(5)
+        xxx.get(1)
+
+        self.test_reactor.advance(5)
+        self.assertTrue(1 in xxx)
+        self.assertFalse(2 in xxx)
+        self.assertEqual(xxx[1].expireCall.getTime(), 15)
+
+        self.test_reactor.advance(5)
+        self.assertEqual(len(xxx), 0)
+
+    def test_max_size(self):
+        xxx = TempDict(timeout=10, max_size=3)
+
+        for x in range(3):
+            xxx[x] = Value()
+            self.test_reactor.advance(1)
+
+        xxx.get(0)
+        xxx[3] = Value()
+
+        self.assertEqual(sorted(xxx.keys()), [0, 2, 3])
+        self.assertEqual(xxx.stats()['evicted'], 1)
+
+    def test_pop(self):
+        xxx = TempDict(timeout=10)
+        xxx[1] = Value()
+        xxx.pop(1)
+        xxx[1] = Value()
+
+        self.test_reactor.advance(5)
+        xxx[1] = Value()
+
+        self.test_reactor.advance(5)
+        self.assertTrue(1 in xxx)
+
+    def test_reset_with_different_timeouts(self):
+        xxx = TempDict(timeout=10)
+        xxx[1] = Value()
+        xxx[2] = Value()
+
+        # An entry reset to a shorter timeout expires before the ones inserted earlier
+        xxx[2].expireCall.reset(2)
+        xxx[1].expireCall.reset(20)
+        xxx[3] = Value()
+
+        self.test_reactor.advance(2)
+        self.assertEqual(sorted(xxx.keys()), [1, 3])
+
+        self.test_reactor.advance(8)
+        self.assertEqual(sorted(xxx.keys()), [1])
+
+        self.test_reactor.advance(10)
+        self.assertEqual(len(xxx), 0)
+
+    def test_max_size_with_different_timeouts(self):
+        xxx = TempDict(timeout=10, max_size=2)
+        xxx[1] = Value()
+        xxx[2] = Value()
+        xxx[1].expireCall.reset(20)
+
+        # The entry closest to the expiration is evicted
+        xxx[3] = Value()
+        self.assertEqual(sorted(xxx.keys()), [1, 3])
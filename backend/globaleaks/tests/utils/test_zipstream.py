@@ -1,14 +1,34 @@
 # -*- coding: utf-8 -*-
 import os
+import shutil
+import subprocess
 
 from io import BytesIO
 from twisted.internet.defer import inlineCallbacks
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 from globaleaks.tests import helpers
+from globaleaks.utils import zipstream
 from globaleaks.utils.zipstream import ZipStream
 
 
+class NonSeekableFile(object):
+    def __init__(self, data):
+        self.fo = BytesIO(data)
+
+    def read(self, size=-1):
+        return self.fo.read(size)
+
+    def close(self):
+        self.fo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class TestZipStream(helpers.TestGL):
     @inlineCallbacks
     def setUp(self):
@@ -39,3 +59,71 @@ class TestZipStream(helpers.TestGL):
                     self.assertTrue(ff.file_size == len(self.unicode_seq.encode()))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_read_zipstream(self):
+        output = BytesIO()
+
+        zipstream = ZipStream(self.files)
+        for data in iter(lambda: zipstream.read(1000), b''):
+            self.assertLessEqual(len(data), 1000)
+            output.write(data)
+
+        zipstream.close()
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual(len(f.infolist()), 3)
+
+    def test_close_zipstream(self):
+        zipstream = ZipStream(self.files)
+        zipstream.read(10)
+        zipstream.close()
+
+        # The file being read is closed with the archive
+        self.assertTrue(self.files[0]['fo'].closed)
+        self.assertEqual(zipstream.read(10), b'')
+
+    def check_archive(self, files):
+        output = self.mktemp()
+
+        with open(output, 'wb') as f:
+            for data in ZipStream(files):
+                f.write(data)
+
+        # The archive is checked as well with a standard unzip tool
+        if shutil.which('unzip'):
+            subprocess.check_call(['unzip', '-tq', output], stdout=subprocess.DEVNULL)
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            return {x.filename: (x.compress_type, x.flag_bits & 0x08) for x in f.infolist()}
+
+    def test_zipstream_compression(self):
+        text = b'GlobaLeaks ' * 10000
+        random = os.urandom(100000)
+
+        infolist = self.check_archive([
+            {'name': 'text.txt', 'fo': BytesIO(text)},
+            {'name': 'image.jpg', 'fo': BytesIO(text)},
+            {'name': 'random.bin', 'fo': BytesIO(random)},
+            {'name': 'stream.bin', 'fo': NonSeekableFile(random)},
+            {'name': 'empty.txt', 'fo': BytesIO(b'')}
+        ])
+
+        self.assertEqual(infolist, {
+            'text.txt': (ZIP_DEFLATED, 0x08),
+            'image.jpg': (ZIP_STORED, 0),
+            'random.bin': (ZIP_STORED, 0),
+            'stream.bin': (ZIP_STORED, 0x08),
+            'empty.txt': (ZIP_STORED, 0)
+        })
+
+    def test_zipstream_compression_zip64(self):
+        self.patch(zipstream, 'ZIP64_LIMIT', 1000)
+
+        infolist = self.check_archive([
+            {'name': 'text.txt', 'fo': BytesIO(b'GlobaLeaks ' * 10000)},
+            {'name': 'random.bin', 'fo': BytesIO(os.urandom(100000))}
+        ])
+
+        self.assertEqual(infolist['random.bin'], (ZIP_STORED, 0))
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import array
 import base64
 import binascii
+import bisect
 import os
 import pyotp
 import random
@@ -8,9 +10,15 @@ import secrets
 import string
 import struct
 import threading
+import time
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import constant_time, hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThreadPool
 
 from nacl.encoding import Base64Encoder
 from nacl.pwhash import argon2id
@@ -19,11 +27,12 @@ from nacl.secret import SecretBox
 from nacl.utils import EncryptedMessage
 from nacl.utils import random as nacl_random
 
-from typing import Any, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 
 crypto_backend = default_backend()
-lock = threading.Lock()
+
+_KDF_THREAD_POOL = None
 
 def _convert_to_bytes(arg: Union[bytes, str]) -> bytes:
     """
@@ -88,33 +97,192 @@ def totpVerify(secret: str, token: str) -> None:
         raise Error
 
 
-def _kdf_argon2(password: bytes, salt: bytes) -> bytes:
-    lock.acquire()
+def _get_available_memory() -> int:
+    """
+    Return an estimate of the memory in bytes available to the process
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
 
     try:
-        salt = base64.b64decode(salt)
-        return argon2id.kdf(32, password, salt[0:16],
-                            opslimit=_GCE.options['OPSLIMIT'] + 1,
-                            memlimit=1 << _GCE.options['MEMLIMIT'])
-    finally:
-        lock.release()
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
 
+class _KDFPool(object):
+    """
+    Bounded pool limiting the concurrency of the memory-hard key derivations
 
-def _hash_argon2(password: bytes, salt: bytes) -> str:
-    lock.acquire()
+    The number of workers is sized on the available cores and on the memory
+    as every Argon2 computation allocates 1 << MEMLIMIT bytes.
 
-    try:
-        salt = base64.b64decode(salt)
-        hash = argon2id.kdf(32, password, salt[0:16],
-                            opslimit=_GCE.options['OPSLIMIT'],
-                            memlimit=1 << _GCE.options['MEMLIMIT'])
-        return base64.b64encode(hash).decode()
+    A tenant may use at most tenant_cap workers whenever other tenants are
+    waiting; idle workers are instead always granted to whoever is waiting.
+    """
+    def __init__(self, workers: Optional[int] = None, tenant_cap: Optional[int] = None) -> None:
+        self.workers = workers
+        self.tenant_cap = tenant_cap
+        self.size = None  # type: Optional[Tuple[int, int]]
+        self.condition = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.running_by_tenant = {}  # type: Dict[Any, int]
+        self.waiting_by_tenant = {}  # type: Dict[Any, int]
+        self.max_waiting = 0
+        self.completed = 0
+        self.wait_time = 0.0
+
+    def configure(self, workers: Optional[int] = None, tenant_cap: Optional[int] = None) -> None:
+        with self.condition:
+            self.workers = workers
+            self.tenant_cap = tenant_cap
+            self.size = None
+            self.condition.notify_all()
+
+    def get_size(self) -> Tuple[int, int]:
+        """
+        Return the number of workers and the tenant cap
+
+        The sizes are computed once, at startup, as the memory allocated by
+        the running derivations would otherwise shrink the pool under load.
+        """
+        if self.size is None:
+            workers = self.workers
+            if not workers:
+                memlimit = 1 << _GCE.options['MEMLIMIT']
+
+                # Keep half of the available memory as headroom for the rest of the process
+                workers = max(1, min(os.cpu_count() or 1, (_get_available_memory() // 2) // memlimit))
+
+            self.size = (workers, self.tenant_cap or max(1, workers // 2))
+
+        return self.size
+
+    def get_workers(self) -> int:
+        return self.get_size()[0]
+
+    def get_tenant_cap(self) -> int:
+        return self.get_size()[1]
+
+    def _others_waiting(self, tid: Any) -> bool:
+        return self.waiting > self.waiting_by_tenant.get(tid, 0)
+
+    def _can_run(self, tid: Any) -> bool:
+        workers, tenant_cap = self.get_size()
+
+        if self.running >= workers:
+            return False
+
+        return self.running_by_tenant.get(tid, 0) < tenant_cap or \
+               not self._others_waiting(tid)
+
+    def run(self, tid: Any, function: Callable[..., Any], *args: Any) -> Any:
+        start = time.monotonic()
+
+        with self.condition:
+            self.waiting += 1
+            self.waiting_by_tenant[tid] = self.waiting_by_tenant.get(tid, 0) + 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+            try:
+                while not self._can_run(tid):
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+                self.waiting_by_tenant[tid] -= 1
+                if not self.waiting_by_tenant[tid]:
+                    del self.waiting_by_tenant[tid]
+
+            self.running += 1
+            self.running_by_tenant[tid] = self.running_by_tenant.get(tid, 0) + 1
+            self.wait_time += time.monotonic() - start
+
+        try:
+            return function(*args)
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.running_by_tenant[tid] -= 1
+                if not self.running_by_tenant[tid]:
+                    del self.running_by_tenant[tid]
+
+                self.completed += 1
+                self.condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'workers': self.get_workers(),
+                'tenant_cap': self.get_tenant_cap(),
+                'running': self.running,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'completed': self.completed,
+                'mean_wait_time': self.wait_time / self.completed if self.completed else 0,
+                'waiting_by_tenant': dict(self.waiting_by_tenant)
+            }
+
+
+kdf_pool = _KDFPool()
 
-    finally:
-        lock.release()
+
+def set_kdf_thread_pool(thread_pool: Any) -> None:
+    global _KDF_THREAD_POOL
+    _KDF_THREAD_POOL = thread_pool
+
+
+def get_kdf_thread_pool() -> Any:
+    return _KDF_THREAD_POOL
+
+
+def defer_kdf(function: Callable[..., Any], *args: Any, **kwargs: Any) -> Deferred:
+    """
+    Run a key derivation in the KDF thread pool so that it could be
+    performed before opening the database transaction that needs its result
+    """
+    if _KDF_THREAD_POOL is None:
+        return maybeDeferred(function, *args, **kwargs)
+
+    return deferToThreadPool(reactor, _KDF_THREAD_POOL, function, *args, **kwargs)
+
+
+def _kdf_argon2(password: bytes, salt: bytes, tid: Any = None) -> bytes:
+    salt = base64.b64decode(salt)
+    return kdf_pool.run(tid, argon2id.kdf, 32, password, salt[0:16],
+                        _GCE.options['OPSLIMIT'] + 1,
+                        1 << _GCE.options['MEMLIMIT'])
+
+
+def _hash_argon2(password: bytes, salt: bytes, tid: Any = None) -> str:
+    salt = base64.b64decode(salt)
+    hash = kdf_pool.run(tid, argon2id.kdf, 32, password, salt[0:16],
+                        _GCE.options['OPSLIMIT'],
+                        1 << _GCE.options['MEMLIMIT'])
+    return base64.b64encode(hash).decode()
+
+
+def _hkdf_expand(key: bytes, info: bytes) -> bytes:
+    return HKDFExpand(algorithm=hashes.SHA256(), length=32, info=info, backend=crypto_backend).derive(key)
 
 
 class _StreamingEncryptionObject(object):
+    """
+    File encrypted with a random key sealed for the user
+
+    The file is made of the sealed key (80 bytes) and a partial nonce
+    (16 bytes) followed by the chunks of data, each one stored as a byte
+    signaling the last chunk, the length of the plaintext (4 bytes) and the
+    ciphertext authenticated by SecretBox.
+    """
+    header_size = 96
+    chunk_overhead = 1 + 4 + SecretBox.MACBYTES
+
     def __init__(self, mode: str, user_key: Union[bytes, str], filepath: str) -> None:
         self.mode = mode
         self.user_key = user_key
@@ -139,6 +307,18 @@ class _StreamingEncryptionObject(object):
 
         self.box = SecretBox(self.key)
 
+        # Plaintext of the current chunk and position in the plaintext
+        self.buffer = b''
+        self.buffer_offset = 0
+        self.position = 0
+        self.skip = 0
+
+        # Layout of the chunks, computed on the first seek
+        self.chunk_size = None
+        self.chunk_positions = None
+        self.chunk_offsets = None
+        self.size = None
+
     def fullNonce(self, i: int) -> bytes:
         return self.partial_nonce + struct.pack('<Q', i)
 
@@ -171,9 +351,195 @@ class _StreamingEncryptionObject(object):
         chunk = self.fd.read(chunkLen + 16)
         return last, self.box.decrypt(chunk, chunkNonce)
 
-    def read(self, a: int) -> bytes:
-        if not self.EOF:
-            return self.decrypt_chunk()[1]
+    def _load_chunk(self) -> None:
+        self.buffer = self.decrypt_chunk()[1]
+        self.buffer_offset, self.skip = self.skip, 0
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes of the plaintext, or up to its end if size is negative
+        """
+        data = []
+
+        while size:
+            if self.buffer_offset >= len(self.buffer):
+                if self.EOF:
+                    break
+
+                self._load_chunk()
+                continue
+
+            end = len(self.buffer) if size < 0 else min(len(self.buffer), self.buffer_offset + size)
+            data.append(self.buffer[self.buffer_offset:end])
+
+            if size > 0:
+                size -= end - self.buffer_offset
+
+            self.position += end - self.buffer_offset
+            self.buffer_offset = end
+
+        return b''.join(data)
+
+    def _read_chunk_header(self, offset: int) -> Tuple[int, int]:
+        self.fd.seek(offset)
+        header = self.fd.read(5)
+        if len(header) != 5:
+            raise ValueError("Truncated file")
+
+        return struct.unpack('>BI', header)
+
+    def _index_chunks(self) -> None:
+        """
+        Compute the layout of the chunks of the file
+
+        The chunks preceding the last one are written with the same length
+        so that their offsets are computed from the size of the file; the
+        files not respecting this layout are indexed walking their chunks.
+        """
+        file_size = os.fstat(self.fd.fileno()).st_size
+
+        last, length = self._read_chunk_header(self.header_size)
+        if last:
+            self._walk_chunks()
+            return
+
+        if length:
+            stride = length + self.chunk_overhead
+            count = (file_size - self.header_size - self.chunk_overhead) // stride
+            last_offset = self.header_size + count * stride
+            last_length = file_size - last_offset - self.chunk_overhead
+
+            if count and self._read_chunk_header(last_offset) == (1, last_length):
+                self.chunk_size = length
+                self.size = count * length + last_length
+                return
+
+        self._walk_chunks()
+
+    def _walk_chunks(self) -> None:
+        """
+        Index the chunks of the file reading their headers
+
+        The index is kept as two arrays of integers holding the position of
+        the plaintext and the offset in the file at which each chunk begins.
+        The index in use is replaced only once the walk is complete.
+        """
+        chunk_positions = array.array('q')
+        chunk_offsets = array.array('q')
+
+        offset, position = self.header_size, 0
+        while True:
+            last, length = self._read_chunk_header(offset)
+            chunk_positions.append(position)
+            chunk_offsets.append(offset)
+            if last:
+                break
+
+            offset += length + self.chunk_overhead
+            position += length
+
+        self.chunk_size = None
+        self.chunk_positions = chunk_positions
+        self.chunk_offsets = chunk_offsets
+        self.size = position + length
+
+    def _locate(self, position: int) -> Tuple[int, int, int]:
+        """
+        :return: A tuple (index, offset, start) of the chunk containing a position of the plaintext
+        """
+        if self.chunk_size is not None:
+            index = min(position, self.size - 1) // self.chunk_size
+            offset = self.header_size + index * (self.chunk_size + self.chunk_overhead)
+
+            # Chunks of unexpected length reveal a different layout
+            last, length = self._read_chunk_header(offset)
+            if last or length == self.chunk_size:
+                return index, offset, index * self.chunk_size
+
+            self._walk_chunks()
+
+        index = bisect.bisect_right(self.chunk_positions, position) - 1
+
+        return index, self.chunk_offsets[index], self.chunk_positions[index]
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Move to a position of the plaintext
+
+        Only the chunk containing the position is decrypted, on the next read.
+
+        :return: The new position
+        """
+        if self.size is None:
+            self._index_chunks()
+
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise ValueError("Negative seek position %d" % offset)
+
+        self.position = offset
+        self.buffer, self.buffer_offset, self.skip = b'', 0, 0
+
+        if offset >= self.size:
+            self.EOF = True
+            return offset
+
+        self.index, chunk_offset, start = self._locate(offset)
+        self.fd.seek(chunk_offset)
+        self.skip = offset - start
+        self.EOF = False
+
+        return offset
+
+    def tell(self) -> int:
+        return self.position
+
+    def seekable(self) -> bool:
+        return self.mode == 'DECRYPT'
+
+    def get_size(self) -> int:
+        """
+        :return: The size of the plaintext
+        """
+        if self.size is None:
+            self._index_chunks()
+
+        return self.size
+
+    def verify(self) -> bool:
+        """
+        Verify the integrity of the file without decrypting all of it
+
+        The chunks are checked to cover exactly the file and the last one,
+        whose nonce differs from the one of the others, is authenticated so
+        that truncations of the file are detected.
+        """
+        position = self.position
+
+        try:
+            self._walk_chunks()
+
+            last_offset = self.chunk_offsets[-1]
+            if last_offset + self.chunk_overhead + self.size - self.chunk_positions[-1] != \
+                    os.fstat(self.fd.fileno()).st_size:
+                return False
+
+            self.fd.seek(last_offset)
+            self.decrypt_chunk()
+        except Exception:
+            return False
+        finally:
+            if self.size is None:
+                # The file could not be indexed at all
+                self.position = position
+            else:
+                self.seek(position)
+
+        return True
 
     def close(self) -> None:
         if self.fd is not None:
@@ -211,24 +577,24 @@ class _GCE(object):
         return base64.b64encode(os.urandom(16)).decode()
 
     @staticmethod
-    def hash_password(password: str, salt: str) -> str:
+    def hash_password(password: str, salt: str, tid: Any = None) -> str:
         """
         Return the hash a password
         """
         password = _convert_to_bytes(password)
         salt = _convert_to_bytes(salt)
 
-        return _hash_argon2(password, salt)
+        return _hash_argon2(password, salt, tid)
 
     @staticmethod
-    def check_password(password: str, salt: str, hash: str) -> bool:
+    def check_password(password: str, salt: str, hash: str, tid: Any = None) -> bool:
         """
         Perform password check for match with a provided hash
         """
         password = _convert_to_bytes(password)
         salt = _convert_to_bytes(salt)
         hash = _convert_to_bytes(hash)
-        x = _convert_to_bytes(_hash_argon2(password, salt))
+        x = _convert_to_bytes(_hash_argon2(password, salt, tid))
 
         return constant_time.bytes_eq(x, hash)
 
@@ -240,14 +606,39 @@ class _GCE(object):
         return nacl_random(32)
 
     @staticmethod
-    def derive_key(password: Union[bytes, str], salt: str) -> bytes:
+    def derive_key(password: Union[bytes, str], salt: str, tid: Any = None) -> bytes:
         """
         Perform key derivation from a user password
         """
         password = _convert_to_bytes(password)
         salt = _convert_to_bytes(salt)
 
-        return _kdf_argon2(password, salt)
+        return _kdf_argon2(password, salt, tid)
+
+    @staticmethod
+    def derive_receipt(receipt: Union[bytes, str], salt: str, tid: Any = None) -> Tuple[str, bytes]:
+        """
+        Perform a single key derivation of a whistleblower receipt
+
+        The output of the KDF is expanded via HKDF in two independent values:
+        the hash used to authenticate the whistleblower and the key used to
+        protect the whistleblower private key.
+
+        The KDF uses a salt derived from the one of the legacy scheme so that
+        its output is never equal to a receipt hash of the legacy scheme
+        that could be left in a backup of the database.
+
+        :return: A tuple (hash, key)
+        """
+        receipt = _convert_to_bytes(receipt)
+        salt = base64.b64encode(_hkdf_expand(base64.b64decode(salt), b'GlobaLeaks receipt salt'))
+
+        secret = _kdf_argon2(receipt, salt, tid)
+
+        hash = base64.b64encode(_hkdf_expand(secret, b'GlobaLeaks receipt hash')).decode()
+        key = _hkdf_expand(secret, b'GlobaLeaks receipt key')
+
+        return hash, key
 
     @staticmethod
     def generate_keypair() -> Tuple[bytes, bytes]:
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#   filesender
+#   **********
+#
+# Producer streaming files to the clients reading them in a thread pool so
+# that the decryption of the files, and the disk accesses, never block the
+# reactor.
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+
+_FILE_THREAD_POOL = None
+
+
+def set_file_thread_pool(thread_pool):
+    global _FILE_THREAD_POOL
+    _FILE_THREAD_POOL = thread_pool
+
+
+def get_file_thread_pool():
+    return _FILE_THREAD_POOL
+
+
+class ThreadedFileSender(object):
+    """
+    Push producer reading a file in the file thread pool
+
+    The file is read sequentially, a chunk at a time, while the chunks
+    already read are written to the consumer; at most max_pending chunks
+    are kept in memory while the consumer is paused.
+
+    The interface is the one of twisted.protocols.basic.FileSender.
+    """
+    CHUNK_SIZE = 2 ** 16
+    max_pending = 4
+
+    def __init__(self):
+        self.file = None
+        self.consumer = None
+        self.deferred = None
+        self.queue = deque()
+        self.reading = False
+        self.paused = False
+        self.eof = False
+        self.failure = None
+        self.lastSent = b''
+
+    def beginFileTransfer(self, file, consumer):
+        """
+        Begin transferring a file
+
+        :param file: A file-like object
+        :param consumer: A consumer, like a `twisted.web.Request`
+        :return: A deferred fired with the last byte sent when the transfer
+                 completes or failed if the transfer is interrupted
+        """
+        self.file = file
+        self.consumer = consumer
+        self.deferred = d = Deferred()
+
+        self.consumer.registerProducer(self, True)
+        self.schedule_read()
+
+        return d
+
+    def read(self):
+        if _FILE_THREAD_POOL is None:
+            return maybeDeferred(self.file.read, self.CHUNK_SIZE)
+
+        return deferToThreadPool(reactor, _FILE_THREAD_POOL, self.file.read, self.CHUNK_SIZE)
+
+    def schedule_read(self):
+        if self.reading or self.eof or self.deferred is None or len(self.queue) >= self.max_pending:
+            return
+
+        self.reading = True
+        self.read().addCallbacks(self.on_read, self.on_read_error)
+
+    def on_read(self, chunk):
+        self.reading = False
+
+        if self.failure is not None:
+            # The transfer was stopped while reading
+            self.finish()
+            return
+
+        if not chunk:
+            self.eof = True
+        else:
+            self.queue.append(chunk)
+
+        self.flush()
+        self.schedule_read()
+
+    def on_read_error(self, failure):
+        self.reading = False
+        self.failure = failure
+        self.finish()
+
+    def flush(self):
+        while self.queue and not self.paused and self.deferred is not None:
+            chunk = self.queue.popleft()
+            self.lastSent = chunk[-1:]
+            self.consumer.write(chunk)
+
+        if self.eof and not self.queue:
+            self.finish()
+
+    def finish(self):
+        """
+        Fire the deferred of the transfer once no read is in progress so
+        that the file could be safely closed
+        """
+        if self.deferred is None or self.reading:
+            return
+
+        d, self.deferred = self.deferred, None
+        self.queue.clear()
+
+        if self.failure is not None:
+            d.errback(self.failure)
+            return
+
+        self.consumer.unregisterProducer()
+        d.callback(self.lastSent)
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.flush()
+        self.schedule_read()
+
+    def stopProducing(self):
+        if self.deferred is not None and self.failure is None:
+            self.failure = Exception("Consumer asked us to stop producing")
+            self.finish()
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+#   openpgp
+#   *******
+#
+# In-process implementation of the OpenPGP encryption to a public key
+# (RFC 4880, RFC 6637) producing the messages that gpg would produce without
+# forking a gpg process for each operation.
+#
+# Only the encryption is implemented; the keys are validated by gpg when
+# imported and the keys using algorithms not implemented here are left to gpg.
+import base64
+import hashlib
+import os
+import struct
+
+from functools import lru_cache
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, x25519
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap
+
+crypto_backend = default_backend()
+
+# Packet tags
+TAG_PKESK = 1
+TAG_SECRET_KEY = 5
+TAG_PUBLIC_KEY = 6
+TAG_SECRET_SUBKEY = 7
+TAG_LITERAL_DATA = 11
+TAG_PUBLIC_SUBKEY = 14
+TAG_SEIPD = 18
+TAG_MDC = 19
+
+KEY_TAGS = (TAG_SECRET_KEY, TAG_PUBLIC_KEY, TAG_SECRET_SUBKEY, TAG_PUBLIC_SUBKEY)
+
+# Public key algorithms
+ALGORITHM_RSA = 1
+ALGORITHM_RSA_ENCRYPT_ONLY = 2
+ALGORITHM_ECDH = 18
+
+# Curves of the ECDH keys indexed by their OID
+CURVE_25519 = b'\x2b\x06\x01\x04\x01\x97\x55\x01\x05\x01'
+
+CURVES = {
+    CURVE_25519: None,
+    b'\x2a\x86\x48\xce\x3d\x03\x01\x07': ec.SECP256R1,
+    b'\x2b\x81\x04\x00\x22': ec.SECP384R1,
+    b'\x2b\x81\x04\x00\x23': ec.SECP521R1
+}
+
+# Hash algorithms of the ECDH key derivation
+KDF_HASHES = {
+    8: hashlib.sha256,
+    9: hashlib.sha384,
+    10: hashlib.sha512
+}
+
+# Key sizes of the symmetric algorithms (AES-128, AES-192, AES-256)
+SYMMETRIC_KEY_SIZES = {
+    7: 16,
+    8: 24,
+    9: 32
+}
+
+# Symmetric algorithm of the messages (AES-256)
+SYMMETRIC_ALGORITHM = 9
+
+# Size of the chunks read from the files encrypted
+CHUNK_SIZE = 64 * 1024
+
+# Size of the partial bodies of the packets of unknown length
+PARTIAL_BODY_POWER = 16
+PARTIAL_BODY_SIZE = 1 << PARTIAL_BODY_POWER
+
+# Checksum of the armor, required by gpg to decode the messages split in
+# partial bodies
+CRC24_INIT = 0xb704ce
+CRC24_POLY = 0x1864cfb
+
+
+def clmul(x, y):
+    """
+    Carry-less multiplication of two polynomials over GF(2)
+    """
+    result = 0
+    while y:
+        shift = (y & -y).bit_length() - 1
+        result ^= x << shift
+        y &= y - 1
+
+    return result
+
+
+def polymod(x, p):
+    """
+    Remainder of the division of two polynomials over GF(2)
+    """
+    degree = p.bit_length() - 1
+    while x.bit_length() > degree:
+        x ^= p << (x.bit_length() - 1 - degree)
+
+    return x
+
+
+@lru_cache(maxsize=None)
+def xpow_mod(k):
+    """
+    :return: x^k modulo the polynomial of the CRC24
+    """
+    result, base = 1, 2
+    while k:
+        if k & 1:
+            result = polymod(clmul(result, base), CRC24_POLY)
+
+        base = polymod(clmul(base, base), CRC24_POLY)
+        k >>= 1
+
+    return result
+
+
+def crc24(data, crc=CRC24_INIT):
+    """
+    Compute the CRC24 of the armor
+
+    The data is handled as a single polynomial reduced by folding its upper
+    half onto the lower one, so that the work is done by the operations on
+    the integers instead of by a loop on the bytes.
+    """
+    x = (crc << (8 * len(data))) ^ (int.from_bytes(data, 'big') << 24)
+
+    while x.bit_length() > 64:
+        k = 1 << ((x.bit_length() - 1).bit_length() - 1)
+        x = clmul(x >> k, xpow_mod(k)) ^ (x & ((1 << k) - 1))
+
+    return polymod(x, CRC24_POLY)
+
+
+def dearmor(data):
+    """
+    Decode an ASCII armored block
+
+    :param data: The armored block
+    :return: The binary content of the block
+    """
+    if isinstance(data, bytes):
+        data = data.decode('ascii')
+
+    lines = [line.strip() for line in data.strip().splitlines()]
+    if not lines or not lines[0].startswith('-----BEGIN PGP'):
+        raise ValueError("Invalid armor")
+
+    # The body follows the headers ended by an empty line
+    start = lines.index('') + 1 if '' in lines else 1
+
+    body = []
+    for line in lines[start:]:
+        if line.startswith('=') or line.startswith('-----END'):
+            break
+
+        body.append(line)
+
+    return base64.b64decode(''.join(body), validate=True)
+
+
+def iter_packets(data):
+    """
+    Iterate over the packets of a binary OpenPGP block
+
+    :param data: The binary block
+    :return: An iterator of tuples (tag, body)
+    """
+    offset = 0
+
+    while offset < len(data):
+        ctb = data[offset]
+        offset += 1
+
+        if not ctb & 0x80:
+            raise ValueError("Invalid packet")
+
+        if ctb & 0x40:
+            tag = ctb & 0x3f
+            octet = data[offset]
+            if octet < 192:
+                length = octet
+                offset += 1
+            elif octet < 224:
+                length = ((octet - 192) << 8) + data[offset + 1] + 192
+                offset += 2
+            elif octet == 255:
+                length = struct.unpack('>L', data[offset + 1:offset + 5])[0]
+                offset += 5
+            else:
+                # Partial body lengths are never used by the keys
+                raise ValueError("Invalid packet length")
+        else:
+            tag = (ctb >> 2) & 0x0f
+            length_type = ctb & 0x03
+            if length_type == 3:
+                raise ValueError("Invalid packet length")
+
+            length_size = 1 << length_type
+            length = int.from_bytes(data[offset:offset + length_size], 'big')
+            offset += length_size
+
+        body = data[offset:offset + length]
+        if len(body) != length:
+            raise ValueError("Truncated packet")
+
+        offset += length
+
+        yield tag, body
+
+
+def read_mpi(data, offset):
+    bits = struct.unpack('>H', data[offset:offset + 2])[0]
+    end = offset + 2 + (bits + 7) // 8
+    if end > len(data):
+        raise ValueError("Truncated MPI")
+
+    return data[offset + 2:end], end
+
+
+def encode_mpi(data):
+    data = data.lstrip(b'\x00')
+    return struct.pack('>H', int.from_bytes(data, 'big').bit_length()) + data
+
+
+def encode_length(length):
+    if length < 192:
+        return bytes([length])
+
+    if length < 8384:
+        length -= 192
+        return bytes([(length >> 8) + 192, length & 0xff])
+
+    return b'\xff' + struct.pack('>L', length)
+
+
+def encode_packet(tag, body):
+    return bytes([0xc0 | tag]) + encode_length(len(body)) + body
+
+
+class OpenPGPPublicKey(object):
+    """
+    Public key of a key, or of a subkey, used to encrypt the messages
+    """
+    def __init__(self, key, fingerprint):
+        """
+        :param key: The armored key including the public key
+        :param fingerprint: The fingerprint of the public key or subkey
+        """
+        self.algorithm = None
+        self.fingerprint = fingerprint.upper()
+
+        for tag, body in iter_packets(dearmor(key)):
+            if tag in KEY_TAGS and self.load(body):
+                break
+        else:
+            raise ValueError("Key not found")
+
+        self.keyid = bytes.fromhex(self.fingerprint)[-8:]
+
+    def load(self, body):
+        """
+        Load the public key material of a key packet
+
+        :return: True if the packet is the one of the key looked for
+        """
+        if body[0] != 4:
+            return False
+
+        algorithm = body[5]
+        offset = 6
+
+        if algorithm in (ALGORITHM_RSA, ALGORITHM_RSA_ENCRYPT_ONLY):
+            n, offset = read_mpi(body, offset)
+            e, offset = read_mpi(body, offset)
+        elif algorithm == ALGORITHM_ECDH:
+            oid = body[offset + 1:offset + 1 + body[offset]]
+            point, offset = read_mpi(body, offset + 1 + body[offset])
+            kdf_params = body[offset + 1:offset + 1 + body[offset]]
+            offset += 1 + body[offset]
+        else:
+            return False
+
+        fingerprint = hashlib.sha1(b'\x99' + struct.pack('>H', offset) + body[:offset]).hexdigest().upper()
+        if fingerprint != self.fingerprint:
+            return False
+
+        if algorithm == ALGORITHM_ECDH:
+            if oid not in CURVES or len(kdf_params) != 3 or \
+               kdf_params[1] not in KDF_HASHES or kdf_params[2] not in SYMMETRIC_KEY_SIZES:
+                raise ValueError("Unsupported ECDH parameters")
+
+            self.oid, self.point, self.kdf_params = oid, point, kdf_params
+        else:
+            self.public_key = rsa.RSAPublicNumbers(int.from_bytes(e, 'big'),
+                                                   int.from_bytes(n, 'big')).public_key(crypto_backend)
+
+        self.algorithm = algorithm
+
+        return True
+
+    def encrypt_session_key(self, session_key):
+        """
+        :param session_key: The key of the message
+        :return: The body of the public-key encrypted session key packet
+        """
+        m = bytes([SYMMETRIC_ALGORITHM]) + session_key + struct.pack('>H', sum(session_key) & 0xffff)
+
+        if self.algorithm == ALGORITHM_ECDH:
+            encrypted = self.ecdh_wrap(m)
+        else:
+            encrypted = encode_mpi(self.public_key.encrypt(m, padding.PKCS1v15()))
+
+        return b'\x03' + self.keyid + bytes([self.algorithm]) + encrypted
+
+    def ecdh_wrap(self, m):
+        curve = CURVES[self.oid]
+
+        if curve is None:
+            ephemeral = x25519.X25519PrivateKey.generate()
+            shared = ephemeral.exchange(x25519.X25519PublicKey.from_public_bytes(self.point[1:]))
+            ephemeral_point = b'\x40' + ephemeral.public_key().public_bytes(serialization.Encoding.Raw,
+                                                                            serialization.PublicFormat.Raw)
+        else:
+            ephemeral = ec.generate_private_key(curve(), crypto_backend)
+            public_key = ec.EllipticCurvePublicKey.from_encoded_point(curve(), self.point)
+            shared = ephemeral.exchange(ec.ECDH(), public_key)
+            ephemeral_point = ephemeral.public_key().public_bytes(serialization.Encoding.X962,
+                                                                  serialization.PublicFormat.UncompressedPoint)
+
+        kdf_hash, kek_algorithm = self.kdf_params[1], self.kdf_params[2]
+
+        params = bytes([len(self.oid)]) + self.oid + bytes([ALGORITHM_ECDH]) + \
+                 b'\x03' + self.kdf_params + b'Anonymous Sender    ' + bytes.fromhex(self.fingerprint)
+
+        kek = KDF_HASHES[kdf_hash](b'\x00\x00\x00\x01' + shared + params).digest()
+        kek = kek[:SYMMETRIC_KEY_SIZES[kek_algorithm]]
+
+        pad = 8 - len(m) % 8
+        wrapped = aes_key_wrap(kek, m + bytes([pad]) * pad, crypto_backend)
+
+        return encode_mpi(ephemeral_point) + bytes([len(wrapped)]) + wrapped
+
+    def encrypt(self, input_file, output, armor=False):
+        """
+        Encrypt a file to the key
+
+        :param input_file: A file-like object opened in binary mode
+        :param output: A file-like object opened in binary mode
+        :param armor: True to write an ASCII armored message
+        """
+        session_key = os.urandom(SYMMETRIC_KEY_SIZES[SYMMETRIC_ALGORITHM])
+
+        if armor:
+            output = ArmorWriter(output)
+
+        output.write(encode_packet(TAG_PKESK, self.encrypt_session_key(session_key)))
+
+        encrypted = EncryptedDataWriter(session_key, output)
+
+        literal = PacketWriter(TAG_LITERAL_DATA, encrypted)
+        literal.write(b'b\x00\x00\x00\x00\x00')
+
+        for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            literal.write(chunk)
+
+        literal.close()
+        encrypted.close()
+
+        if armor:
+            output.close()
+
+
+class PacketWriter(object):
+    """
+    Writer of a packet of unknown length split in partial bodies
+    """
+    def __init__(self, tag, output):
+        self.output = output
+        self.header = bytes([0xc0 | tag])
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer.extend(data)
+
+        # The last part of a packet is never a partial body
+        while len(self.buffer) > PARTIAL_BODY_SIZE:
+            self.output.write(self.header + bytes([224 + PARTIAL_BODY_POWER]) + bytes(self.buffer[:PARTIAL_BODY_SIZE]))
+            self.header = b''
+            del self.buffer[:PARTIAL_BODY_SIZE]
+
+    def close(self):
+        self.output.write(self.header + encode_length(len(self.buffer)) + bytes(self.buffer))
+
+
+class EncryptedDataWriter(object):
+    """
+    Writer of a symmetrically encrypted and integrity protected data packet
+    """
+    def __init__(self, session_key, output):
+        self.packet = PacketWriter(TAG_SEIPD, output)
+        self.packet.write(b'\x01')
+
+        block_size = algorithms.AES.block_size // 8
+        self.encryptor = Cipher(algorithms.AES(session_key),
+                                modes.CFB(b'\x00' * block_size),
+                                backend=crypto_backend).encryptor()
+        self.mdc = hashlib.sha1()
+
+        prefix = os.urandom(block_size)
+        self.write(prefix + prefix[-2:])
+
+    def write(self, data):
+        self.mdc.update(data)
+        self.packet.write(self.encryptor.update(data))
+
+    def close(self):
+        header = bytes([0xc0 | TAG_MDC, 20])
+        self.mdc.update(header)
+        self.packet.write(self.encryptor.update(header + self.mdc.digest()) + self.encryptor.finalize())
+        self.packet.close()
+
+
+class ArmorWriter(object):
+    """
+    Writer of an ASCII armored message
+    """
+    def __init__(self, output):
+        self.output = output
+        self.buffer = bytearray()
+        self.crc = CRC24_INIT
+        self.output.write(b'-----BEGIN PGP MESSAGE-----\n\n')
+
+    def write(self, data):
+        self.crc = crc24(data, self.crc)
+        self.buffer.extend(data)
+
+        # Lines of 64 characters encode 48 bytes
+        size = len(self.buffer) - len(self.buffer) % 48
+        if size:
+            self.output.write(self.encode(self.buffer[:size]))
+            del self.buffer[:size]
+
+    def encode(self, data):
+        encoded = base64.b64encode(bytes(data))
+        return b''.join(encoded[i:i + 64] + b'\n' for i in range(0, len(encoded), 64))
+
+    def close(self):
+        self.output.write(self.encode(self.buffer) +
+                          b'=' + base64.b64encode(self.crc.to_bytes(3, 'big')) + b'\n' +
+                          b'-----END PGP MESSAGE-----\n')
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
+import subprocess
+import threading
+import time
 
+from collections import OrderedDict
 from datetime import datetime
+from io import BytesIO
 
 from tempfile import TemporaryDirectory
 
@@ -9,17 +15,105 @@ from gnupg import GPG
 
 from globaleaks.rest import errors
 from globaleaks.utils.log import log
+from globaleaks.utils.openpgp import OpenPGPPublicKey
+
+# Number of keyrings kept ready to be used
+KEYRING_CACHE_SIZE = 128
+
+# Directory of the keyrings, preferably on a ramdisk
+_KEYRING_PATH = None
+
+_keyrings = OrderedDict()
+_keyrings_lock = threading.Lock()
+
+
+def set_keyring_path(path):
+    global _KEYRING_PATH
+    _KEYRING_PATH = path
+
+
+def get_key_digest(key):
+    if isinstance(key, str):
+        key = key.encode()
+
+    return hashlib.sha256(key).digest()
+
+
+def get_pgp_context(key):
+    """
+    Return a context ready to encrypt with a PGP key
+
+    The contexts are cached by the digest of the key so that each key is
+    imported only once; a key updated by its user gets a new context while
+    the previous one gets evicted.
+
+    :param key: The PGP key to be loaded
+    :return: A PGPContext
+    """
+    digest = get_key_digest(key)
+
+    with _keyrings_lock:
+        pgpctx = _keyrings.get(digest)
+        if pgpctx is not None:
+            _keyrings.move_to_end(digest)
+            return pgpctx
+
+    pgpctx = PGPContext(key, _KEYRING_PATH)
+
+    with _keyrings_lock:
+        _keyrings[digest] = pgpctx
+        while len(_keyrings) > KEYRING_CACHE_SIZE:
+            _keyrings.popitem(last=False)
+
+    return pgpctx
+
+
+def invalidate_pgp_context(key):
+    """
+    Evict the context of a PGP key no longer used
+
+    The keyring is removed once the operations in progress complete.
+    """
+    with _keyrings_lock:
+        _keyrings.pop(get_key_digest(key), None)
+
+
+def select_encryption_key(key_info):
+    """
+    Select the key used by gpg to encrypt to a key: the most recent valid
+    subkey capable of encryption or else the primary key
+
+    :param key_info: The description of a key as listed by gpg
+    :return: A tuple (fingerprint, expiration timestamp) or None
+    """
+    invalid = ('e', 'r', 'i', 'd')
+
+    candidates = []
+    for subkey in key_info['subkeys']:
+        info = key_info['subkey_info'][subkey[0]]
+        if 'e' in info['cap'] and info['trust'] not in invalid:
+            candidates.append((int(info['date']), subkey[2], int(info['expires'] or 0)))
+
+    if candidates:
+        return max(candidates)[1:]
+
+    if 'e' in key_info['cap'] and key_info['trust'] not in invalid:
+        return key_info['fingerprint'], int(key_info['expires'] or 0)
 
 
 class PGPContext(object):
-    def __init__(self, key):
+    def __init__(self, key, path=None):
         """
         :param key: The PGP key to be loaded
+        :param path: The directory in which to create the keyring
         """
         self.fingerprint = ''
         self.expiration = datetime.utcfromtimestamp(0)
+        self.expiration_timestamp = 0
+        self.encryption_key = None
+        self.encryption_expiration = 0
 
-        self.tempdir = TemporaryDirectory()
+        self.tempdir = TemporaryDirectory(dir=path)
 
         try:
             self.gnupg = GPG(gnupghome=self.tempdir.name, options=['--trust-model', 'always'])
@@ -42,17 +136,59 @@ class PGPContext(object):
             for k in all_keys:
                 if k['fingerprint'] == self.fingerprint:
                     if k['expires']:
-                        self.expiration = datetime.utcfromtimestamp(int(k['expires']))
+                        self.expiration_timestamp = int(k['expires'])
+                        self.expiration = datetime.utcfromtimestamp(self.expiration_timestamp)
+
+                    self.load_encryption_key(key, k)
                     break
 
         except Exception as excep:
             log.err("Error in PGP import_keys: %s", excep)
             raise errors.InputValidationError
 
+    def load_encryption_key(self, key, key_info):
+        """
+        Load the key used to encrypt in process
+
+        The keys whose algorithms are not implemented in process are left to gpg.
+        """
+        try:
+            selected = select_encryption_key(key_info)
+            if selected is not None:
+                self.encryption_key = OpenPGPPublicKey(key, selected[0])
+                self.encryption_expiration = selected[1]
+        except Exception as excep:
+            log.debug("Unable to load the PGP key %s in process: %s", self.fingerprint, excep)
+            self.encryption_key = None
+
+    def get_encryption_key(self):
+        """
+        :return: The key used to encrypt in process or None to use gpg
+        """
+        # The keys expired once loaded are left to gpg, which rejects them
+        for expiration in (self.encryption_expiration, self.expiration_timestamp):
+            if expiration and expiration <= time.time():
+                return None
+
+        return self.encryption_key
+
     def encrypt_file(self, input_file, output_path):
         """
         Encrypt a file with the specified PGP key
+
+        The file is written as an ASCII armored OpenPGP message.
         """
+        encryption_key = self.get_encryption_key()
+        if encryption_key is not None:
+            try:
+                with open(output_path, 'wb') as output_file:
+                    encryption_key.encrypt(input_file, output_file, armor=True)
+            except Exception as excep:
+                log.err("Error in PGP encryption: %s", excep)
+                raise errors.InputValidationError
+
+            return None, os.stat(output_path).st_size
+
         encrypted_obj = self.gnupg.encrypt_file(input_file, self.fingerprint, output=output_path)
 
         if not encrypted_obj.ok:
@@ -60,13 +196,95 @@ class PGPContext(object):
 
         return encrypted_obj, os.stat(output_path).st_size
 
+    def encrypt_stream(self, input_file):
+        """
+        Encrypt a file on the fly with the specified PGP key
+
+        :param input_file: A file-like object
+        :return: A file-like object reading the encrypted file
+        """
+        return PGPEncryptedStream(self, input_file)
+
     def encrypt_message(self, plaintext):
         """
         Encrypt a text message with the specified key
         """
+        encryption_key = self.get_encryption_key()
+        if encryption_key is not None:
+            if isinstance(plaintext, str):
+                plaintext = plaintext.encode()
+
+            output = BytesIO()
+            encryption_key.encrypt(BytesIO(plaintext), output, armor=True)
+            return output.getvalue().decode()
+
         encrypted_obj = self.gnupg.encrypt(plaintext, self.fingerprint)
 
         if not encrypted_obj.ok:
             raise errors.InputValidationError
 
         return str(encrypted_obj)
+
+
+class PGPEncryptedStream(object):
+    """
+    File-like object reading a file while it is encrypted by gpg
+
+    The input file is written to gpg by a dedicated thread so that the
+    encrypted output could be read concurrently without buffering it.
+    """
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, pgpctx, input_file):
+        # The context is referenced to keep the keyring until the end
+        self.pgpctx = pgpctx
+        self.input_file = input_file
+        self.error = None
+
+        args = pgpctx.gnupg.make_args(['--encrypt', '--recipient', pgpctx.fingerprint], False)
+
+        self.process = subprocess.Popen(args,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+
+        self.writer = threading.Thread(target=self.write_input)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def write_input(self):
+        try:
+            while True:
+                data = self.input_file.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+
+                self.process.stdin.write(data)
+        except Exception as excep:
+            self.error = excep
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+            self.input_file.close()
+
+    def read(self, size=-1):
+        data = self.process.stdout.read(size)
+        if data or size == 0:
+            return data
+
+        self.writer.join()
+
+        if self.error is not None or self.process.wait() != 0:
+            raise errors.InputValidationError
+
+        return b''
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+        self.process.stdout.close()
+        self.process.wait()
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import fcntl
 import os
 
 from cryptography.hazmat.backends import default_backend
@@ -10,6 +11,16 @@ crypto_backend = default_backend()
 
 
 class SecureTemporaryFile(object):
+    """
+    File encrypted with an ephemeral key
+
+    The object could be pickled, as by the shared state backend, so that the
+    processes serving the site could continue and read the same file; for
+    this reason the file is not removed with the object but by remove().
+
+    The data is encrypted in CTR mode so that it could be written at any
+    offset, as the chunks of an upload that could be received in any order.
+    """
     def __init__(self, filesdir):
         """
         Create the AES Key to encrypt the uploaded file and initialize the cipher
@@ -21,27 +32,78 @@ class SecureTemporaryFile(object):
         self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
         self.filepath = os.path.join(filesdir, self.key_id)
         self.size = 0
-        self.enc = self.cipher.encryptor()
+        self.chunks = set()
+        self.enc = None
+        self.enc_offset = None
+        self.dec = None
+
+    def __getstate__(self):
+        return {
+            'key': self.key,
+            'key_id': self.key_id,
+            'key_counter_nonce': self.key_counter_nonce,
+            'filepath': self.filepath,
+            'size': self.size,
+            'chunks': self.chunks
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fd = None
+        self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
+        self.enc = None
+        self.enc_offset = None
         self.dec = None
 
+    def get_encryptor(self, offset):
+        """
+        Return an encryptor positioned on the keystream at the given offset
+        """
+        if self.enc is None or self.enc_offset != offset:
+            counter = (int.from_bytes(self.key_counter_nonce, 'big') + offset // 16) % 2 ** 128
+            self.enc = Cipher(algorithms.AES(self.key), modes.CTR(counter.to_bytes(16, 'big')), backend=crypto_backend).encryptor()
+            self.enc.update(b'\0' * (offset % 16))
+
+        return self.enc
+
+    def lock(self):
+        """
+        Lock the file for exclusive access by the processes serving the site
+
+        :return: A file object holding the lock until it is closed
+        """
+        lock = os.fdopen(os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
     def open(self, mode):
         if mode == 'w':
-            self.fd = open(self.filepath, 'ab+')
+            self.fd = os.fdopen(os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
         else:
             self.fd = open(self.filepath, 'rb')
             self.dec = self.cipher.decryptor()
 
         return self
 
-    def write(self, data):
+    def write(self, data, offset=None):
+        """
+        Write data at an offset of the file, by default at its end
+        """
         if isinstance(data, str):
             data = data.encode()
 
-        self.fd.write(self.enc.update(data))
-        self.size += len(data)
+        if offset is None:
+            offset = self.size
+
+        enc = self.get_encryptor(offset)
+
+        self.fd.seek(offset)
+        self.fd.write(enc.update(data))
+        self.enc_offset = offset + len(data)
+        self.size = max(self.size, self.enc_offset)
 
     def finalize_write(self):
-        self.fd.write(self.enc.finalize())
+        self.fd.flush()
 
     def read(self, c=None):
         if c is None:
@@ -59,6 +121,17 @@ class SecureTemporaryFile(object):
             self.fd.close()
             self.fd = None
 
+    def remove(self):
+        self.close()
+
+        try:
+            os.remove(self.filepath)
+        except:
+            pass
+
+    def expireCallback(self):
+        self.remove()
+
     def __enter__(self):
         return self
 
@@ -68,7 +141,37 @@ class SecureTemporaryFile(object):
     def __del__(self):
         self.close()
 
-        try:
-            os.remove(self.filepath)
-        except:
-            pass
+
+def write_chunk(files, file_id, data, offset, number, total):
+    """
+    Write a chunk of an upload kept in a TempDict of SecureTemporaryFiles
+
+    The chunks could be received in any order and concurrently by different
+    processes; each one is written at its offset holding the lock of the
+    file, while the state of the file is reloaded and saved back.
+
+    :param files: The TempDict holding the file
+    :param file_id: The ID of the upload
+    :param data: The content of the chunk
+    :param offset: The offset of the chunk in the file
+    :param number: The number of the chunk, starting from 1
+    :param total: The total number of chunks of the file
+    :return: The file if the chunk is new and completes it, None otherwise
+    """
+    f = files.get(file_id)
+    if f is None:
+        return None
+
+    with f.lock():
+        f = files.get(file_id)
+        if f is None or number in f.chunks:
+            return None
+
+        with f.open('w'):
+            f.write(data, offset)
+
+        f.chunks.add(number)
+        files.save(file_id, f)
+
+    if len(f.chunks) == total:
+        return f
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+# Implementation of a TempDict backend shared by multiple processes
+import copy
+import io
+import json
+import pickle
+import sqlite3
+import threading
+
+from globaleaks.rest.cache import ALL_DEPENDENCIES
+from globaleaks.utils.tempdict import ExpireCall
+
+# Classes that could be loaded from the shared store
+SAFE_CLASSES = {
+    ('builtins', 'bytes'),
+    ('builtins', 'dict'),
+    ('builtins', 'list'),
+    ('builtins', 'set'),
+    ('datetime', 'datetime'),
+    ('globaleaks.sessions', 'Session'),
+    ('globaleaks.state', 'RateLimitingStatus'),
+    ('globaleaks.state', 'UsedToken'),
+    ('globaleaks.utils.securetempfile', 'SecureTemporaryFile'),
+    ('globaleaks.utils.token', 'Token'),
+    ('nacl.utils', 'EncryptedMessage')
+}
+
+
+class SafeUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in SAFE_CLASSES:
+            raise pickle.UnpicklingError("Forbidden class %s.%s" % (module, name))
+
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+def dumps(value):
+    # The expiration handle is bound to the process and is never stored
+    value = copy.copy(value)
+    value.expireCall = None
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    return SafeUnpickler(io.BytesIO(data)).load()
+
+
+class SQLiteStore(object):
+    """
+    SQLite database in WAL mode used to share the state among processes
+
+    The database is expected to be created on a memory backed filesystem
+    (Settings.ramdisk_path) so that the state is not persisted across reboots.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entry ('
+                          'namespace TEXT NOT NULL, key NOT NULL, value BLOB NOT NULL, expire REAL NOT NULL, '
+                          'PRIMARY KEY (namespace, key))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entry_tag ('
+                          'namespace TEXT NOT NULL, tag TEXT NOT NULL, key NOT NULL, '
+                          'PRIMARY KEY (namespace, tag, key))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entry_expire ON entry (namespace, expire)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entry_tag_key ON entry_tag (namespace, key)')
+
+    def execute(self, query, args=()):
+        with self.lock:
+            return self.conn.execute(query, args).fetchall()
+
+    def transaction(self, function, *args):
+        """
+        Execute a function in a write transaction holding the database lock
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = function(self.conn, *args)
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+
+            self.conn.execute('COMMIT')
+            return result
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _set(conn, namespace, key, value, expire, tags):
+    conn.execute('INSERT OR REPLACE INTO entry (namespace, key, value, expire) VALUES (?, ?, ?, ?)',
+                 (namespace, key, value, expire))
+    _tag(conn, namespace, key, tags)
+
+
+def _add(conn, namespace, key, value, expire, now, tags):
+    row = conn.execute('SELECT value, expire FROM entry WHERE namespace = ? AND key = ? AND expire > ?',
+                       (namespace, key, now)).fetchone()
+    if row is not None:
+        return row
+
+    _set(conn, namespace, key, value, expire, tags)
+
+
+def _save(conn, namespace, key, value, now, tags):
+    if conn.execute('UPDATE entry SET value = ? WHERE namespace = ? AND key = ? AND expire > ?',
+                    (value, namespace, key, now)).rowcount:
+        _tag(conn, namespace, key, tags)
+
+
+def _tag(conn, namespace, key, tags):
+    conn.execute('DELETE FROM entry_tag WHERE namespace = ? AND key = ?', (namespace, key))
+    conn.executemany('INSERT INTO entry_tag (namespace, tag, key) VALUES (?, ?, ?)',
+                     [(namespace, tag, key) for tag in tags])
+
+
+def _pop(conn, namespace, key, now):
+    row = conn.execute('SELECT value, expire FROM entry WHERE namespace = ? AND key = ?',
+                       (namespace, key)).fetchone()
+    if row is None:
+        return
+
+    conn.execute('DELETE FROM entry WHERE namespace = ? AND key = ?', (namespace, key))
+    conn.execute('DELETE FROM entry_tag WHERE namespace = ? AND key = ?', (namespace, key))
+
+    if row[1] > now:
+        return row
+
+
+def _clear(conn, namespace):
+    conn.execute('DELETE FROM entry WHERE namespace = ?', (namespace,))
+    conn.execute('DELETE FROM entry_tag WHERE namespace = ?', (namespace,))
+
+
+def _expire(conn, namespace, now):
+    count = conn.execute('DELETE FROM entry WHERE namespace = ? AND expire <= ?', (namespace, now)).rowcount
+    conn.execute('DELETE FROM entry_tag WHERE namespace = ? AND key NOT IN '
+                 '(SELECT key FROM entry WHERE namespace = ?)', (namespace, namespace))
+    return count
+
+
+class SharedBackend(object):
+    """
+    TempDict backend storing the entries on a SQLiteStore
+
+    Each TempDict uses its own namespace in the store. Expired entries are
+    filtered out on read and periodically removed; as the removal may happen
+    in any process, expireCallback is not supported.
+    """
+    cleanup_interval = 60
+
+    def __init__(self, tempdict, store, namespace):
+        self.tempdict = tempdict
+        self.store = store
+        self.namespace = namespace
+        self.cleanup_call = None
+        self.expired = 0
+
+    def _now(self):
+        return self.tempdict.reactor.seconds()
+
+    def _load(self, key, data, expire):
+        value = loads(data)
+        value.expireCall = ExpireCall(self, key, expire)
+        return value
+
+    def _schedule_cleanup(self):
+        if self.cleanup_call is None or not self.cleanup_call.active():
+            self.cleanup_call = self.tempdict.reactor.callLater(self.cleanup_interval, self._cleanup)
+
+    def _cleanup(self):
+        self.cleanup_call = None
+        self.expired += self.store.transaction(_expire, self.namespace, self._now())
+        if self.size():
+            self._schedule_cleanup()
+
+    def set(self, key, value, timeout, tags=()):
+        expire = self._now() + timeout
+        self.store.transaction(_set, self.namespace, key, dumps(value), expire, tags)
+        value.expireCall = ExpireCall(self, key, expire)
+        self._schedule_cleanup()
+
+    def add(self, key, value, timeout, tags=()):
+        expire = self._now() + timeout
+        row = self.store.transaction(_add, self.namespace, key, dumps(value), expire, self._now(), tags)
+        if row is not None:
+            return self._load(key, *row)
+
+        value.expireCall = ExpireCall(self, key, expire)
+        self._schedule_cleanup()
+        return value
+
+    def save(self, key, value, tags=()):
+        self.store.transaction(_save, self.namespace, key, dumps(value), self._now(), tags)
+
+    def touch(self, key, timeout):
+        self.store.execute('UPDATE entry SET expire = ? WHERE namespace = ? AND key = ?',
+                           (self._now() + timeout, self.namespace, key))
+
+    def get(self, key):
+        rows = self.store.execute('SELECT value, expire FROM entry WHERE namespace = ? AND key = ? AND expire > ?',
+                                  (self.namespace, key, self._now()))
+        if rows:
+            return self._load(key, *rows[0])
+
+    def pop(self, key):
+        row = self.store.transaction(_pop, self.namespace, key, self._now())
+        if row is not None:
+            return self._load(key, *row)
+
+    def keys_by_tag(self, tag):
+        return [row[0] for row in self.store.execute('SELECT t.key FROM entry_tag t JOIN entry e '
+                                                     'ON e.namespace = t.namespace AND e.key = t.key '
+                                                     'WHERE t.namespace = ? AND t.tag = ? AND e.expire > ?',
+                                                     (self.namespace, tag, self._now()))]
+
+    def contains(self, key):
+        return bool(self.store.execute('SELECT 1 FROM entry WHERE namespace = ? AND key = ? AND expire > ?',
+                                       (self.namespace, key, self._now())))
+
+    def size(self):
+        return self.store.execute('SELECT count(*) FROM entry WHERE namespace = ? AND expire > ?',
+                                  (self.namespace, self._now()))[0][0]
+
+    def items(self):
+        return [(key, self._load(key, data, expire))
+                for key, data, expire in self.store.execute('SELECT key, value, expire FROM entry '
+                                                            'WHERE namespace = ? AND expire > ?',
+                                                            (self.namespace, self._now()))]
+
+    def clear(self):
+        self.store.transaction(_clear, self.namespace)
+
+    def stats(self):
+        return {
+            'backend': 'shared',
+            'size': self.size(),
+            'max_size': 0,
+            'expired': self.expired
+        }
+
+
+def _bump(conn, tid, dependencies):
+    conn.execute('INSERT OR IGNORE INTO cache_generation (tid, dependency, value) VALUES (0, ?, 0)',
+                 (ALL_DEPENDENCIES,))
+    conn.execute('UPDATE cache_generation SET value = value + 1 WHERE tid = 0')
+    sequence = conn.execute('SELECT value FROM cache_generation WHERE tid = 0').fetchone()[0]
+    conn.executemany('INSERT OR REPLACE INTO cache_generation (tid, dependency, value) VALUES (?, ?, ?)',
+                     [(tid, dependency, sequence) for dependency in dependencies])
+    return sequence
+
+
+class SharedGenerations(object):
+    """
+    Generation counters of the cached data of the tenants kept on a SQLiteStore
+
+    The row of tid 0 keeps the last number of the sequence so that checking
+    for changes requires a single lookup.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.store.execute('CREATE TABLE IF NOT EXISTS cache_generation ('
+                           'tid INTEGER NOT NULL, dependency TEXT NOT NULL, value INTEGER NOT NULL, '
+                           'PRIMARY KEY (tid, dependency))')
+
+    def bump(self, tid, dependencies=None):
+        return self.store.transaction(_bump, tid, dependencies or (ALL_DEPENDENCIES,))
+
+    def get_sequence(self):
+        rows = self.store.execute('SELECT value FROM cache_generation WHERE tid = 0')
+        return rows[0][0] if rows else 0
+
+    def changed_since(self, sequence):
+        return self.store.execute('SELECT tid, dependency FROM cache_generation WHERE tid != 0 AND value > ? '
+                                  'ORDER BY tid, dependency', (sequence,))
+
+
+class SharedJobsStatus(object):
+    """
+    Status of the scheduled jobs kept on a SQLiteStore
+
+    The jobs run only in the main process that publishes their timings and
+    metrics so that they could be served by any process.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.store.execute('CREATE TABLE IF NOT EXISTS jobs_status ('
+                           'id INTEGER PRIMARY KEY, value TEXT NOT NULL)')
+
+    def set(self, status):
+        self.store.execute('INSERT OR REPLACE INTO jobs_status (id, value) VALUES (0, ?)',
+                           (json.dumps(status),))
+
+    def get(self):
+        rows = self.store.execute('SELECT value FROM jobs_status WHERE id = 0')
+        return json.loads(rows[0][0]) if rows else []
+
+
+def use_shared_backend(tempdicts, path):
+    """
+    Move the specified TempDicts, a dictionary namespace -> TempDict, on a
+    store shared with the other processes using the same path
+    """
+    store = SQLiteStore(path)
+
+    for namespace, tempdict in tempdicts.items():
+        tempdict.set_backend(SharedBackend(tempdict, store, namespace))
+
+    return store
@@ -21,13 +21,17 @@ def listen_tls_on_sock(reactor, fd, contextFactory, factory):
     return port
 
 
-def open_socket_listen(ip, port):
+def open_socket_listen(ip, port, reuse_port=False):
     if abstract.isIPv6Address(ip):
         s = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
     else:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    if reuse_port:
+        # Let the kernel balance the connections among the sockets bound by the workers
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     s.setblocking(False)
 
     flags = fcntl.fcntl(s, fcntl.F_GETFD)
@@ -39,9 +43,9 @@ def open_socket_listen(ip, port):
     return s
 
 
-def reserve_tcp_socket(ip, port):
+def reserve_tcp_socket(ip, port, reuse_port=False):
     try:
-        sock = open_socket_listen(ip, port)
+        sock = open_socket_listen(ip, port, reuse_port)
         return [sock, None]
     except Exception as err:
         return [None, err]
@@ -1,42 +1,331 @@
 # -*- coding: utf-8 -*-
+import heapq
+import math
+
 from twisted.internet import reactor
 
 
-class TempDict(dict):
+class ExpireCall(object):
+    """
+    Handle of the expiration of an entry of a TempDict
+
+    The handle exposes the subset of the IDelayedCall interface used on the
+    values of the dictionary (getTime, reset, active) without scheduling any
+    call on the reactor.
+    """
+    __slots__ = ('backend', 'key', 'slot', 'time')
+
+    def __init__(self, backend, key, time=0):
+        self.backend = backend
+        self.key = key
+        self.slot = None
+        self.time = time
+
+    def getTime(self):
+        return self.time
+
+    def reset(self, timeout):
+        self.backend.touch(self.key, timeout)
+
+    def active(self):
+        return self.time > self.backend.tempdict.reactor.seconds()
+
+
+class MemoryBackend(object):
+    """
+    In-process storage of the entries of a TempDict
+
+    Entries are grouped in buckets of resolution seconds indexed by a heap on
+    their expiration time; a single periodic tick expires the buckets that
+    are due, so that insertion, timeout reset and expiration of an entry cost
+    at most O(log n) on the number of buckets, whatever the timeouts used.
+
+    When max_size is set the entries closest to the expiration, that is the
+    least recently inserted or accessed, are evicted to make room for new ones.
+    """
+    resolution = 1
+
+    def __init__(self, tempdict, max_size=0):
+        self.tempdict = tempdict
+        self.max_size = max_size
+        self.entries = {}
+        self.buckets = {}
+        self.slots = []
+        self.tags = {}
+        self.entry_tags = {}
+        self.tick_call = None
+        self.tick_reactor = None
+        self.expired = 0
+        self.evicted = 0
+        self.expirations_per_second = 0
+
+    def _schedule(self, expire_call, time):
+        self._unschedule(expire_call)
+
+        slot = int(math.ceil(time / self.resolution))
+
+        bucket = self.buckets.get(slot)
+        if bucket is None:
+            bucket = self.buckets[slot] = {}
+            heapq.heappush(self.slots, slot)
+
+        bucket[expire_call.key] = None
+        expire_call.slot = slot
+        expire_call.time = time
+
+        reactor = self.tempdict.reactor
+        if self.tick_call is None or self.tick_reactor is not reactor or not self.tick_call.active():
+            self.tick_reactor = reactor
+            self.tick_call = reactor.callLater(self.resolution, self._tick)
+
+    def _unschedule(self, expire_call):
+        if expire_call.slot is None:
+            return
+
+        bucket = self.buckets.get(expire_call.slot)
+        if bucket is not None:
+            bucket.pop(expire_call.key, None)
+            if not bucket:
+                del self.buckets[expire_call.slot]
+
+        expire_call.slot = None
+
+    def _tag(self, key, tags):
+        self._untag(key)
+
+        if tags:
+            self.entry_tags[key] = tags
+            for tag in tags:
+                self.tags.setdefault(tag, {})[key] = None
+
+    def _untag(self, key):
+        for tag in self.entry_tags.pop(key, ()):
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del self.tags[tag]
+
+    def _expire(self, key):
+        value = self.entries.pop(key, None)
+
+        if value is not None:
+            self._untag(key)
+            value.expireCall.slot = None
+            self.tempdict.on_expire(value)
+
+    def _tick(self):
+        self.tick_call = None
+
+        now = self.tempdict.reactor.seconds() / self.resolution
+
+        expired = 0
+        while self.slots and self.slots[0] <= now:
+            # The slots of the buckets emptied before their expiration are left in the heap
+            for key in list(self.buckets.pop(heapq.heappop(self.slots), ())):
+                self._expire(key)
+                expired += 1
+
+        self.expired += expired
+        self.expirations_per_second = (self.expirations_per_second * 0.7) + (expired / self.resolution * 0.3)
+
+        if self.buckets and self.tick_call is None:
+            self.tick_reactor = self.tempdict.reactor
+            self.tick_call = self.tick_reactor.callLater(self.resolution, self._tick)
+
+    def _first_bucket(self):
+        while self.slots[0] not in self.buckets:
+            heapq.heappop(self.slots)
+
+        return self.buckets[self.slots[0]]
+
+    def _evict(self):
+        while self.max_size and len(self.entries) >= self.max_size and self.buckets:
+            self._expire(next(iter(self._first_bucket())))
+            self.evicted += 1
+
+    def set(self, key, value, timeout, tags=()):
+        previous = self.entries.get(key)
+        if previous is not None:
+            self._unschedule(previous.expireCall)
+        else:
+            self._evict()
+
+        value.expireCall = ExpireCall(self, key)
+        self.entries[key] = value
+        self._tag(key, tags)
+        self.touch(key, timeout)
+
+    def add(self, key, value, timeout, tags=()):
+        previous = self.entries.get(key)
+        if previous is not None:
+            return previous
+
+        self.set(key, value, timeout, tags)
+        return value
+
+    def save(self, key, value, tags=()):
+        if self.entries.get(key) is value and self.entry_tags.get(key, ()) != tags:
+            self._tag(key, tags)
+
+    def touch(self, key, timeout):
+        value = self.entries.get(key)
+        if value is not None:
+            self._schedule(value.expireCall, self.tempdict.reactor.seconds() + timeout)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def pop(self, key):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self._untag(key)
+            self._unschedule(value.expireCall)
+
+        return value
+
+    def keys_by_tag(self, tag):
+        return list(self.tags.get(tag, ()))
+
+    def contains(self, key):
+        return key in self.entries
+
+    def size(self):
+        return len(self.entries)
+
+    def items(self):
+        return list(self.entries.items())
+
+    def clear(self):
+        for value in self.entries.values():
+            value.expireCall.slot = None
+
+        self.entries.clear()
+        self.buckets.clear()
+        del self.slots[:]
+        self.tags.clear()
+        self.entry_tags.clear()
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'buckets': len(self.buckets),
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'expirations_per_second': self.expirations_per_second
+        }
+
+
+class TempDict(object):
+    """
+    Dictionary whose entries expire after a timeout
+
+    The entries are kept by a pluggable backend: by default a MemoryBackend
+    local to the process; set_backend allows to replace it with a backend
+    shared by multiple processes (see globaleaks.utils.sharedstate).
+
+    Values stored in a shared backend are copies: changes applied to a value
+    after its insertion have to be written back with save().
+    """
     reactor = reactor
     reset_timeout_on_access = True
 
-    def __init__(self, timeout=300):
+    def __init__(self, timeout=300, max_size=0):
         self.timeout = timeout
-        dict.__init__(self)
+        self.max_size = max_size
+        self.backend = MemoryBackend(self, max_size)
+
+    def set_backend(self, backend):
+        self.backend.clear()
+        self.backend = backend
+
+    def get_tags(self, value):
+        """
+        Return the tags by which an entry could be looked up with keys_by_tag
+        """
+        return ()
+
+    def on_expire(self, value):
+        if hasattr(value, 'expireCallback') and value.expireCallback:
+            value.expireCallback()
 
     def __setitem__(self, key, value):
-        value.expireCall = self.reactor.callLater(self.timeout, self.__delitem__, key)
-        return dict.__setitem__(self, key, value)
+        self.backend.set(key, value, self.timeout, self.get_tags(value))
+
+    def setdefault(self, key, value):
+        """
+        Insert the value unless an entry exists for the key
+
+        :return: The value of the entry
+        """
+        return self.backend.add(key, value, self.timeout, self.get_tags(value))
+
+    def __getitem__(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            raise KeyError(key)
+
+        return value
 
     def __delitem__(self, key):
-        value = self.pop(key, None)
+        value = self.backend.pop(key)
 
         if value:
-            try:
-                value.expireCall.cancel()  # pylint: disable=no-member
-            except:
-                pass
+            self.on_expire(value)
+
+    def __contains__(self, key):
+        return self.backend.contains(key)
+
+    def __len__(self):
+        return self.backend.size()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [k for k, _ in self.backend.items()]
 
-            if hasattr(value, 'expireCallback') and value.expireCallback:
-                value.expireCallback()
+    def values(self):
+        return [v for _, v in self.backend.items()]
+
+    def items(self):
+        return self.backend.items()
+
+    def keys_by_tag(self, tag):
+        return self.backend.keys_by_tag(tag)
+
+    def pop(self, key, *args):
+        value = self.backend.pop(key)
+        if value is None:
+            if args:
+                return args[0]
+
+            raise KeyError(key)
+
+        return value
+
+    def save(self, key, value):
+        """
+        Write back the changes applied to the value of an existing entry
+        """
+        self.backend.save(key, value, self.get_tags(value))
+
+    def clear(self):
+        self.backend.clear()
 
     def reset_timeout(self, value):
         if value and value.expireCall is not None:
-            try:
-                value.expireCall.reset(self.timeout)
-            except:
-                pass
+            value.expireCall.reset(self.timeout)
 
     def get(self, key):
-        value = dict.get(self, key)
+        value = self.backend.get(key)
 
         if self.reset_timeout_on_access:
             self.reset_timeout(value)
 
         return value
+
+    def stats(self):
+        return self.backend.stats()
@@ -10,7 +10,7 @@ from datetime import datetime, timedelta
 
 from globaleaks import __version__
 from globaleaks.rest import errors
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import get_pgp_context
 from globaleaks.utils.sock import isIPAddress
 from globaleaks.utils.utility import \
     datetime_to_pretty_str, \
@@ -693,7 +693,7 @@ class Templating(object):
 
         if 'user' in data and data['user']['pgp_key_public']:
             try:
-                body = PGPContext(data['user']['pgp_key_public']).encrypt_message(body)
+                body = get_pgp_context(data['user']['pgp_key_public']).encrypt_message(body)
             except:
                 body = ""
 
@@ -14,6 +14,12 @@ class Token(object):
         self.session = None
         self.creation_date = datetime_now()
 
+    def __getstate__(self):
+        # The expiration handle is bound to the TempDict of the process holding the token
+        state = self.__dict__.copy()
+        state.pop('expireCall', None)
+        return state
+
     def serialize(self):
         return {
             'id': self.id.decode(),
@@ -7,27 +7,63 @@
 # that is initially derived from zipfile.py and then changed heavily for
 # our purpose (that's the reason why is not in third party)
 import binascii
+import mimetypes
 import os
 import struct
 import time
 import zlib
 
-from twisted.internet import abstract
-from twisted.internet.defer import Deferred
-
 from globaleaks.utils.crypto import GCE
 
 __all__ = ["ZipStream"]
 
 ZIP64_LIMIT = (1 << 31) - 1
+ZIP_STORED = 0
 ZIP_DEFLATED = 8
 
+# Size of the chunks read from the files
+CHUNK_SIZE = 8 * 1024
+
+# Size of the sample of each file used to estimate its compressibility
+SAMPLE_SIZE = 64 * 1024
+
+# Ratio between the compressed and the original size of a sample above
+# which a file is stored as it is
+COMPRESSION_THRESHOLD = 0.9
+
+# Types of the files that are already compressed
+COMPRESSED_MIMETYPES = {
+    'application/gzip',
+    'application/pdf',
+    'application/pgp-encrypted',
+    'application/x-7z-compressed',
+    'application/x-bzip2',
+    'application/x-rar-compressed',
+    'application/x-xz',
+    'application/zip',
+    'audio/aac',
+    'audio/mp4',
+    'audio/mpeg',
+    'audio/ogg',
+    'image/gif',
+    'image/heic',
+    'image/jpeg',
+    'image/png',
+    'image/webp'
+}
+
+COMPRESSED_MIMETYPE_PREFIXES = (
+    'application/vnd.oasis.opendocument.',
+    'application/vnd.openxmlformats-officedocument.',
+    'video/'
+)
+
 # Here are some struct module formats for reading headers
 structEndArchive = b"<4s4H2lH"     # 9 items, end of archive, 22 bytes
 stringEndArchive = b"PK\005\006"   # magic number for end of archive record
 structCentralDir = b"<4s4B4HLLL5HLl"  # 19 items, central directory, 46 bytes
 stringCentralDir = b"PK\001\002"   # magic number for central directory
-structFileHeader = b"<4s2B4HlLL2H"  # 12 items, file header record, 30 bytes
+structFileHeader = b"<4s2B4HLLL2H"  # 12 items, file header record, 30 bytes
 stringFileHeader = b"PK\003\004"   # magic number for file header
 structEndArchive64Locator = b"<4slql"  # 4 items, locate Zip64 header, 20 bytes
 stringEndArchive64Locator = b"PK\x06\x07"  # magic token for locator header
@@ -37,6 +73,33 @@ stringEndArchive64 = b"PK\x06\x06"  # magic token for Zip64 header
 stringDataDescriptor = b"PK\x07\x08"  # magic number for data descriptor
 
 
+def is_compressible(arcname, sample):
+    """
+    Tell if a file is worth being compressed
+
+    The files whose type is known to be compressed are stored as they are;
+    for the others the entropy of the content is estimated by compressing a
+    sample at the fastest level.
+
+    :param arcname: The name of the file
+    :param sample: The first bytes of the file
+    :return: A boolean
+    """
+    mimetype, encoding = mimetypes.guess_type(arcname)
+    if encoding is not None or mimetype in COMPRESSED_MIMETYPES or \
+            (mimetype or '').startswith(COMPRESSED_MIMETYPE_PREFIXES):
+        return False
+
+    return len(zlib.compress(sample, 1)) < len(sample) * COMPRESSION_THRESHOLD
+
+
+def is_seekable(fo):
+    try:
+        return fo.seekable()
+    except AttributeError:
+        return False
+
+
 class ZipInfo(object):
     """Class with attributes describing each file in the ZIP archive."""
 
@@ -142,12 +205,21 @@ class ZipInfo(object):
 
 
 class ZipStream(object):
+    """
+    Archive of a list of files produced on demand
+
+    The archive could be iterated or read as a file; in both cases the
+    files are read, decrypted and compressed only as the archive is consumed.
+    """
     def __init__(self, files):
         self.files = files
 
         self.filelist = []  # List of ZipInfo instances for archive
         self.data_ptr = 0   # Keep track of location inside archive
 
+        self.iterator = None
+        self.buffer = b''
+
         self.time = time.gmtime()[0:6]  # Security: Forced Time
 
     def update_data_ptr(self, data):
@@ -162,14 +234,25 @@ class ZipStream(object):
         self.data_ptr += len(data)
         return data
 
-    def zipinfo_open(self, arcname):
-        zinfo = ZipInfo(arcname, self.time, ZIP_DEFLATED)
+    def zipinfo_open(self, arcname, compression=ZIP_DEFLATED, crc=None, size=None):
+        zinfo = ZipInfo(arcname, self.time, compression)
         zinfo.header_offset = self.data_ptr
 
-        cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        cmpr = None
+        if compression == ZIP_DEFLATED:
+            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+        if crc is not None:
+            # The CRC and the size of a stored file are known in advance
+            # and are written in the header instead of a data descriptor
+            zinfo.flag_bits &= ~0x08
+            zinfo.CRC, zinfo.file_size, zinfo.compress_size = crc, size, size
 
         header = zinfo.FileHeader()
 
+        # The values are computed again while the file is written
+        zinfo.CRC = zinfo.file_size = zinfo.compress_size = 0
+
         self.update_data_ptr(header)
 
         self.filelist.append(zinfo)
@@ -180,7 +263,9 @@ class ZipStream(object):
         zinfo.file_size += len(chunk)
         zinfo.CRC = binascii.crc32(chunk, zinfo.CRC) & 0xffffffff
 
-        chunk = cmpr.compress(chunk)
+        if cmpr is not None:
+            chunk = cmpr.compress(chunk)
+
         zinfo.compress_size += len(chunk)
 
         self.update_data_ptr(chunk)
@@ -188,26 +273,53 @@ class ZipStream(object):
         return chunk
 
     def zipinfo_close(self, zinfo, cmpr):
-        buf = cmpr.flush()
-        zinfo.compress_size += len(buf)
-        self.update_data_ptr(buf)
+        buf = b''
+        if cmpr is not None:
+            buf = cmpr.flush()
+            zinfo.compress_size += len(buf)
+            self.update_data_ptr(buf)
 
-        trailer = zinfo.DataDescriptor()
-        self.update_data_ptr(trailer)
+        trailer = b''
+        if zinfo.flag_bits & 0x08:
+            trailer = zinfo.DataDescriptor()
+            self.update_data_ptr(trailer)
 
         return buf + trailer
 
     def zip_fo(self, fo, arcname):
-        zipinfo, cmpr, header = self.zipinfo_open(arcname)
+        """
+        Add a file to the archive
 
-        yield header
+        Files that would not shrink are stored; when the file is seekable
+        its CRC is computed with a first read so that the archive does not
+        rely on data descriptors for them.
+        """
+        seekable = is_seekable(fo)
+        if seekable:
+            start = fo.tell()
 
-        while True:
-             buf = fo.read(8 * 1024)
-             if not buf:
-               break
+        sample = fo.read(SAMPLE_SIZE)
 
-             yield self.zipinfo_update(zipinfo, cmpr, buf)
+        compression, crc, size = ZIP_DEFLATED, None, None
+
+        if not is_compressible(arcname, sample):
+            compression = ZIP_STORED
+
+            if seekable:
+                crc, size = binascii.crc32(sample), len(sample)
+                for buf in iter(lambda: fo.read(CHUNK_SIZE), b''):
+                    crc, size = binascii.crc32(buf, crc), size + len(buf)
+
+                fo.seek(start + len(sample))
+
+        zipinfo, cmpr, header = self.zipinfo_open(arcname, compression, crc, size)
+
+        yield header
+
+        buf = sample
+        while buf:
+            yield self.zipinfo_update(zipinfo, cmpr, buf)
+            buf = fo.read(CHUNK_SIZE)
 
         yield self.zipinfo_close(zipinfo, cmpr)
 
@@ -314,49 +426,46 @@ class ZipStream(object):
                     with open(f['path'], "rb") as fo:
                         for data in self.zip_fo(fo, f['name']):
                             yield data
-            except:
+            except Exception:
                 pass
 
         yield self.archive_footer()
 
+    def read(self, size=-1):
+        """
+        Read the archive as a file
+
+        :param size: The number of bytes to be read or -1 to read until the end
+        :return: The bytes read or b'' at the end of the archive
+        """
+        if self.iterator is None:
+            self.iterator = iter(self)
+
+        chunks = [self.buffer]
+        length = len(self.buffer)
 
-class ZipStreamProducer(object):
-    """Streaming producter for ZipStream"""
+        while size < 0 or length < size:
+            data = next(self.iterator, None)
+            if data is None:
+                break
 
-    def __init__(self, handler, zipstreamObject):
-        self.finish = Deferred()
-        self.handler = handler
-        self.zipstreamObject = zipstreamObject
+            chunks.append(data)
+            length += len(data)
 
-    def start(self):
-        self.handler.request.registerProducer(self, False)
-        return self.finish
+        data = b''.join(chunks)
 
-    def resumeProducing(self):
-        if not self.handler:
-            return
+        if size < 0:
+            self.buffer = b''
+            return data
 
-        data = self.zip_chunk()
-        if data:
-            self.handler.request.write(data)
-        else:
-            self.stopProducing()
-
-    def stopProducing(self):
-        self.handler.request.unregisterProducer()
-        self.handler.request.finish()
-        self.handler = None
-        self.finish.callback(None)
-
-    def zip_chunk(self):
-        chunk = []
-        chunk_size = 0
-
-        for data in self.zipstreamObject:
-            if data:
-                chunk_size += len(data)
-                chunk.append(data)
-                if chunk_size >= abstract.FileDescriptor.bufferSize:
-                    return b''.join(chunk)
-
-        return b''.join(chunk)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        """
+        Stop the production of the archive closing the files being read
+        """
+        if self.iterator is not None:
+            self.iterator.close()
+
+        self.buffer = b''
@@ -0,0 +1,260 @@
+# -*- coding: utf-8
+#   workers
+#   *******
+#
+# Implementation of the processes serving the API in parallel to the main one.
+#
+# The main process spawns the workers passing them the listening sockets,
+# sends them its settings as the first message of the control channel and
+# runs alone the scheduled jobs; each process notifies the changes of its state
+# to the main process that applies and relays them to the other workers.
+# The invalidation of the cached data of the tenants is instead tracked by
+# the generation counters kept on the shared state store.
+import json
+import os
+import sys
+from optparse import OptionParser
+
+from twisted.internet import defer, error, protocol, reactor, stdio
+from twisted.protocols.basic import LineReceiver
+from twisted.python.log import addObserver
+
+from globaleaks.db import sync_initialize_snimap, sync_refresh_tenant_cache
+from globaleaks.rest.cache import Cache
+from globaleaks.rest.site import get_api_factory
+from globaleaks.settings import Settings
+from globaleaks.state import State
+from globaleaks.utils.log import log, openLogFile, LogObserver
+from globaleaks.utils.sock import listen_tcp_on_sock, listen_tls_on_sock
+
+# File descriptors of the control channel and of the sockets in the workers
+CONTROL_IN_FD = 3
+CONTROL_OUT_FD = 4
+FIRST_SOCKET_FD = 5
+
+
+def handle_message(message):
+    """
+    Apply a change of the state notified by another process
+
+    :param message: A dictionary describing the change
+    """
+    message_type = message.get('type')
+
+    if message_type == 'accept_submissions':
+        Cache.invalidate()
+        State.accept_submissions = message['value']
+
+    elif message_type == 'tor_exit_set':
+        State.tor_exit_set.clear()
+        for ip in message['ips']:
+            State.tor_exit_set.add(ip)
+
+
+class WorkerProtocol(protocol.ProcessProtocol):
+    """
+    Control channel of the main process with a worker
+    """
+    def __init__(self, pool, worker_id):
+        self.pool = pool
+        self.worker_id = worker_id
+        self.buffer = b''
+        self.ended = defer.Deferred()
+
+    def childDataReceived(self, childFD, data):
+        if childFD != CONTROL_OUT_FD:
+            return
+
+        self.buffer += data
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            self.pool.dispatch(message, self)
+
+    def send(self, message):
+        self.transport.writeToChild(CONTROL_IN_FD, json.dumps(message).encode() + b'\n')
+
+    def processEnded(self, reason):
+        self.pool.worker_ended(self)
+        self.ended.callback(None)
+
+
+class WorkerPool(object):
+    """
+    Pool of the processes serving the API in parallel to the main one
+    """
+    restart_delay = 1
+
+    def __init__(self, workers_socks):
+        self.workers_socks = workers_socks
+        self.workers = {}
+        self.shutdown = False
+
+    def spawn(self, worker_id):
+        if self.shutdown:
+            return
+
+        http_socks, https_socks = self.workers_socks[worker_id - 1]
+
+        args = [sys.executable, '-m', 'globaleaks.workers',
+                '--worker-id', str(worker_id)]
+
+        child_fds = {0: 0, 1: 1, 2: 2, CONTROL_IN_FD: 'w', CONTROL_OUT_FD: 'r'}
+
+        fd = FIRST_SOCKET_FD
+        for option, socks in (('--http-fd', http_socks), ('--https-fd', https_socks)):
+            for sock in socks:
+                child_fds[fd] = sock.fileno()
+                args += [option, str(fd)]
+                fd += 1
+
+        worker = WorkerProtocol(self, worker_id)
+        reactor.spawnProcess(worker, sys.executable, args,
+                             env=os.environ, path=Settings.src_path, childFDs=child_fds)
+
+        self.workers[worker_id] = worker
+
+        # The settings are not passed on the command line that is visible to
+        # the other processes of the system
+        worker.send({'type': 'settings', 'settings': Settings.serialize()})
+
+        # Align the new worker to the state maintained by the jobs of the main process
+        worker.send({'type': 'accept_submissions', 'value': State.accept_submissions})
+        worker.send({'type': 'tor_exit_set', 'ips': list(State.tor_exit_set)})
+
+    def start(self):
+        for worker_id in range(1, len(self.workers_socks) + 1):
+            self.spawn(worker_id)
+
+    def worker_ended(self, worker):
+        if self.workers.get(worker.worker_id) is worker:
+            del self.workers[worker.worker_id]
+
+        if not self.shutdown:
+            log.err("Worker %d exited unexpectedly; restarting it", worker.worker_id)
+            reactor.callLater(self.restart_delay, self.spawn, worker.worker_id)
+
+    def dispatch(self, message, origin):
+        handle_message(message)
+        self.broadcast(message, origin)
+
+    def broadcast(self, message, origin=None):
+        for worker in list(self.workers.values()):
+            if worker is not origin:
+                worker.send(message)
+
+    def stop(self):
+        self.shutdown = True
+
+        deferreds = []
+        for worker in list(self.workers.values()):
+            deferreds.append(worker.ended)
+            try:
+                worker.transport.signalProcess('TERM')
+            except error.ProcessExitedAlready:
+                pass
+
+        return defer.DeferredList(deferreds)
+
+
+class ControlProtocol(LineReceiver):
+    """
+    Control channel of a worker with the main process
+    """
+    delimiter = b'\n'
+    MAX_LENGTH = 1 << 20
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def lineReceived(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+
+        if message.get('type') == 'settings':
+            self.worker.setup(message['settings'])
+        else:
+            handle_message(message)
+
+    def broadcast(self, message):
+        self.sendLine(json.dumps(message).encode())
+
+    def connectionLost(self, reason):
+        # The main process exited
+        if reactor.running:
+            reactor.stop()
+
+
+class Worker(object):
+    def __init__(self, worker_id, http_fds, https_fds):
+        self.worker_id = worker_id
+        self.http_fds = http_fds
+        self.https_fds = https_fds
+
+    def start(self):
+        State.workers = ControlProtocol(self)
+        stdio.StandardIO(State.workers, stdin=CONTROL_IN_FD, stdout=CONTROL_OUT_FD)
+
+    def setup(self, settings):
+        """
+        Initialize the worker with the settings sent by the main process
+        and start serving the API
+
+        :param settings: The settings of the main process
+        """
+        Settings.load(settings)
+        Settings.worker_id = self.worker_id
+        Settings.state_backend = 'shared'
+
+        State.init_environment()
+
+        addObserver(LogObserver(openLogFile(Settings.logfile, Settings.log_file_size, Settings.num_log_files)).emit)
+
+        sync_refresh_tenant_cache()
+        sync_initialize_snimap()
+        State.orm_tp.start()
+        State.kdf_tp.start()
+        State.file_tp.start()
+
+        api_factory = get_api_factory()
+
+        for fd in self.http_fds:
+            listen_tcp_on_sock(reactor, fd, api_factory)
+
+        for fd in self.https_fds:
+            listen_tls_on_sock(reactor,
+                               fd=fd,
+                               contextFactory=State.snimap,
+                               factory=api_factory)
+
+    def stop(self):
+        State.orm_tp.stop()
+        State.kdf_tp.stop()
+        State.file_tp.stop()
+
+
+def main():
+    # this import seems unused but it is required in order to load the mocks
+    import globaleaks.mocks.twisted_mocks  # pylint: disable=W0611
+
+    parser = OptionParser()
+    parser.add_option("--worker-id", type="int", dest="worker_id", default=1)
+    parser.add_option("--http-fd", type="int", action='append', dest="http_fds", default=[])
+    parser.add_option("--https-fd", type="int", action='append', dest="https_fds", default=[])
+
+    (options, args) = parser.parse_args()
+
+    worker = Worker(options.worker_id, options.http_fds, options.https_fds)
+    reactor.callWhenRunning(worker.start)
+    reactor.addSystemEventTrigger('before', 'shutdown', worker.stop)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
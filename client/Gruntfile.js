@@ -1,6 +1,7 @@
 module.exports = function(grunt) {
   let fs = require("fs"),
       path = require("path"),
+      zlib = require("zlib"),
       superagent = require("superagent"),
       Gettext = require("node-gettext");
 
@@ -916,14 +917,32 @@ module.exports = function(grunt) {
     }
   });
 
+  // Store the gzip and brotli variants of the compressible files served by the backend
+  grunt.registerTask("precompress", function() {
+    grunt.file.expand({cwd: "build", filter: "isFile"}, ["**/*.{css,html,js,json,svg,txt}"]).forEach(function(filename) {
+      let filepath = path.join("build", filename),
+          data = fs.readFileSync(filepath),
+          variants = {
+            ".br": zlib.brotliCompressSync(data, {params: {[zlib.constants.BROTLI_PARAM_QUALITY]: 11}}),
+            ".gz": zlib.gzipSync(data, {level: 9})
+          };
+
+      for (const extension in variants) {
+        if (variants[extension].length < data.length) {
+          fs.writeFileSync(filepath + extension, variants[extension]);
+        }
+      }
+    });
+  });
+
   // Run this task to push translations on transifex
   grunt.registerTask("pushTranslationsSource", ["confirm", "☠☠☠pushTranslationsSource☠☠☠"]);
 
   // Run this task to fetch translations from transifex and create application files
   grunt.registerTask("updateTranslations", ["fetchTranslations", "makeAppData", "verifyAppData"]);
 
-  grunt.registerTask("build", ["clean", "shell:npx_build", "copy:build", "string-replace", "copy:package", "clean:tmp"]);
+  grunt.registerTask("build", ["clean", "shell:npx_build", "copy:build", "string-replace", "copy:package", "precompress", "clean:tmp"]);
  
-  grunt.registerTask("build_and_instrument", ["clean", "shell:npx_build_and_instrument", "copy:build", "string-replace", "copy:package", "clean:tmp"]);
+  grunt.registerTask("build_and_instrument", ["clean", "shell:npx_build_and_instrument", "copy:build", "string-replace", "copy:package", "precompress", "clean:tmp"]);
 };
 